@@ -1,26 +1,162 @@
+import time
+_import_start = time.perf_counter()
+
+import logging
+
+import torch
 from flask import Flask
 from .config import Config
 from .load_model import load_model_pt
+from .inference import BatchInferenceEngine, InferencePipeline
+from .debug_artifacts import DebugArtifactWriter
+from .model_utils.background import create_bg_remover
+from .model_utils.hardware import resolve_bf16
+from .timing import StageTimer
+from .session_store import create_session_store
+from .face_mesh_pool import FaceMeshPool
+from .frame_gate import MotionGate
+from .result_cache import ResultCache, model_identity
+from .jobs import JobManager, PriorityGate
+from .metrics import event_log, init_metrics
+from .profiling import init_profiler
+from .warmup import Warmup
+
+_import_seconds = time.perf_counter() - _import_start
+
 
 def create_app():
-    app = Flask(__name__, instance_relative_config=True)
+    timer = StageTimer()
+    timer.stages["imports"] = _import_seconds
+
+    with timer.stage("flask"):
+        app = Flask(__name__, instance_relative_config=True)
+        if not app.logger.level:
+            app.logger.setLevel(logging.INFO)
+
+        app.config.from_object(Config)
+        # JSON event log (predictions, PAD outcomes, ...), independent of /metrics
+        event_log.configure(app.config["LOG_LEVEL"].upper(), sample_rate=app.config["LOG_SAMPLE_RATE"])
 
-    app.config.from_object(Config)
+    preload = app.config["PRELOAD_MODEL"]
+    if preload:
+        # Loading in the gunicorn master: keep torch single-threaded so no
+        # OpenMP pool exists at fork time. post_fork sets per-worker threads.
+        torch.set_num_threads(1)
 
-    app.model = load_model_pt(
-        checkpoint_path=app.config["MODEL_PATH"],
-        device=app.config["DEVICE"],
-        num_classes=app.config["NUM_CLASSES"],
-    )
+    optimize = app.config["MODEL_OPTIMIZE"]
+    bf16 = optimize and resolve_bf16(app.config["MODEL_BF16"], app.config["DEVICE"])
+    model_variant = app.config["MODEL_BACKEND"] + ("+opt" if optimize else "") + ("+bf16" if bf16 else "")
+
+    model_timer = StageTimer()
+    with timer.stage("model"):
+        app.model = load_model_pt(
+            checkpoint_path=app.config["MODEL_PATH"],
+            device=app.config["DEVICE"],
+            num_classes=app.config["NUM_CLASSES"],
+            backend=app.config["MODEL_BACKEND"],
+            artifact_path=app.config["MODEL_ARTIFACTS"].get(app.config["MODEL_BACKEND"]),
+            timer=model_timer,
+            optimize=optimize,
+            bf16=bf16,
+        )
     app.device = app.config["DEVICE"]
 
-    from .routes.main import main_bp
-    app.register_blueprint(main_bp)
+    with timer.stage("services"):
+        app.engine = BatchInferenceEngine(
+            app.model,
+            device=app.device,
+            max_batch_size=app.config["BATCH_MAX_SIZE"],
+            max_wait_ms=app.config["BATCH_MAX_WAIT_MS"],
+            max_queue_size=app.config["INFERENCE_QUEUE_SIZE"],
+        )
+        app.pipeline = InferencePipeline(
+            app.engine,
+            workers=app.config["PREPROCESS_WORKERS"],
+            max_pending=app.config["PREPROCESS_QUEUE_SIZE"],
+        )
+        app.bg_remover = create_bg_remover(
+            app.config["BG_REMOVAL_BACKEND"],
+            max_side=app.config["BG_REMOVAL_MAX_SIDE"],
+            intra_op_threads=app.config["BG_REMOVAL_INTRA_OP_THREADS"],
+            inter_op_threads=app.config["BG_REMOVAL_INTER_OP_THREADS"],
+        )
+        app.result_cache = ResultCache(
+            model_identity(app.config["MODEL_PATH"],
+                           app.config["MODEL_ARTIFACTS"].get(app.config["MODEL_BACKEND"]),
+                           backend=model_variant),
+            max_entries=app.config["RESULT_CACHE_SIZE"],
+            ttl=app.config["RESULT_CACHE_TTL"],
+            tensor_entries=app.config["TENSOR_CACHE_SIZE"],
+        )
+        app.pad_sessions = create_session_store(
+            app.config["PAD_SESSION_BACKEND"],
+            ttl=app.config["PAD_SESSION_TTL"],
+            max_sessions=app.config["PAD_SESSION_MAX"],
+            redis_url=app.config["PAD_REDIS_URL"],
+        )
+        app.face_mesh_pool = FaceMeshPool(
+            max_instances=app.config["FACE_MESH_POOL_SIZE"],
+            idle_timeout=app.config["FACE_MESH_IDLE_TIMEOUT"],
+        )
+        app.pad_frame_gate = MotionGate(
+            threshold=app.config["PAD_MOTION_THRESHOLD"],
+            max_sessions=app.config["PAD_SESSION_MAX"],
+        )
+        app.priority_gate = PriorityGate(max_defer=app.config["JOB_MAX_DEFER_MS"] / 1000.0)
+        # A poll can reach any worker: only a shared store works with several
+        jobs_enabled = app.config["JOB_STORE_BACKEND"] == "redis" or app.config["WORKERS"] <= 1
+        if not jobs_enabled:
+            app.logger.warning("Async jobs disabled: %d workers need AEGIS_JOB_STORE_BACKEND=redis",
+                               app.config["WORKERS"])
+        app.jobs = JobManager(
+            workers=app.config["JOB_WORKERS"],
+            max_queued=app.config["JOB_QUEUE_SIZE"],
+            gate=app.priority_gate,
+            store=create_session_store(
+                app.config["JOB_STORE_BACKEND"],
+                ttl=app.config["JOB_TTL"],
+                max_sessions=app.config["PAD_SESSION_MAX"],
+                redis_url=app.config["JOB_REDIS_URL"],
+                prefix="aegis:job:",
+            ),
+            enabled=jobs_enabled,
+            callback_allowlist=app.config["JOB_CALLBACK_ALLOWLIST"],
+        )
+        app.debug_writer = DebugArtifactWriter(
+            app.config["DEBUG_ARTIFACT_DIR"],
+            enabled=app.config["DEBUG_ARTIFACTS"],
+            sample_rate=app.config["DEBUG_ARTIFACT_SAMPLE_RATE"],
+            max_files=app.config["DEBUG_ARTIFACT_MAX_FILES"],
+        )
+
+    with timer.stage("blueprints"):
+        from .routes.main import main_bp
+        app.register_blueprint(main_bp)
+
+        from .routes.model_routes import model_bp
+        app.register_blueprint(model_bp)
+
+        from .routes.pad_routes import pad_bp, register_pad_websocket
+        app.register_blueprint(pad_bp)  # 👈 now PAD is registered
+        if app.config["PAD_WEBSOCKET_ENABLED"]:
+            register_pad_websocket(app)
+
+        from .routes.ops_routes import ops_bp
+        app.register_blueprint(ops_bp)
+        init_profiler(app)
+        if app.config["METRICS_ENABLED"]:
+            init_metrics(app)
 
-    from .routes.model_routes import model_bp
-    app.register_blueprint(model_bp)
+    app.warmup = Warmup(app, iterations=app.config["WARMUP_ITERATIONS"])
+    if not app.config["WARMUP_ENABLED"]:
+        app.warmup.mark_ready()
+    elif not preload:
+        # Preloaded masters must stay thread-free; gunicorn's post_fork starts it per worker
+        app.warmup.start()
 
-    from .routes.pad_routes import pad_bp
-    app.register_blueprint(pad_bp)  # 👈 now PAD is registered
+    app.startup_timings = dict(timer.stages, **{f"model.{k}": v for k, v in model_timer.stages.items()})
+    app.logger.info("Startup: %s", timer.summary())
+    if model_timer.stages:
+        app.logger.info("Model load (%s): %s", model_variant, model_timer.summary())
 
     return app
@@ -0,0 +1,126 @@
+import os
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+import torch
+
+from app.config import Config
+from app.model_utils.background import get_default_bg_remover
+from app.model_utils.preprocess import BatchPreprocessor, crop_first, decode_image
+from app.result_cache import content_hash, pipeline_signature
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".webp")
+
+
+# ------------------------------
+# Input sources -> (name, bytes)
+# ------------------------------
+def is_image_name(name):
+    return name.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def iter_directory(path):
+    for root, _, files in os.walk(path):
+        for fname in sorted(files):
+            if is_image_name(fname):
+                fpath = os.path.join(root, fname)
+                with open(fpath, "rb") as f:
+                    yield os.path.relpath(fpath, path), f.read()
+
+
+def iter_zip(source):
+    """Yield images from a zip archive (path or file-like object)."""
+    with zipfile.ZipFile(source) as zf:
+        for info in zf.infolist():
+            if not info.is_dir() and is_image_name(info.filename):
+                yield info.filename, zf.read(info)
+
+
+def iter_paths(paths):
+    """Expand files, directories and zip archives into (name, bytes) pairs."""
+    for path in paths:
+        if os.path.isdir(path):
+            yield from iter_directory(path)
+        elif zipfile.is_zipfile(path):
+            yield from iter_zip(path)
+        else:
+            with open(path, "rb") as f:
+                yield path, f.read()
+
+
+def batched(iterable, n):
+    it = iter(iterable)
+    while True:
+        chunk = list(islice(it, n))
+        if not chunk:
+            return
+        yield chunk
+
+
+# ------------------------------
+# Batched prediction
+# ------------------------------
+def _prepare(item, bg_remover, order):
+    name, data = item
+    try:
+        img, _ = crop_first(decode_image(data), order)
+        return name, bg_remover.remove(img), None
+    except Exception as e:
+        return name, None, str(e)
+
+
+def predict_stream(items, run_batch, batch_size=16, order=None, workers=1, bg_remover=None,
+                   cache=None):
+    """Preprocess and predict (name, bytes) items in batches.
+
+    Decoding, the face crop (step 1) and background removal run per image on
+    a thread pool, the
+    pipeline runs batched through BatchPreprocessor, and ``run_batch`` takes
+    the resulting (N, 3, H, W) tensor and returns N ages (e.g.
+    ``BatchInferenceEngine.run_batch``). Yields one result dict per image in
+    input order; images that fail to decode or preprocess yield an error entry.
+    With a ResultCache, images already predicted are answered from it.
+    ``order`` defaults to the serving PREPROCESS_ORDER, so results match /predict.
+    """
+    if order is None:
+        order = Config.PREPROCESS_ORDER
+    bg_remover = bg_remover or get_default_bg_remover()
+    batch_preprocess = BatchPreprocessor([s for s in order if s != 1])
+    signature = pipeline_signature(order, bg_remover)
+    use_cache = cache is not None and cache.results.max_entries > 0
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for chunk in batched(items, batch_size):
+            ages, cached, digests = {}, set(), {}
+            if use_cache:
+                digests = dict(enumerate(pool.map(lambda item: content_hash(item[1]), chunk)))
+                for i, digest in digests.items():
+                    age = cache.get_age(digest, signature)
+                    if age is not None:
+                        ages[i] = age
+                        cached.add(i)
+
+            todo = [i for i in range(len(chunk)) if i not in cached]
+            prepared = dict(zip(todo, pool.map(lambda i: _prepare(chunk[i], bg_remover, order), todo)))
+            ok = [i for i in todo if prepared[i][2] is None]
+            if ok:
+                try:
+                    batch = batch_preprocess([prepared[i][1] for i in ok], pool=pool)
+                    for i, age in zip(ok, run_batch(torch.from_numpy(batch))):
+                        ages[i] = int(age)
+                        if use_cache:
+                            cache.put_age(digests[i], signature, ages[i])
+                except Exception as e:
+                    ages.update((i, e) for i in ok)
+
+            for i, (name, _) in enumerate(chunk):
+                err = prepared[i][2] if i in prepared else None
+                if err is None and isinstance(ages[i], Exception):
+                    err = str(ages[i])
+                if err is not None:
+                    yield {"name": name, "error": err}
+                elif i in cached:
+                    yield {"name": name, "predicted_age": ages[i], "cached": True}
+                else:
+                    yield {"name": name, "predicted_age": ages[i]}
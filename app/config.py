@@ -1,7 +1,20 @@
-
 import torch
 import os
-    
+
+
+def _int_list(value):
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def _env(name, default, cast=str):
+    """Read an override from the environment, falling back to the default."""
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    if cast is bool:
+        return value.strip().lower() in ("1", "true", "yes", "on")
+    return cast(value)
+
 
 class Config:
 
@@ -14,6 +27,122 @@ class Config:
     BASE_DIR = os.path.dirname(os.path.abspath(__file__))
     MODEL_PATH = os.path.join(BASE_DIR, "model_utils", "checkpoint_best.pth")
     UPLOAD_FOLDER = os.path.join(BASE_DIR, "static", "temp")
+
+    # Serving backend: "eager", "compile", "torchscript", "onnx" or "int8".
+    # Artifacts come from `python -m app.model_utils.export` / `... .quantize`.
+    MODEL_BACKEND = _env("AEGIS_MODEL_BACKEND", "eager")
+    MODEL_ARTIFACTS = {
+        "torchscript": os.path.join(BASE_DIR, "model_utils", "age_model.ts.pt"),
+        "onnx": os.path.join(BASE_DIR, "model_utils", "age_model.onnx"),
+        "int8": os.path.join(BASE_DIR, "model_utils", "age_model.int8.pt"),
+    }
+    # Eager/compile only: serve a fused-CBAM, channels_last graph with BN
+    # folded in; MODEL_BF16 ("auto", "on", "off") adds bf16 autocast, "auto"
+    # only on CPUs with native bf16. Check parity: python -m app.model_utils.parity
+    MODEL_OPTIMIZE = _env("AEGIS_MODEL_OPTIMIZE", False, bool)
+    MODEL_BF16 = _env("AEGIS_MODEL_BF16", "auto")
     PAD_MODE = 1  # 1 = Strict Gating, 2 = Always Available With Warning
-   
 
+    # PAD challenge sessions: "memory" (per-process LRU), "redis" (shared
+    # across workers/nodes, needs redis-py) or "local" (in-process Redis stand-in)
+    PAD_SESSION_BACKEND = _env("AEGIS_PAD_SESSION_BACKEND", "memory")
+    PAD_SESSION_TTL = _env("AEGIS_PAD_SESSION_TTL", 120, int)  # seconds since last frame
+    PAD_SESSION_MAX = _env("AEGIS_PAD_SESSION_MAX", 10000, int)
+    PAD_REDIS_URL = _env("AEGIS_PAD_REDIS_URL", "redis://localhost:6379/0")
+    FACE_MESH_POOL_SIZE = _env("AEGIS_FACE_MESH_POOL_SIZE", 8, int)  # FaceMesh instances per worker
+    FACE_MESH_IDLE_TIMEOUT = _env("AEGIS_FACE_MESH_IDLE_TIMEOUT", 60.0, float)  # seconds
+
+    # PAD frame transport: the client posts raw JPEG frames downscaled to
+    # PAD_FRAME_WIDTH every PAD_FRAME_INTERVAL_MS, or streams them over one
+    # WebSocket per session (/ws/pad, needs flask-sock) when enabled
+    PAD_FRAME_WIDTH = _env("AEGIS_PAD_FRAME_WIDTH", 320, int)
+    PAD_FRAME_INTERVAL_MS = _env("AEGIS_PAD_FRAME_INTERVAL_MS", 250, int)
+    PAD_FRAME_QUALITY = _env("AEGIS_PAD_FRAME_QUALITY", 0.7, float)
+    PAD_MAX_FRAME_BYTES = _env("AEGIS_PAD_MAX_FRAME_BYTES", 2 * 1024 * 1024, int)
+    PAD_WEBSOCKET_ENABLED = _env("AEGIS_PAD_WEBSOCKET_ENABLED", False, bool)
+
+    # process_frame pre-gate: frames are shrunk to PAD_MAX_FRAME_SIDE before
+    # FaceMesh, and frames whose 16x16 thumbnail differs from the session's
+    # last one by less than PAD_MOTION_THRESHOLD grey levels are skipped (0 = off)
+    PAD_MAX_FRAME_SIDE = _env("AEGIS_PAD_MAX_FRAME_SIDE", 480, int)
+    PAD_MOTION_THRESHOLD = _env("AEGIS_PAD_MOTION_THRESHOLD", 1.0, float)
+
+    # Gunicorn preload (set by gunicorn.conf.py): the model is loaded once in
+    # the master and forked workers share its weight pages copy-on-write
+    PRELOAD_MODEL = _env("AEGIS_PRELOAD", False, bool)
+    WORKERS = _env("AEGIS_WORKERS", 1, int)  # worker processes serving requests (also set by gunicorn.conf.py)
+
+    # Micro-batching inference engine
+    BATCHING_ENABLED = _env("AEGIS_BATCHING_ENABLED", True, bool)
+    BATCH_MAX_SIZE = _env("AEGIS_BATCH_MAX_SIZE", 8, int)
+    BATCH_MAX_WAIT_MS = _env("AEGIS_BATCH_MAX_WAIT_MS", 10.0, float)
+    INFERENCE_QUEUE_SIZE = _env("AEGIS_INFERENCE_QUEUE_SIZE", 64, int)  # 0 = unbounded
+
+    # Preprocessing thread pool feeding the engine (bounded, 503 when full)
+    PIPELINE_ENABLED = _env("AEGIS_PIPELINE_ENABLED", True, bool)
+    PREPROCESS_WORKERS = _env("AEGIS_PREPROCESS_WORKERS", 4, int)
+    PREPROCESS_QUEUE_SIZE = _env("AEGIS_PREPROCESS_QUEUE_SIZE", 32, int)
+    REQUEST_TIMEOUT_S = _env("AEGIS_REQUEST_TIMEOUT_S", 30.0, float)
+
+    # Bulk prediction (/predict_batch and predict_batch.py)
+    BULK_BATCH_SIZE = _env("AEGIS_BULK_BATCH_SIZE", 16, int)
+    BULK_MAX_BATCH_SIZE = _env("AEGIS_BULK_MAX_BATCH_SIZE", 64, int)
+    BULK_PREPROCESS_WORKERS = _env("AEGIS_BULK_PREPROCESS_WORKERS", 4, int)
+    BULK_ALLOW_LOCAL_PATHS = _env("AEGIS_BULK_ALLOW_LOCAL_PATHS", False, bool)
+
+    # Inference preprocessing steps (see PIPELINE_FUNCS): 1 = face crop, run
+    # before background removal. A PAD session finished within
+    # PAD_FACE_BOX_MAX_AGE seconds lends its face box to /predict.
+    PREPROCESS_ORDER = _env("AEGIS_PREPROCESS_ORDER", [1, 3, 4, 6, 9], _int_list)
+    PAD_FACE_BOX_MAX_AGE = _env("AEGIS_PAD_FACE_BOX_MAX_AGE", 30.0, float)
+
+    # Content-hash result cache (0 = off); the tensor tier keeps preprocessed
+    # inputs (~600 KB each) so a model swap still skips background removal
+    RESULT_CACHE_SIZE = _env("AEGIS_RESULT_CACHE_SIZE", 1024, int)
+    RESULT_CACHE_TTL = _env("AEGIS_RESULT_CACHE_TTL", 3600.0, float)  # seconds
+    TENSOR_CACHE_SIZE = _env("AEGIS_TENSOR_CACHE_SIZE", 0, int)
+
+    # Async prediction jobs (/jobs/predict): interactive lane before bulk;
+    # workers defer to in-flight PAD frames for up to JOB_MAX_DEFER_MS.
+    # Job records go to JOB_STORE_BACKEND (same choices as PAD sessions); a
+    # poll may land on any worker, so with WORKERS > 1 jobs need "redis" and
+    # are refused (503) otherwise. Callbacks don't depend on the store.
+    JOB_WORKERS = _env("AEGIS_JOB_WORKERS", 2, int)
+    JOB_QUEUE_SIZE = _env("AEGIS_JOB_QUEUE_SIZE", 256, int)
+    JOB_TTL = _env("AEGIS_JOB_TTL", 600.0, float)  # seconds a job stays pollable after its last update
+    JOB_STORE_BACKEND = _env("AEGIS_JOB_STORE_BACKEND", PAD_SESSION_BACKEND)
+    JOB_REDIS_URL = _env("AEGIS_JOB_REDIS_URL", PAD_REDIS_URL)
+    JOB_MAX_DEFER_MS = _env("AEGIS_JOB_MAX_DEFER_MS", 1000.0, float)
+    JOB_CALLBACKS_ENABLED = _env("AEGIS_JOB_CALLBACKS_ENABLED", False, bool)
+    JOB_CALLBACK_ALLOWLIST = _env("AEGIS_JOB_CALLBACK_ALLOWLIST", "").split(",")  # hostnames
+
+    # Observability: /metrics in Prometheus text format (per worker process),
+    # JSON event logs on stderr at LOG_LEVEL keeping LOG_SAMPLE_RATE of routine events, and
+    # /admin/profile (X-Admin-Token: ADMIN_TOKEN; disabled while it is empty)
+    METRICS_ENABLED = _env("AEGIS_METRICS_ENABLED", True, bool)
+    LOG_LEVEL = _env("AEGIS_LOG_LEVEL", "INFO")
+    LOG_SAMPLE_RATE = _env("AEGIS_LOG_SAMPLE_RATE", 0.01, float)
+    ADMIN_TOKEN = _env("AEGIS_ADMIN_TOKEN", "")
+    PROFILE_DIR = _env("AEGIS_PROFILE_DIR", os.path.join(os.path.dirname(BASE_DIR), "profiles"))
+    PROFILE_MAX_REQUESTS = _env("AEGIS_PROFILE_MAX_REQUESTS", 50, int)
+
+    # Warmup: a background thread runs WARMUP_ITERATIONS dummy passes through
+    # decode, preprocessing, the model (batch 1 and BATCH_MAX_SIZE), face
+    # detection, background removal and FaceMesh; /readyz is 503 until done.
+    # Under gunicorn preload it starts in each worker (post_fork).
+    WARMUP_ENABLED = _env("AEGIS_WARMUP_ENABLED", True, bool)
+    WARMUP_ITERATIONS = _env("AEGIS_WARMUP_ITERATIONS", 3, int)
+
+    # Request image handling
+    IN_MEMORY_PIPELINE = _env("AEGIS_IN_MEMORY_PIPELINE", True, bool)  # False = save upload to UPLOAD_FOLDER first
+    DEBUG_ARTIFACTS = _env("AEGIS_DEBUG_ARTIFACTS", False, bool)  # save _bg_rm/_pre images for every request
+    DEBUG_ARTIFACT_SAMPLE_RATE = _env("AEGIS_DEBUG_ARTIFACT_SAMPLE_RATE", 0.0, float)
+    DEBUG_ARTIFACT_DIR = os.path.join(UPLOAD_FOLDER, "debug")
+    DEBUG_ARTIFACT_MAX_FILES = _env("AEGIS_DEBUG_ARTIFACT_MAX_FILES", 300, int)
+
+    # Background removal: a rembg model name ("u2net", "u2netp", "silueta", ...),
+    # "mediapipe" (selfie segmentation) or "off"
+    BG_REMOVAL_BACKEND = _env("AEGIS_BG_REMOVAL_BACKEND", "u2net")
+    BG_REMOVAL_MAX_SIDE = _env("AEGIS_BG_REMOVAL_MAX_SIDE", 320, int)  # segment at this size, 0 = full resolution
+    BG_REMOVAL_INTRA_OP_THREADS = _env("AEGIS_BG_REMOVAL_INTRA_OP_THREADS", 0, int)  # 0 = onnxruntime default
+    BG_REMOVAL_INTER_OP_THREADS = _env("AEGIS_BG_REMOVAL_INTER_OP_THREADS", 0, int)
@@ -0,0 +1,93 @@
+import os
+import queue
+import random
+import threading
+import time
+import uuid
+
+import cv2
+import numpy as np
+
+from app.metrics import event_log, record_error
+
+
+# ------------------------------
+# Background debug-image writer
+# ------------------------------
+class DebugArtifactWriter:
+    """Saves intermediate images off the request path.
+
+    Nothing is written unless ``enabled`` is set (capture every request) or
+    ``sample_rate`` is above zero (capture that fraction of requests). Files go
+    to ``directory`` and the oldest ones are evicted once more than
+    ``max_files`` exist. When the queue is full, new artifacts are dropped
+    rather than blocking the request.
+    """
+
+    def __init__(self, directory, enabled=False, sample_rate=0.0, max_files=300, queue_size=32):
+        self.directory = directory
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.max_files = max_files
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._thread = None
+        self.dropped = 0
+
+    def should_capture(self):
+        if self.enabled:
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def submit(self, name, images):
+        """Queue ``{suffix: array}`` images to be saved as ``<id>_<name><suffix>.png``."""
+        stem = f"{int(time.time() * 1000)}_{uuid.uuid4().hex[:8]}_{os.path.splitext(name)[0]}"
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((stem, images))
+        except queue.Full:
+            self.dropped += 1
+
+    # ---- worker ----
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                os.makedirs(self.directory, exist_ok=True)
+                self._thread = threading.Thread(target=self._run, name="debug-artifacts", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            stem, images = self._queue.get()
+            try:
+                for suffix, img in images.items():
+                    cv2.imwrite(os.path.join(self.directory, f"{stem}{suffix}.png"), to_bgr_uint8(img))
+                self._evict()
+            except Exception as e:
+                record_error("debug_artifacts", e)
+                event_log.warning("debug_artifacts_failed", stem=stem, error=f"{type(e).__name__}: {e}")
+
+    def _evict(self):
+        entries = [e for e in os.scandir(self.directory) if e.is_file()]
+        excess = len(entries) - self.max_files
+        if excess <= 0:
+            return
+        entries.sort(key=lambda e: e.stat().st_mtime)
+        for entry in entries[:excess]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+
+def to_bgr_uint8(img):
+    if img.dtype != np.uint8:
+        img = (img * 255).clip(0, 255).astype(np.uint8)
+    if img.ndim == 3 and img.shape[2] == 4:
+        return cv2.cvtColor(img, cv2.COLOR_RGBA2BGRA)
+    if img.ndim == 3:
+        return cv2.cvtColor(img, cv2.COLOR_RGB2BGR)
+    return img
@@ -0,0 +1,168 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+def default_face_mesh_factory():
+    import mediapipe as mp
+    return mp.solutions.face_mesh.FaceMesh(
+        static_image_mode=False,
+        refine_landmarks=True,
+        max_num_faces=1
+    )
+
+
+_BUILD = object()  # _assign: a new instance must be constructed
+
+
+class _Entry:
+    __slots__ = ("mesh", "lock", "session_id", "last_used")
+
+    def __init__(self, mesh):
+        self.mesh = mesh
+        self.lock = threading.Lock()
+        self.session_id = None
+        self.last_used = time.monotonic()
+
+
+# ------------------------------
+# Per-session FaceMesh pool
+# ------------------------------
+class FaceMeshPool:
+    """FaceMesh instances bound to PAD sessions.
+
+    Each session keeps the same instance for its whole stream, so MediaPipe's
+    video-mode tracker stays warm (landmark tracking instead of full detection
+    on every frame) and never sees another user's frames. Different sessions
+    use different instances and run in parallel; frames of one session are
+    serialized by that instance's lock, since FaceMesh is not thread-safe.
+
+    At most ``max_instances`` are kept. When all are bound, the least recently
+    used idle one is reset and handed to the new session. Instances unused for
+    ``idle_timeout`` seconds are closed. Instances are created lazily in the
+    calling process, so a pool built before a gunicorn fork is safe.
+    """
+
+    def __init__(self, factory=default_face_mesh_factory, max_instances=8, idle_timeout=60.0,
+                 acquire_timeout=5.0):
+        self.factory = factory
+        self.max_instances = max(1, int(max_instances))
+        self.idle_timeout = idle_timeout
+        self.acquire_timeout = acquire_timeout
+
+        self._cond = threading.Condition()
+        self._entries = []
+        self._bound = {}
+        self._building = set()  # sessions whose new instance is being constructed
+        self._pid = os.getpid()
+        self.created = 0
+        self.reused = 0
+
+    @contextmanager
+    def session(self, session_id):
+        """Hold the session's FaceMesh for the duration of the block."""
+        entry = self._acquire(session_id)
+        try:
+            yield entry.mesh
+        finally:
+            entry.last_used = time.monotonic()
+            entry.lock.release()
+            with self._cond:
+                self._cond.notify()
+
+    def release(self, session_id):
+        """Unbind a finished session; its instance becomes free for the next one."""
+        with self._cond:
+            entry = self._bound.pop(session_id, None)
+            if entry is not None:
+                entry.session_id = None
+                self._cond.notify()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "instances": len(self._entries),
+                "building": len(self._building),
+                "bound_sessions": len(self._bound),
+                "max_instances": self.max_instances,
+                "created": self.created,
+                "reused": self.reused,
+            }
+
+    # ---- internals ----
+    def _acquire(self, session_id):
+        deadline = time.monotonic() + self.acquire_timeout
+        with self._cond:
+            if self._pid != os.getpid():
+                # Forked child: the parent's graphs are unusable here
+                self._entries, self._bound, self._building, self._pid = [], {}, set(), os.getpid()
+            self._reap()
+
+            while True:
+                entry = self._bound.get(session_id)
+                if entry is None and session_id not in self._building:
+                    entry = self._assign(session_id)
+                    if entry is _BUILD:
+                        break
+                if entry is not None and entry.lock.acquire(blocking=False):
+                    return entry
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError("No FaceMesh instance available")
+                self._cond.wait(remaining)
+
+        # A slot is reserved: build the instance (hundreds of ms) without
+        # holding up other sessions, then publish it already locked
+        try:
+            entry = _Entry(self.factory())
+        except BaseException:
+            with self._cond:
+                self._building.discard(session_id)
+                self._cond.notify_all()
+            raise
+        entry.lock.acquire()
+        with self._cond:
+            self._building.discard(session_id)
+            entry.session_id = session_id
+            self._entries.append(entry)
+            self._bound[session_id] = entry
+            self.created += 1
+            self._cond.notify_all()
+        return entry
+
+    def _assign(self, session_id):
+        """Bind an instance to ``session_id``, or return _BUILD after reserving
+        a slot for a new one (called with the condition held)."""
+        free = [e for e in self._entries if e.session_id is None and not e.lock.locked()]
+        if not free and len(self._entries) + len(self._building) < self.max_instances:
+            self._building.add(session_id)
+            return _BUILD
+
+        if free:
+            entry = free[0]
+        else:
+            idle = [e for e in self._entries if not e.lock.locked()]
+            if not idle:
+                return None
+            entry = min(idle, key=lambda e: e.last_used)
+            self._bound.pop(entry.session_id, None)
+        self._reset(entry)
+
+        entry.session_id = session_id
+        self._bound[session_id] = entry
+        return entry
+
+    def _reset(self, entry):
+        # Drop tracking state left by the previous session
+        if hasattr(entry.mesh, "reset"):
+            entry.mesh.reset()
+        self.reused += 1
+
+    def _reap(self):
+        now = time.monotonic()
+        for entry in list(self._entries):
+            if now - entry.last_used > self.idle_timeout and not entry.lock.locked():
+                self._entries.remove(entry)
+                self._bound.pop(entry.session_id, None)
+                entry.mesh.close()
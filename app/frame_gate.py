@@ -0,0 +1,86 @@
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+
+def downscale(frame, max_side):
+    """Shrink ``frame`` so its longer side is at most ``max_side`` (0 = keep)."""
+    h, w = frame.shape[:2]
+    if not max_side or max(h, w) <= max_side:
+        return frame
+    scale = max_side / max(h, w)
+    return cv2.resize(frame, (max(1, round(w * scale)), max(1, round(h * scale))),
+                      interpolation=cv2.INTER_AREA)
+
+
+def thumbnail(frame, size=16):
+    """Tiny grayscale signature of a BGR frame for motion checks."""
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    return cv2.resize(gray, (size, size), interpolation=cv2.INTER_AREA).astype(np.int16)
+
+
+# ------------------------------
+# Per-session motion pre-gate
+# ------------------------------
+class MotionGate:
+    """Skips FaceMesh on frames that look identical to the session's last one.
+
+    Each session keeps a ``thumb_size`` x ``thumb_size`` grayscale thumbnail
+    of its last processed frame and the status that frame produced. A new
+    frame whose thumbnail differs by less than ``threshold`` grey levels on
+    average is answered with that status instead; passes are never replayed.
+    Callers pass ``replay=False`` for challenges judged over consecutive
+    frames (blinks, held turns): a still user's frames barely differ, yet
+    each one is a sample those checks need.
+    The cache is per process and bounded to ``max_sessions`` entries; a miss
+    just means the frame is processed.
+
+    ``threshold=0`` disables skipping; the counters are kept either way.
+    """
+
+    def __init__(self, threshold=1.0, thumb_size=16, max_sessions=10000):
+        self.threshold = threshold
+        self.thumb_size = thumb_size
+        self.max_sessions = max_sessions
+        self._last = OrderedDict()
+        self._lock = threading.Lock()
+        self.counts = {"processed": 0, "skipped": 0, "early_exit": 0}
+
+    def check(self, session_id, frame, replay=True):
+        """Return (thumbnail, cached status or None) for ``frame``."""
+        thumb = thumbnail(frame, self.thumb_size)
+        with self._lock:
+            last = self._last.get(session_id)
+            if replay and self.threshold > 0 and last is not None:
+                last_thumb, last_status = last
+                if not last_status["passed"] and np.abs(thumb - last_thumb).mean() < self.threshold:
+                    self._last.move_to_end(session_id)
+                    self.counts["skipped"] += 1
+                    return thumb, dict(last_status, skipped=True)
+        return thumb, None
+
+    def remember(self, session_id, thumb, status):
+        with self._lock:
+            self.counts["processed"] += 1
+            self._last[session_id] = (thumb, status)
+            self._last.move_to_end(session_id)
+            while len(self._last) > self.max_sessions:
+                self._last.popitem(last=False)
+
+    def early_exit(self):
+        with self._lock:
+            self.counts["early_exit"] += 1
+
+    def forget(self, session_id):
+        with self._lock:
+            self._last.pop(session_id, None)
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self.counts)
+            sessions = len(self._last)
+        frames = sum(counts.values())
+        return dict(counts, frames=frames, cached_sessions=sessions,
+                    skip_rate=counts["skipped"] / frames if frames else 0.0)
@@ -0,0 +1,239 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import torch
+
+from app.metrics import event_log, record_error, timed
+from app.model_utils.model import coral_decode
+
+
+class QueueFullError(RuntimeError):
+    """A stage is at capacity; the caller should back off (HTTP 503)."""
+
+
+# ------------------------------
+# Micro-batching inference engine
+# ------------------------------
+class BatchInferenceEngine:
+    """Gathers single-image requests into one forward pass.
+
+    Callers submit a preprocessed (3, H, W) or (1, 3, H, W) tensor and get a
+    Future that resolves to the decoded age. A worker thread collects queued
+    requests until ``max_batch_size`` is reached or ``max_wait_ms`` has passed
+    since the first one arrived, then runs the model once for the whole batch.
+    With ``max_queue_size`` set, submit() raises QueueFullError instead of
+    letting the queue grow without bound.
+    """
+
+    def __init__(self, model, device="cpu", max_batch_size=8, max_wait_ms=10.0, max_queue_size=0):
+        self.model = model
+        self.device = device
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+
+        self._queue = queue.Queue(maxsize=max(0, int(max_queue_size)))
+        self._lock = threading.Lock()
+        self._thread = None
+
+        self._requests = 0
+        self._rejected = 0
+        self._batches = 0
+        self._batch_sizes = {}
+        self._max_queue_depth = 0
+        self._wait_time_total = 0.0
+        self._forward_time_total = 0.0
+
+    # ---- public API ----
+    def submit(self, img_tensor):
+        """Queue one image tensor and return a Future for its predicted age."""
+        if img_tensor.dim() == 3:
+            img_tensor = img_tensor.unsqueeze(0)
+        if img_tensor.size(0) != 1:
+            raise ValueError("submit() takes a single image; use run_batch() for batches")
+
+        self._ensure_started()
+        future = Future()
+        try:
+            self._queue.put_nowait((img_tensor, future, time.perf_counter()))
+        except queue.Full:
+            with self._lock:
+                self._rejected += 1
+            raise QueueFullError("Inference queue is full")
+
+        depth = self._queue.qsize()
+        with self._lock:
+            self._requests += 1
+            self._max_queue_depth = max(self._max_queue_depth, depth)
+        return future
+
+    def predict(self, img_tensor, timeout=None):
+        """Blocking helper: submit one image and wait for its age."""
+        return self.submit(img_tensor).result(timeout=timeout)
+
+    def run_batch(self, batch):
+        """Run one forward pass on an (N, 3, H, W) tensor and return N ages."""
+        with timed("forward"), torch.no_grad():
+            logits = self.model(batch.to(self.device))
+        ages = coral_decode(logits)
+        event_log.log("prediction", batch_size=len(ages), ages=ages)
+        return ages
+
+    def stats(self):
+        with self._lock:
+            batches = self._batches
+            served = sum(size * count for size, count in self._batch_sizes.items())
+            return {
+                "queue_depth": self._queue.qsize(),
+                "max_queue_depth": self._max_queue_depth,
+                "requests": self._requests,
+                "rejected": self._rejected,
+                "batches": batches,
+                "avg_batch_size": served / batches if batches else 0.0,
+                "batch_size_histogram": dict(sorted(self._batch_sizes.items())),
+                "avg_wait_ms": 1000.0 * self._wait_time_total / served if served else 0.0,
+                "avg_forward_ms": 1000.0 * self._forward_time_total / batches if batches else 0.0,
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000.0,
+            }
+
+    # ---- worker ----
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="batch-inference", daemon=True
+                )
+                self._thread.start()
+
+    def _collect(self):
+        first = self._queue.get()
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            tensors, futures, enqueued = zip(*batch)
+            started = time.perf_counter()
+            try:
+                ages = self.run_batch(torch.cat(tensors, dim=0))
+            except Exception as e:
+                record_error("forward", e)
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            finished = time.perf_counter()
+
+            for future, age in zip(futures, ages):
+                future.set_result(age)
+
+            with self._lock:
+                self._batches += 1
+                self._batch_sizes[len(batch)] = self._batch_sizes.get(len(batch), 0) + 1
+                self._wait_time_total += sum(started - t for t in enqueued)
+                self._forward_time_total += finished - started
+
+
+# ------------------------------
+# Preprocess -> inference pipeline
+# ------------------------------
+class InferencePipeline:
+    """Runs preprocessing on a thread pool and feeds results to the engine.
+
+    Decode, background removal and preprocess_pipeline release the GIL, so
+    concurrent requests preprocess in parallel while earlier ones are in the
+    model. At most ``max_pending`` requests may be waiting for or running
+    preprocessing; beyond that submit() raises QueueFullError. The engine's
+    own bounded queue applies the same backpressure to the inference stage.
+    """
+
+    def __init__(self, engine, workers=4, max_pending=32):
+        self.engine = engine
+        self.workers = max(1, int(workers))
+        self.max_pending = max(1, int(max_pending))
+
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pool_pid = None
+        self._pending = 0
+        self._submitted = 0
+        self._rejected = 0
+
+    def _get_pool(self):
+        # Created on first use in each process (threads don't survive a fork)
+        if self._pool is None or self._pool_pid != os.getpid():
+            with self._lock:
+                if self._pool is None or self._pool_pid != os.getpid():
+                    self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="preprocess")
+                    self._pool_pid = os.getpid()
+        return self._pool
+
+    def submit(self, prepare):
+        """Run ``prepare()`` (returning an image tensor) then predict its age.
+
+        Returns a Future for the age; raises QueueFullError when saturated.
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            raise QueueFullError("Preprocessing queue is full")
+        with self._lock:
+            self._pending += 1
+            self._submitted += 1
+
+        result = Future()
+
+        def release():
+            with self._lock:
+                self._pending -= 1
+            self._slots.release()
+
+        def preprocessed(f):
+            release()
+            try:
+                inference = self.engine.submit(f.result())
+            except Exception as e:
+                result.set_exception(e)
+                return
+            inference.add_done_callback(_chain(result))
+
+        try:
+            self._get_pool().submit(prepare).add_done_callback(preprocessed)
+        except Exception:
+            release()
+            raise
+        return result
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pending": self._pending,
+                "max_pending": self.max_pending,
+                "workers": self.workers,
+                "submitted": self._submitted,
+                "rejected": self._rejected,
+            }
+
+
+def _chain(target):
+    def copy(source):
+        if source.exception() is not None:
+            target.set_exception(source.exception())
+        else:
+            target.set_result(source.result())
+    return copy
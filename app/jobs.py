@@ -0,0 +1,212 @@
+import itertools
+import json
+import os
+import queue
+import threading
+import time
+import urllib.request
+import uuid
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+from app.inference import QueueFullError
+from app.metrics import event_log
+from app.session_store import InMemorySessionStore
+
+LANES = {"interactive": 0, "bulk": 1}  # lower runs first
+
+
+# ------------------------------
+# Liveness precedence
+# ------------------------------
+class PriorityGate:
+    """Lets PAD frames run ahead of background age inference.
+
+    /process_frame wraps its FaceMesh work in ``frame()``; job workers call
+    ``wait_idle()`` before each job, and /predict_batch before each batch
+    (``deferring(run_batch)``), holding off while any frame is in flight for
+    at most ``max_defer`` seconds so they still make progress under a
+    constant frame stream. Synchronous /predict is not held back: a user
+    is waiting on it.
+    """
+
+    def __init__(self, max_defer=1.0):
+        self.max_defer = max_defer
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self.deferrals = 0
+
+    @contextmanager
+    def frame(self):
+        with self._cond:
+            self._in_flight += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._in_flight -= 1
+                if not self._in_flight:
+                    self._cond.notify_all()
+
+    def wait_idle(self):
+        with self._cond:
+            if self._in_flight:
+                self.deferrals += 1
+                self._cond.wait_for(lambda: not self._in_flight, timeout=self.max_defer)
+
+    def deferring(self, fn):
+        """``fn`` wrapped to wait_idle() before every call."""
+        def deferred(*args, **kwargs):
+            self.wait_idle()
+            return fn(*args, **kwargs)
+        return deferred
+
+    def stats(self):
+        with self._cond:
+            return {"frames_in_flight": self._in_flight, "deferrals": self.deferrals}
+
+
+# ------------------------------
+# Async prediction jobs
+# ------------------------------
+class JobManager:
+    """Background jobs with priority lanes, polled by id or pushed to a callback.
+
+    ``submit(fn)`` queues ``fn()`` (returning a JSON-serializable result) and
+    returns a job id immediately. ``workers`` threads take jobs interactive
+    lane first, then bulk, FIFO within a lane. At most ``max_queued`` jobs may
+    wait; beyond that submit() raises QueueFullError.
+
+    Job records live in ``store`` (a SessionStore keyed by job id, expiring
+    ``ttl`` seconds after their last update), so with a shared backend any
+    worker process can answer a poll; the queue and the callables stay in the
+    process that accepted the job. ``enabled`` is False when the store is
+    per-process but several workers serve requests (see create_app). Worker
+    threads start lazily in each process, so a manager built before a
+    gunicorn fork is safe.
+    """
+
+    def __init__(self, workers=2, max_queued=256, ttl=600, gate=None, store=None, enabled=True,
+                 callback_allowlist=(), callback_timeout=5.0):
+        self.workers = max(1, int(workers))
+        self.max_queued = max(1, int(max_queued))
+        self.store = store if store is not None else InMemorySessionStore(ttl=ttl)
+        self.enabled = enabled
+        self.gate = gate
+        self.callback_allowlist = {h.strip().lower() for h in callback_allowlist if h.strip()}
+        self.callback_timeout = callback_timeout
+
+        self._queue = queue.PriorityQueue(maxsize=self.max_queued)
+        self._seq = itertools.count()
+        self._running = 0
+        self._lock = threading.Lock()
+        self._threads = []
+        self._pid = None
+        self._counts = {"submitted": 0, "rejected": 0, "done": 0, "failed": 0,
+                        "callbacks_failed": 0, "store_errors": 0}
+
+    # ---- public API ----
+    def callback_allowed(self, url):
+        parsed = urlparse(url or "")
+        return (parsed.scheme in ("http", "https")
+                and (parsed.hostname or "").lower() in self.callback_allowlist)
+
+    def submit(self, fn, lane="interactive", callback_url=None):
+        if lane not in LANES:
+            raise ValueError(f"Unknown lane: {lane!r}")
+        if callback_url and not self.callback_allowed(callback_url):
+            raise ValueError("Callback URL is not allowed")
+
+        self._ensure_started()
+        job_id = uuid.uuid4().hex
+        job = {
+            "id": job_id, "status": "queued", "lane": lane,
+            "created": time.time(), "started": None, "finished": None,
+            "result": None, "error": None,
+        }
+        # Written before queueing so a poll right after the 202 finds it
+        self.store.set(job_id, dict(job))
+        try:
+            self._queue.put_nowait((LANES[lane], next(self._seq), job, fn, callback_url))
+        except queue.Full:
+            self.store.delete(job_id)
+            with self._lock:
+                self._counts["rejected"] += 1
+            raise QueueFullError("Job queue is full")
+        with self._lock:
+            self._counts["submitted"] += 1
+        return job_id
+
+    def get(self, job_id):
+        """The job record (None if unknown or expired)."""
+        return self.store.get(job_id)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counts, queued=self._queue.qsize(), running=self._running,
+                         workers=self.workers, max_queued=self.max_queued)
+        if self.gate is not None:
+            stats["priority"] = self.gate.stats()
+        return stats
+
+    # ---- workers ----
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                # Forked child: the parent's threads and queued jobs are gone
+                self._queue = queue.PriorityQueue(maxsize=self.max_queued)
+                self._running = 0
+                self._threads = [
+                    threading.Thread(target=self._run, name=f"job-worker-{i}", daemon=True)
+                    for i in range(self.workers)
+                ]
+                for t in self._threads:
+                    t.start()
+                self._pid = os.getpid()
+
+    def _run(self):
+        while True:
+            _, _, job, fn, callback = self._queue.get()
+            if self.gate is not None:
+                self.gate.wait_idle()
+
+            with self._lock:
+                self._running += 1
+            job.update(status="running", started=time.time())
+            self._save(job)
+
+            try:
+                result, error, status = fn(), None, "done"
+            except Exception as e:
+                result, error, status = None, str(e), "failed"
+
+            job.update(status=status, result=result, error=error, finished=time.time())
+            with self._lock:
+                self._running -= 1
+                self._counts[status] += 1
+            self._save(job)
+
+            if callback:
+                self._post_callback(callback, job)
+
+    def _save(self, job):
+        # Only the accepting process writes a job, so a plain set is enough
+        try:
+            self.store.set(job["id"], dict(job))
+        except Exception as e:
+            with self._lock:
+                self._counts["store_errors"] += 1
+            event_log.warning("job_store_failed", job_id=job["id"], error=f"{type(e).__name__}: {e}")
+
+    def _post_callback(self, url, payload):
+        req = urllib.request.Request(url, data=json.dumps(payload).encode(),
+                                     headers={"Content-Type": "application/json"}, method="POST")
+        try:
+            with urllib.request.urlopen(req, timeout=self.callback_timeout):
+                pass
+        except Exception as e:
+            with self._lock:
+                self._counts["callbacks_failed"] += 1
+            event_log.warning("job_callback_failed", url=url, error=f"{type(e).__name__}: {e}")
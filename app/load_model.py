@@ -1,21 +1,112 @@
+import pickle
+import warnings
+
 import torch
 import os
+from app.timing import StageTimer
 from app.model_utils.model import AgePredictionCORAL  # import your class definition
 # from tensorflow.keras.models import load_model
 
-def load_model_pt(checkpoint_path, device="cpu", num_classes=45):
-    """Load and return the trained PyTorch model."""
-    model = AgePredictionCORAL(num_classes=num_classes).to(device)
+MODEL_BACKENDS = ("eager", "compile", "torchscript", "onnx", "int8")
+
+
+class OnnxAgeModel:
+    """Drop-in for the eager model served by an onnxruntime session.
+
+    Called with an (N, 3, H, W) tensor, returns the (N, K-1) logits tensor.
+    """
+
+    def __init__(self, onnx_path, intra_op_threads=0):
+        import onnxruntime as ort
+
+        sess_opts = ort.SessionOptions()
+        sess_opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra_op_threads:
+            sess_opts.intra_op_num_threads = intra_op_threads
+        self.session = ort.InferenceSession(onnx_path, sess_opts, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        self.output_name = self.session.get_outputs()[0].name
+
+    def __call__(self, x):
+        x = x.detach().cpu().contiguous().numpy()
+        return torch.from_numpy(self.session.run([self.output_name], {self.input_name: x})[0])
+
+    def eval(self):
+        return self
+
+
+def load_checkpoint(checkpoint_path, device="cpu"):
+    """Memory-map a checkpoint onto ``device``, weights-only when possible."""
+    try:
+        return torch.load(checkpoint_path, map_location=device, mmap=True, weights_only=True)
+    except pickle.UnpicklingError:
+        # Older checkpoints may pickle extra objects next to the weights
+        warnings.warn(f"{checkpoint_path} is not weights-only loadable, falling back to full unpickling")
+        return torch.load(checkpoint_path, map_location=device, mmap=True, weights_only=False)
 
-    checkpoint = torch.load(checkpoint_path, map_location=device)
+
+def load_model_pt(checkpoint_path, device="cpu", num_classes=45, backend="eager", artifact_path=None,
+                  timer=None, optimize=False, bf16=False):
+    """Load and return the trained model for the chosen serving backend.
+
+    backend: "eager" (PyTorch module), "compile" (BN-folded module wrapped in
+    torch.compile), "torchscript" or "onnx" (artifacts written by
+    ``python -m app.model_utils.export``) or "int8" (written by
+    ``python -m app.model_utils.quantize``), read from ``artifact_path``.
+    ``timer`` (a StageTimer) receives the eager loading breakdown.
+    ``optimize`` serves "eager"/"compile" through OptimizedAgeModel (fused
+    CBAM, channels_last), with bf16 autocast when ``bf16`` is set.
+    """
+    if backend not in MODEL_BACKENDS:
+        raise ValueError(f"Unknown model backend {backend!r}, expected one of {MODEL_BACKENDS}")
+
+    if backend == "onnx":
+        return OnnxAgeModel(artifact_path)
+
+    if backend == "int8":
+        if "x86" in torch.backends.quantized.supported_engines:
+            torch.backends.quantized.engine = "x86"
+        model = torch.jit.load(artifact_path, map_location="cpu")
+        model.eval()
+        return model
+
+    if backend == "torchscript":
+        model = torch.jit.load(artifact_path, map_location=device)
+        model.eval()
+        if device == "cpu":
+            model = torch.jit.optimize_for_inference(model)
+        return model
+
+    timer = timer or StageTimer()
+
+    # Build the architecture on the meta device: no ImageNet download and no
+    # random init, the checkpoint tensors are assigned in place below.
+    with timer.stage("construct"):
+        with torch.device("meta"):
+            model = AgePredictionCORAL(num_classes=num_classes, pretrained=False)
+
+    with timer.stage("read_checkpoint"):
+        checkpoint = load_checkpoint(checkpoint_path, device=device)
 
     # Handle checkpoints with or without "model_state_dict"
-    if "model_state_dict" in checkpoint:
-        model.load_state_dict(checkpoint["model_state_dict"])
-    else:
-        model.load_state_dict(checkpoint)
+    with timer.stage("load_state_dict"):
+        if "model_state_dict" in checkpoint:
+            model.load_state_dict(checkpoint["model_state_dict"], assign=True)
+        else:
+            model.load_state_dict(checkpoint, assign=True)
+        model = model.to(device)
 
     model.eval()
+
+    if optimize:
+        from app.model_utils.export import OptimizedAgeModel
+        with timer.stage("optimize"):
+            model = OptimizedAgeModel(model, bf16=bf16).eval()
+        if backend == "compile":
+            model = torch.compile(model)
+    elif backend == "compile":
+        from app.model_utils.export import fold_for_inference
+        model = torch.compile(fold_for_inference(model))
     return model
 
 
@@ -0,0 +1,307 @@
+import bisect
+import json
+import logging
+import math
+import random
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+# Latency buckets in seconds: 1 ms .. 10 s
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+# ------------------------------
+# Prometheus-style metrics
+# ------------------------------
+# Every worker process keeps its own registry (scrape each worker, or run a
+# single one); values are in-memory and reset on restart.
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in list(zip(names, values)) + list(extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._samples(key, value))
+        return lines
+
+    def _samples(self, key, value):
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(value)}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            entry[0][bisect.bisect_left(self.buckets, value)] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self, key, value):
+        counts, total, count = value
+        lines, cumulative = [], 0
+        for bound, n in zip(self.buckets, counts):
+            cumulative += n
+            le = (("le", _number(bound)),)
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+        lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+        lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class Registry:
+    """Named metrics plus collectors that turn ``stats()`` dicts into gauges
+    at scrape time, rendered in the Prometheus text format (0.0.4)."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, help_text, labels, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help_text, labels, **kwargs)
+            return metric
+
+    def counter(self, name, help_text, labels=()):
+        return self._get_or_create(Counter, name, help_text, labels)
+
+    def gauge(self, name, help_text, labels=()):
+        return self._get_or_create(Gauge, name, help_text, labels)
+
+    def histogram(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(Histogram, name, help_text, labels, buckets=buckets)
+
+    def add_collector(self, prefix, stats_fn):
+        """Export ``stats_fn()``'s numeric values as ``aegis_<prefix>_<key>`` gauges
+        (replacing any collector already registered under ``prefix``)."""
+        with self._lock:
+            self._collectors[prefix] = stats_fn
+
+    def render(self):
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors.items())
+        for metric in metrics:
+            lines.extend(metric.render())
+        for prefix, stats_fn in collectors:
+            try:
+                stats = stats_fn()
+            except Exception as e:
+                lines.append(f"# collector {prefix} failed: {_escape(e)}")
+                continue
+            typed = set()
+            for name, labels, value in _flatten(f"aegis_{prefix}", stats):
+                if name not in typed:
+                    typed.add(name)
+                    lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name}{labels} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _flatten(prefix, stats):
+    """(name, label string, value) for every number in a nested stats dict.
+    Nested dicts with identifier keys extend the name; others (e.g. batch
+    size histograms keyed by size) become a ``key`` label."""
+    for key, value in stats.items():
+        name = f"{prefix}_{key}"
+        if isinstance(value, bool):
+            yield name, "", int(value)
+        elif isinstance(value, (int, float)):
+            yield name, "", value
+        elif isinstance(value, dict) and value:
+            if all(str(k).isidentifier() for k in value):
+                yield from _flatten(name, value)
+            else:
+                for k, v in value.items():
+                    if isinstance(v, (int, float)):
+                        yield name, _labels(("key",), (k,)), v
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "aegis_stage_seconds", "Time spent in each processing stage", ["stage"])
+REQUEST_SECONDS = REGISTRY.histogram(
+    "aegis_request_seconds", "HTTP request latency until the response is returned", ["endpoint"])
+REQUESTS = REGISTRY.counter(
+    "aegis_requests_total", "HTTP responses by endpoint and status code", ["endpoint", "status"])
+ERRORS = REGISTRY.counter(
+    "aegis_errors_total", "Errors by stage and exception type", ["stage", "error"])
+PAD_FRAMES = REGISTRY.counter(
+    "aegis_pad_frames_total", "PAD frame outcomes by challenge", ["challenge", "passed"])
+PAD_SESSIONS = REGISTRY.counter(
+    "aegis_pad_sessions_total", "Finished PAD sessions by outcome (done, failed, timeout)", ["outcome"])
+
+
+_local = threading.local()
+
+
+@contextmanager
+def unrecorded():
+    """Keep this thread's work out of the stage histograms and the event log
+    for the duration of the block (warmup's synthetic captures)."""
+    _local.off = True
+    try:
+        yield
+    finally:
+        _local.off = False
+
+
+def recording():
+    return not getattr(_local, "off", False)
+
+
+def timed(stage):
+    """``with timed("decode"): ...`` records into aegis_stage_seconds."""
+    return STAGE_SECONDS.time(stage=stage) if recording() else nullcontext()
+
+
+def record_error(stage, error):
+    ERRORS.inc(stage=stage, error=type(error).__name__ if isinstance(error, BaseException) else error)
+
+
+# ------------------------------
+# Structured, sampled logging
+# ------------------------------
+class SampledLogger:
+    """One JSON object per event on a standard logger.
+
+    INFO/DEBUG events are kept with probability ``sample_rate`` (the
+    ``sampled`` field records it so counts can be scaled back up);
+    warnings and errors are always logged.
+    """
+
+    def __init__(self, name, sample_rate=1.0):
+        self.logger = logging.getLogger(name)
+        self.sample_rate = sample_rate
+
+    def log(self, event, level=logging.INFO, **fields):
+        if not recording():
+            return
+        if level < logging.WARNING and (self.sample_rate <= 0 or random.random() >= self.sample_rate):
+            return
+        if not self.logger.isEnabledFor(level):
+            return
+        record = {"event": event, "ts": round(time.time(), 3), **fields}
+        if level < logging.WARNING:
+            record["sampled"] = self.sample_rate
+        self.logger.log(level, json.dumps(record, default=str))
+
+    def warning(self, event, **fields):
+        self.log(event, level=logging.WARNING, **fields)
+
+    def configure(self, level=logging.INFO, sample_rate=None, stream=None):
+        """Set the level and write the events, one JSON object per line, to
+        ``stream`` (stderr by default). The logger stops propagating, so
+        events are not repeated by the root handlers; calling again replaces
+        the handler."""
+        self.logger.setLevel(level)
+        if sample_rate is not None:
+            self.sample_rate = sample_rate
+        for handler in [h for h in self.logger.handlers if getattr(h, "_aegis_events", False)]:
+            self.logger.removeHandler(handler)
+        handler = logging.StreamHandler(stream)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        handler._aegis_events = True
+        self.logger.addHandler(handler)
+        self.logger.propagate = False
+
+
+event_log = SampledLogger("aegis.events")
+
+
+# ------------------------------
+# Flask wiring
+# ------------------------------
+def init_metrics(app):
+    """Time every request and export the app's service stats (queues,
+    pools, caches) as gauges."""
+    from flask import g, request
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        start = g.pop("metrics_start", None)
+        endpoint = request.endpoint or "unmatched"
+        if start is not None:
+            REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint)
+        REQUESTS.inc(endpoint=endpoint, status=response.status_code)
+        return response
+
+    REGISTRY.add_collector("engine", app.engine.stats)
+    REGISTRY.add_collector("preprocess", app.pipeline.stats)
+    REGISTRY.add_collector("jobs", app.jobs.stats)
+    REGISTRY.add_collector("face_mesh_pool", app.face_mesh_pool.stats)
+    REGISTRY.add_collector("pad_frames", app.pad_frame_gate.stats)
+    REGISTRY.add_collector("result_cache", app.result_cache.stats)
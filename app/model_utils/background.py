@@ -0,0 +1,139 @@
+import os
+import threading
+
+import cv2
+import numpy as np
+from PIL import Image
+
+
+# ------------------- BACKGROUND REMOVAL -------------------
+# Backends are created once (see create_app) and shared by every request.
+# Heavy sessions are built on first use in each process, so a remover created
+# before gunicorn forks never hands its onnxruntime/MediaPipe threads to a child.
+
+def cutout(image, mask):
+    """Apply a uint8 HxW mask like rembg's naive cutout: RGB scaled by alpha, plus alpha."""
+    alpha = mask[:, :, None].astype(np.uint16)
+    rgba = np.empty(image.shape[:2] + (4,), dtype=np.uint8)
+    rgba[:, :, :3] = (image[:, :, :3].astype(np.uint16) * alpha + 127) // 255
+    rgba[:, :, 3] = mask
+    return rgba
+
+
+def _downscale(image, max_side):
+    h, w = image.shape[:2]
+    scale = max_side / max(h, w) if max_side else 1.0
+    if scale >= 1.0:
+        return image
+    return cv2.resize(image, (max(1, round(w * scale)), max(1, round(h * scale))),
+                      interpolation=cv2.INTER_AREA)
+
+
+class BackgroundRemover:
+    """No-op backend ("off"): returns the image unchanged."""
+    name = "off"
+
+    def remove(self, image):
+        return image
+
+
+class _LazyBackend(BackgroundRemover):
+    def __init__(self, max_side=320):
+        self.max_side = max_side
+        self._model = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _build(self):
+        raise NotImplementedError
+
+    def _get_model(self):
+        if self._model is None or self._pid != os.getpid():
+            with self._lock:
+                if self._model is None or self._pid != os.getpid():
+                    self._model = self._build()
+                    self._pid = os.getpid()
+        return self._model
+
+    def mask(self, image):
+        raise NotImplementedError
+
+    def remove(self, image):
+        """Segment a downscaled copy, upscale the mask and cut out the full-res image."""
+        small = _downscale(image[:, :, :3], self.max_side)
+        mask = self.mask(small)
+        if mask.shape[:2] != image.shape[:2]:
+            mask = cv2.resize(mask, (image.shape[1], image.shape[0]), interpolation=cv2.INTER_LINEAR)
+        return cutout(image, mask)
+
+
+class RembgBackgroundRemover(_LazyBackend):
+    """rembg model (u2net, u2netp, silueta, isnet-general-use, ...) on a persistent session."""
+
+    def __init__(self, model_name="u2net", max_side=320, intra_op_threads=0, inter_op_threads=0):
+        super().__init__(max_side=max_side)
+        self.name = model_name
+        self.intra_op_threads = intra_op_threads
+        self.inter_op_threads = inter_op_threads
+
+    def _build(self):
+        import onnxruntime as ort
+        from rembg.sessions import sessions_class
+
+        sess_opts = ort.SessionOptions()
+        if self.intra_op_threads:
+            sess_opts.intra_op_num_threads = self.intra_op_threads
+        if self.inter_op_threads:
+            sess_opts.inter_op_num_threads = self.inter_op_threads
+
+        for session_class in sessions_class:
+            if session_class.name() == self.name:
+                return session_class(self.name, sess_opts, ["CPUExecutionProvider"])
+        raise ValueError(f"Unknown rembg model: {self.name}")
+
+    def mask(self, image):
+        return np.array(self._get_model().predict(Image.fromarray(image))[0])
+
+
+class MediaPipeBackgroundRemover(_LazyBackend):
+    """MediaPipe selfie segmentation: a much lighter model than U²-Net."""
+    name = "mediapipe"
+
+    def __init__(self, max_side=256):
+        super().__init__(max_side=max_side)
+        self._infer_lock = threading.Lock()
+
+    def _build(self):
+        import mediapipe as mp
+        return mp.solutions.selfie_segmentation.SelfieSegmentation(model_selection=0)
+
+    def mask(self, image):
+        model = self._get_model()
+        with self._infer_lock:  # graph is not thread-safe
+            res = model.process(np.ascontiguousarray(image))
+        return (res.segmentation_mask * 255).clip(0, 255).astype(np.uint8)
+
+
+def create_bg_remover(backend="u2net", max_side=320, intra_op_threads=0, inter_op_threads=0):
+    """Build a background-removal backend by name: "off", "mediapipe" or a rembg model."""
+    if backend in (None, "", "off", "none"):
+        return BackgroundRemover()
+    if backend == "mediapipe":
+        return MediaPipeBackgroundRemover(max_side=max_side)
+    return RembgBackgroundRemover(
+        backend,
+        max_side=max_side,
+        intra_op_threads=intra_op_threads,
+        inter_op_threads=inter_op_threads,
+    )
+
+
+_default_remover = None
+
+
+def get_default_bg_remover():
+    """Shared remover for callers that don't pass their own (full-resolution u2net)."""
+    global _default_remover
+    if _default_remover is None:
+        _default_remover = create_bg_remover("u2net", max_side=0)
+    return _default_remover
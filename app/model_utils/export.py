@@ -0,0 +1,129 @@
+import argparse
+import copy
+import json
+import os
+import sys
+
+import torch
+import torch.nn as nn
+from torch.nn.utils.fusion import fuse_conv_bn_eval, fuse_linear_bn_eval
+
+from app.model_utils.model import set_cbam_fused
+
+
+# -------------------------
+# Inference folding
+# -------------------------
+def _fuse_bottleneck(block):
+    block.conv1 = fuse_conv_bn_eval(block.conv1, block.bn1)
+    block.conv2 = fuse_conv_bn_eval(block.conv2, block.bn2)
+    block.conv3 = fuse_conv_bn_eval(block.conv3, block.bn3)
+    block.bn1 = block.bn2 = block.bn3 = nn.Identity()
+    if block.downsample is not None:
+        block.downsample = nn.Sequential(fuse_conv_bn_eval(block.downsample[0], block.downsample[1]))
+
+
+def fold_coral_head(head):
+    """Fold CORALHead for inference: fc1+bn1 fused, dropouts removed."""
+    head.fc1 = fuse_linear_bn_eval(head.fc1, head.bn1)
+    head.bn1 = nn.Identity()
+    head.dropout1 = nn.Identity()
+    head.dropout2 = nn.Identity()
+    return head
+
+
+def fold_for_inference(model):
+    """Return an eval-mode copy of AgePredictionCORAL with every BatchNorm
+    folded into the preceding conv/linear and dropout removed."""
+    model = copy.deepcopy(model).eval()
+
+    model.stem[0] = fuse_conv_bn_eval(model.stem[0], model.stem[1])
+    model.stem[1] = nn.Identity()
+    for layer in (model.layer1, model.layer2, model.layer3, model.layer4):
+        for block in layer[0]:   # layer = Sequential(resnet layer, CBAM)
+            _fuse_bottleneck(block)
+
+    fold_coral_head(model.coral)
+    return model
+
+
+class OptimizedAgeModel(nn.Module):
+    """Serving graph for AgePredictionCORAL: BN folded, fused CBAM kernels,
+    channels_last weights and inputs, and optional bf16 autocast. Always
+    returns fp32 logits."""
+
+    def __init__(self, model, bf16=False):
+        super().__init__()
+        self.model = set_cbam_fused(fold_for_inference(model)).to(memory_format=torch.channels_last)
+        self.bf16 = bf16
+
+    def forward(self, x):
+        x = x.contiguous(memory_format=torch.channels_last)
+        with torch.autocast(x.device.type, dtype=torch.bfloat16, enabled=self.bf16):
+            return self.model(x).float()
+
+
+# -------------------------
+# Exporters
+# -------------------------
+def export_onnx(model, path, input_size=224, opset=17):
+    dummy = torch.randn(1, 3, input_size, input_size)
+    torch.onnx.export(
+        model, dummy, path,
+        input_names=["input"],
+        output_names=["logits"],
+        dynamic_axes={"input": {0: "batch"}, "logits": {0: "batch"}},
+        opset_version=opset,
+        do_constant_folding=True,
+    )
+    return path
+
+
+def export_torchscript(model, path, input_size=224):
+    dummy = torch.randn(1, 3, input_size, input_size)
+    with torch.no_grad():
+        traced = torch.jit.trace(model, dummy)
+    frozen = torch.jit.freeze(traced)
+    torch.jit.save(frozen, path)
+    return path
+
+
+EXPORTERS = {
+    "onnx": (export_onnx, ".onnx"),
+    "torchscript": (export_torchscript, ".ts.pt"),
+}
+
+
+def main(argv=None):
+    from app.config import Config
+    from app.load_model import load_model_pt
+    from app.model_utils.parity import compare_models
+
+    parser = argparse.ArgumentParser(description="Export AgePredictionCORAL for ONNX Runtime / TorchScript serving.")
+    parser.add_argument("--checkpoint", default=Config.MODEL_PATH)
+    parser.add_argument("--out-dir", default=os.path.dirname(Config.MODEL_PATH))
+    parser.add_argument("--name", default="age_model")
+    parser.add_argument("--formats", nargs="+", choices=sorted(EXPORTERS), default=sorted(EXPORTERS))
+    parser.add_argument("--atol", type=float, default=1e-3, help="max logit difference allowed by the parity check")
+    args = parser.parse_args(argv)
+
+    eager = load_model_pt(args.checkpoint, device="cpu", num_classes=Config.NUM_CLASSES)
+    folded = fold_for_inference(eager)
+    os.makedirs(args.out_dir, exist_ok=True)
+
+    ok = True
+    for fmt in args.formats:
+        exporter, suffix = EXPORTERS[fmt]
+        path = exporter(folded, os.path.join(args.out_dir, args.name + suffix))
+        served = load_model_pt(args.checkpoint, device="cpu", num_classes=Config.NUM_CLASSES,
+                               backend=fmt, artifact_path=path)
+        report = compare_models(eager, served, atol=args.atol)
+        ok &= report["passed"]
+        print(f"{fmt}: {path}")
+        print(json.dumps(report, indent=2))
+
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
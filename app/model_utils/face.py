@@ -0,0 +1,95 @@
+import logging
+import os
+import threading
+
+import cv2
+
+log = logging.getLogger(__name__)
+
+
+# ------------------------------
+# Face localization
+# ------------------------------
+class FaceDetector:
+    """MediaPipe short/full-range face detector.
+
+    The graph is built lazily in the calling process (MediaPipe objects don't
+    survive a fork) and calls are serialized, since it is not thread-safe.
+    Images are shrunk to ``max_side`` before detection; boxes are returned in
+    normalized (x1, y1, x2, y2) coordinates, so they apply to the original.
+    If mediapipe is not installed, detect() always returns None.
+    """
+
+    def __init__(self, min_confidence=0.5, model_selection=1, max_side=640):
+        self.min_confidence = min_confidence
+        self.model_selection = model_selection
+        self.max_side = max_side
+        self._model = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._available = True
+
+    def _get_model(self):
+        if self._model is None or self._pid != os.getpid():
+            try:
+                import mediapipe as mp
+            except ImportError:
+                log.warning("mediapipe not installed, face cropping disabled")
+                self._available = False
+                return None
+            self._model = mp.solutions.face_detection.FaceDetection(
+                model_selection=self.model_selection,
+                min_detection_confidence=self.min_confidence,
+            )
+            self._pid = os.getpid()
+        return self._model
+
+    def detect(self, image):
+        """Largest face in an RGB(A) image as normalized (x1, y1, x2, y2), or None."""
+        if not self._available:
+            return None
+        image = image[:, :, :3]
+        h, w = image.shape[:2]
+        scale = self.max_side / max(h, w) if self.max_side else 1.0
+        if scale < 1.0:
+            image = cv2.resize(image, (round(w * scale), round(h * scale)), interpolation=cv2.INTER_AREA)
+
+        with self._lock:
+            model = self._get_model()
+            if model is None:
+                return None
+            res = model.process(image)
+
+        if not res.detections:
+            return None
+        boxes = [d.location_data.relative_bounding_box for d in res.detections]
+        box = max(boxes, key=lambda b: b.width * b.height)
+        return (box.xmin, box.ymin, box.xmin + box.width, box.ymin + box.height)
+
+
+def crop_face(image, box, target_size=(224, 224), padding=0.3):
+    """Crop a normalized face box, expanded by ``padding`` of its size on each
+    side, and resize it to ``target_size``."""
+    h, w = image.shape[:2]
+    x1, y1, x2, y2 = box
+    pad_w, pad_h = (x2 - x1) * padding, (y2 - y1) * padding
+
+    x1 = max(0, int((x1 - pad_w) * w))
+    y1 = max(0, int((y1 - pad_h) * h))
+    x2 = min(w, int(round((x2 + pad_w) * w)))
+    y2 = min(h, int(round((y2 + pad_h) * h)))
+
+    face = image[y1:y2, x1:x2]
+    if face.size == 0:
+        return cv2.resize(image, target_size)
+    return cv2.resize(face, target_size, interpolation=cv2.INTER_AREA)
+
+
+_default_detector = None
+
+
+def get_face_detector():
+    global _default_detector
+    if _default_detector is None:
+        _default_detector = FaceDetector()
+    return _default_detector
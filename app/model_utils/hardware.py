@@ -0,0 +1,27 @@
+import torch
+
+
+def cpu_has_bf16():
+    """True when the CPU has native bf16 math (AVX512-BF16 or AMX)."""
+    try:
+        with open("/proc/cpuinfo") as f:
+            flags = f.read()
+    except OSError:
+        return False
+    return "avx512_bf16" in flags or "amx_bf16" in flags
+
+
+def bf16_supported(device="cpu"):
+    """Whether bf16 autocast is worth enabling on ``device``."""
+    if str(device).startswith("cuda"):
+        return torch.cuda.is_available() and torch.cuda.is_bf16_supported()
+    return cpu_has_bf16()
+
+
+def resolve_bf16(setting, device="cpu"):
+    """"on"/"off"/"auto" (or a bool) -> bool."""
+    if isinstance(setting, bool):
+        return setting
+    if setting == "auto":
+        return bf16_supported(device)
+    return setting in ("on", "1", "true", "yes")
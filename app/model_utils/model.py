@@ -1,7 +1,6 @@
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
-import torchvision.models as models
 import numpy as np
 
 
@@ -9,36 +8,60 @@ import numpy as np
 # CBAM Module
 # -------------------------
 class ChannelAttention(nn.Module):
-    def __init__(self, in_planes, ratio=16):
+    def __init__(self, in_planes, ratio=16, fused=False):
         super().__init__()
         self.fc1 = nn.Conv2d(in_planes, in_planes // ratio, 1, bias=False)
         self.fc2 = nn.Conv2d(in_planes // ratio, in_planes, 1, bias=False)
+        self.fused = fused
 
     def forward(self, x):
+        if self.fused:
+            return self._forward_fused(x)
         avg_out = self.fc2(F.relu(self.fc1(F.adaptive_avg_pool2d(x, 1))))
         max_out = self.fc2(F.relu(self.fc1(F.adaptive_max_pool2d(x, 1))))
         out = torch.sigmoid(avg_out + max_out)
         return out * x
 
+    def _forward_fused(self, x):
+        # fc1 once over the stacked (2B, C, 1, 1) descriptors; fc2 is linear,
+        # so fc2(a) + fc2(b) == fc2(a + b) and it runs once on the sum
+        B = x.shape[0]
+        pooled = torch.cat([F.adaptive_avg_pool2d(x, 1), F.adaptive_max_pool2d(x, 1)])
+        hidden = F.relu(self.fc1(pooled))
+        out = torch.sigmoid(self.fc2(hidden[:B] + hidden[B:]))
+        return out * x
+
 
 class SpatialAttention(nn.Module):
-    def __init__(self, kernel_size=7):
+    def __init__(self, kernel_size=7, fused=False):
         super().__init__()
         self.conv1 = nn.Conv2d(2, 1, kernel_size, padding=kernel_size // 2, bias=False)
+        self.fused = fused
 
     def forward(self, x):
+        if self.fused:
+            return self._forward_fused(x)
         avg_out = torch.mean(x, dim=1, keepdim=True)
         max_out, _ = torch.max(x, dim=1, keepdim=True)
         x_cat = torch.cat([avg_out, max_out], dim=1)
         out = torch.sigmoid(self.conv1(x_cat))
         return out * x
 
+    def _forward_fused(self, x):
+        # conv(cat([avg, max])) == conv(avg, w[:, :1]) + conv(max, w[:, 1:]):
+        # no (B, 2, H, W) intermediate, and the sum/sigmoid happen in place
+        w = self.conv1.weight
+        pad = self.conv1.padding
+        out = F.conv2d(x.mean(dim=1, keepdim=True), w[:, :1], padding=pad)
+        out += F.conv2d(x.amax(dim=1, keepdim=True), w[:, 1:], padding=pad)
+        return out.sigmoid_() * x
+
 
 class CBAM(nn.Module):
-    def __init__(self, in_planes):
+    def __init__(self, in_planes, fused=False):
         super().__init__()
-        self.ca = ChannelAttention(in_planes)
-        self.sa = SpatialAttention()
+        self.ca = ChannelAttention(in_planes, fused=fused)
+        self.sa = SpatialAttention(fused=fused)
 
     def forward(self, x):
         x = self.ca(x)
@@ -46,6 +69,17 @@ class CBAM(nn.Module):
         return x
 
 
+def set_cbam_fused(model, fused=True):
+    """Switch every CBAM in ``model`` to the fused inference kernels (or back).
+
+    The fused forms use the same parameters, so checkpoints load either way.
+    """
+    for module in model.modules():
+        if isinstance(module, (ChannelAttention, SpatialAttention)):
+            module.fused = fused
+    return model
+
+
 # -------------------------
 # CORAL Head
 # -------------------------
@@ -91,9 +125,14 @@ def init_coral_biases(head: CORALHead, class_counts):
 # Full Model (ResNet50 + CBAM + CORAL Head)
 # -------------------------
 class AgePredictionCORAL(nn.Module):
-    def __init__(self, num_classes=44):
+    def __init__(self, num_classes=44, pretrained=True):
         super().__init__()
-        backbone = models.resnet50(pretrained=True)
+        # ImageNet weights only matter when training from scratch; serving
+        # overwrites them with the checkpoint, so load_model_pt passes False.
+        from torchvision import models  # deferred: ~2 s of import time
+
+        weights = models.ResNet50_Weights.IMAGENET1K_V1 if pretrained else None
+        backbone = models.resnet50(weights=weights)
 
         # Keep backbone conv layers
         self.stem = nn.Sequential(
@@ -125,30 +164,39 @@ class AgePredictionCORAL(nn.Module):
 # -------------------------
 # CORAL Loss
 # -------------------------
+def ordinal_targets(labels, num_thresholds, device=None, dtype=torch.float32):
+    """(B, K-1) CORAL targets: row i has ones in its first labels[i] columns."""
+    labels = torch.as_tensor(labels, device=device)
+    thresholds = torch.arange(num_thresholds, device=labels.device)
+    return (thresholds < labels[:, None]).to(dtype)
+
+
+def _pos_weight(pos_weights, logits):
+    if pos_weights is None:
+        return None
+    return torch.as_tensor(pos_weights, dtype=logits.dtype, device=logits.device)
+
+
 def coral_loss_v0(logits, labels, num_classes, device, pos_weights=None):
     B, K_minus1 = logits.shape
-    ord_targets = torch.zeros((B, K_minus1), device=device)
-    for i in range(B):
-        ord_targets[i, :labels[i]] = 1
-    if pos_weights is not None:
-        pos_weights = torch.tensor(pos_weights, device=device)
+    ord_targets = ordinal_targets(labels, K_minus1, device=logits.device, dtype=logits.dtype)
     loss = F.binary_cross_entropy_with_logits(
-        logits, ord_targets, pos_weight=pos_weights, reduction="mean"
+        logits, ord_targets, pos_weight=_pos_weight(pos_weights, logits), reduction="mean"
     )
     return loss
 
 
-def coral_loss(logits, labels, num_classes, device, pos_weights=None, smoothing=0.1):
+def coral_loss(logits, labels, num_classes, device, pos_weights=None, smoothing=0.1, ord_targets=None):
+    """``ord_targets`` (e.g. mixed targets) replaces the ones built from ``labels``."""
     B, K_minus1 = logits.shape
-    ord_targets = torch.zeros((B, K_minus1), device=device)
-    for i in range(B):
-        ord_targets[i, :labels[i]] = 1
+    if ord_targets is None:
+        ord_targets = ordinal_targets(labels, K_minus1, device=logits.device, dtype=logits.dtype)
     if smoothing > 0:
         ord_targets = ord_targets * (1 - smoothing) + 0.5 * smoothing
     loss = F.binary_cross_entropy_with_logits(
         logits,
         ord_targets,
-        pos_weight=None if pos_weights is None else torch.tensor(pos_weights, device=device),
+        pos_weight=_pos_weight(pos_weights, logits),
         reduction="mean"
     )
     return loss
@@ -167,9 +215,14 @@ def mixup_data(x, y, alpha=0.4, max_delta=5):
     return mixed_x, y, y[perm], lam
 
 
-def mixup_coral_loss(logits, y_a, y_b, lam, num_classes, device):
-    return lam * coral_loss(logits, y_a, num_classes, device) + \
-           (1 - lam) * coral_loss(logits, y_b, num_classes, device)
+def mixup_coral_loss(logits, y_a, y_b, lam, num_classes, device, pos_weights=None):
+    # BCE is linear in the target (and so is label smoothing), so one loss on
+    # the mixed targets equals lam * loss(y_a) + (1 - lam) * loss(y_b)
+    K_minus1 = logits.shape[1]
+    t_a = ordinal_targets(y_a, K_minus1, device=logits.device, dtype=logits.dtype)
+    t_b = ordinal_targets(y_b, K_minus1, device=logits.device, dtype=logits.dtype)
+    mixed = torch.lerp(t_b, t_a, lam)
+    return coral_loss(logits, None, num_classes, device, pos_weights=pos_weights, ord_targets=mixed)
 
 
 # -------------------------
@@ -194,14 +247,12 @@ idx_to_class = {
 }
 
 def coral_decode(logits, threshold=0.5, idx_to_class=idx_to_class):
+    """Decode (B, K-1) CORAL logits into one age per sample."""
     probs = torch.sigmoid(logits) 
     pred_idx = torch.sum(probs > threshold, dim=1)  
 
     if idx_to_class:
-        pred_ages = [class_to_age(idx_to_class[i.item()]) for i in pred_idx]
-        print(pred_ages[0])
-        
-        return pred_ages[0]
+        return [class_to_age(idx_to_class[i]) for i in pred_idx.tolist()]
     return pred_idx
 
 
@@ -0,0 +1,107 @@
+import argparse
+import json
+import sys
+import time
+
+import torch
+
+from app.model_utils.model import coral_decode
+
+
+# -------------------------
+# Output parity between two model variants
+# -------------------------
+def random_inputs(num_samples=8, size=224, seed=0):
+    """ImageNet-normalized-looking inputs: roughly zero mean, unit variance."""
+    gen = torch.Generator().manual_seed(seed)
+    return torch.randn(num_samples, 3, size, size, generator=gen)
+
+
+def compare_models(reference, candidate, inputs=None, batch_size=4, atol=1e-3):
+    """Compare logits and decoded ages of ``candidate`` against ``reference``.
+
+    Both are callables mapping an (N, 3, H, W) float tensor to (N, K-1)
+    logits (eager modules, TorchScript modules, OnnxAgeModel, ...).
+    """
+    if inputs is None:
+        inputs = random_inputs()
+
+    ref_logits, cand_logits = [], []
+    with torch.no_grad():
+        for start in range(0, inputs.size(0), batch_size):
+            batch = inputs[start:start + batch_size]
+            ref_logits.append(reference(batch).float().cpu())
+            cand_logits.append(candidate(batch).float().cpu())
+    ref_logits = torch.cat(ref_logits)
+    cand_logits = torch.cat(cand_logits)
+
+    ref_ages = coral_decode(ref_logits)
+    cand_ages = coral_decode(cand_logits)
+    agree = sum(a == b for a, b in zip(ref_ages, cand_ages))
+    max_diff = (ref_logits - cand_logits).abs().max().item()
+
+    return {
+        "samples": len(ref_ages),
+        "max_abs_logit_diff": max_diff,
+        "age_agreement": agree / len(ref_ages),
+        "max_age_diff": max(abs(a - b) for a, b in zip(ref_ages, cand_ages)),
+        "passed": max_diff <= atol,
+    }
+
+
+def _latency_ms(model, inputs, runs=10, warmup=2):
+    with torch.no_grad():
+        for _ in range(warmup):
+            model(inputs)
+        start = time.perf_counter()
+        for _ in range(runs):
+            model(inputs)
+    return (time.perf_counter() - start) * 1000.0 / runs
+
+
+# -------------------------
+# CLI: eager vs inference-optimized graph
+# -------------------------
+def main(argv=None):
+    from app.config import Config
+    from app.load_model import load_model_pt
+    from app.model_utils.export import OptimizedAgeModel
+    from app.model_utils.hardware import resolve_bf16
+
+    parser = argparse.ArgumentParser(description="Check MODEL_OPTIMIZE output parity against the eager model.")
+    parser.add_argument("--checkpoint", default=Config.MODEL_PATH)
+    parser.add_argument("--image-dir", help="preprocess real faces from here instead of random inputs")
+    parser.add_argument("--samples", type=int, default=16)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--atol", type=float, default=1e-3, help="max logit difference for the fp32 graph")
+    parser.add_argument("--bf16", default=Config.MODEL_BF16, choices=["auto", "on", "off"])
+    parser.add_argument("--bf16-atol", type=float, default=0.1, help="max logit difference under bf16")
+    args = parser.parse_args(argv)
+
+    eager = load_model_pt(args.checkpoint, device="cpu", num_classes=Config.NUM_CLASSES)
+    if args.image_dir:
+        from app.model_utils.quantize import load_face_folder
+        inputs, _ = load_face_folder(args.image_dir, limit=args.samples)
+    else:
+        inputs = random_inputs(args.samples)
+
+    variants = {"optimized": (OptimizedAgeModel(eager).eval(), args.atol)}
+    if resolve_bf16(args.bf16):
+        variants["optimized_bf16"] = (OptimizedAgeModel(eager, bf16=True).eval(), args.bf16_atol)
+
+    batch = inputs[:args.batch_size]
+    report = {"eager_latency_ms": _latency_ms(eager, batch)}
+    ok = True
+    for name, (model, atol) in variants.items():
+        result = compare_models(eager, model, inputs, batch_size=args.batch_size, atol=atol)
+        result["latency_ms"] = _latency_ms(model, batch)
+        result["speedup"] = report["eager_latency_ms"] / result["latency_ms"]
+        report[name] = result
+        ok &= result["passed"]
+
+    print(json.dumps(report, indent=2))
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
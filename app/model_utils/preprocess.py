@@ -2,8 +2,14 @@
 import cv2
 import numpy as np
 # from mtcnn import MTCNN
-import albumentations as A
-import os, time
+import os, time, threading
+from contextlib import nullcontext
+from functools import lru_cache
+
+import torch
+from app.model_utils.background import get_default_bg_remover
+from app.model_utils.face import crop_face, get_face_detector
+from app.metrics import event_log, recording, timed
 
 # ------------------- FACE DETECTOR -------------------
 # DETECTOR = MTCNN()
@@ -58,6 +64,17 @@ import os, time
 #     return detect_and_crop_face(aligned, target_size)
 
 
+def detect_and_crop_face(image, target_size=(224, 224), padding=0.3, box=None):
+    """Crop the largest face (MediaPipe detector) or the given normalized
+    ``box``; falls back to resizing the full image when there is no face."""
+    if box is None:
+        box = get_face_detector().detect(image)
+    if box is None:
+        event_log.log("no_face_detected", fallback="resize_full_image")
+        return cv2.resize(image, target_size)
+    return crop_face(image, box, target_size=target_size, padding=padding)
+
+
 # ------------------- PREPROCESSING STEPS -------------------
 def resize_only(image, size=(224, 224)):
     return cv2.resize(image, size)
@@ -97,20 +114,25 @@ def high_freq_emphasis(image):
 
 
 # ------------------- AUGMENTATION -------------------
-augmentation_seq = A.Compose([
-    A.HorizontalFlip(p=0.5),
-    A.ShiftScaleRotate(shift_limit=0, scale_limit=0.1, rotate_limit=10, p=0.7),
-    A.RandomBrightnessContrast(p=0.5),
-    A.GaussNoise(var_limit=(0, 0.02*255), p=0.5),
-])
+# Training only: albumentations is imported on first use, not by the server
+@lru_cache(maxsize=None)
+def get_augmentation_seq():
+    import albumentations as A
+
+    return A.Compose([
+        A.HorizontalFlip(p=0.5),
+        A.ShiftScaleRotate(shift_limit=0, scale_limit=0.1, rotate_limit=10, p=0.7),
+        A.RandomBrightnessContrast(p=0.5),
+        A.GaussNoise(var_limit=(0, 0.02*255), p=0.5),
+    ])
 
 def augment_image(image):
-    return augmentation_seq(image=image)["image"]
+    return get_augmentation_seq()(image=image)["image"]
 
 
 # ------------------- PIPELINE CONFIG -------------------
 PIPELINE_FUNCS = {
-    # 1: detect_and_crop_face,
+    1: detect_and_crop_face,
     # 2: align_face,
     3: resize_only,
     4: yuv_hist_equalization,
@@ -133,7 +155,8 @@ def preprocess_pipeline(image, order=None, augment=False):
             continue
         func = PIPELINE_FUNCS.get(step)
         if func is not None:
-            image = func(image)
+            with timed(f"step_{step}_{func.__name__}"):
+                image = func(image)
 
     if augment:
         image = PIPELINE_FUNCS[8](image)
@@ -141,8 +164,196 @@ def preprocess_pipeline(image, order=None, augment=False):
     return image
 
 
+# ------------------- INFERENCE INPUT -------------------
+_MEAN = torch.tensor([0.485, 0.456, 0.406]).view(3, 1, 1)
+_STD = torch.tensor([0.229, 0.224, 0.225]).view(3, 1, 1)
+
+
+def post_transform(image):
+    """HWC image -> normalized CHW float tensor, exactly as torchvision's
+    ToTensor + Normalize(ImageNet mean/std), without importing torchvision."""
+    x = torch.from_numpy(np.ascontiguousarray(image.transpose(2, 0, 1)))
+    if x.dtype == torch.uint8:
+        x = x.float().div(255)
+    return x.sub(_MEAN.to(x.dtype)).div(_STD.to(x.dtype))
+
+
+def load_image(img_path):
+    img = cv2.imread(img_path)
+    if img is None:
+        raise ValueError(f"Could not read image: {img_path}")
+    return cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+
+
+def decode_image(data):
+    """Decode encoded image bytes (JPEG/PNG/...) into an RGB array."""
+    img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError("Could not decode image")
+    return cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+
+
+def crop_first(img, order, face_box=None):
+    """Run the face crop (step 1) up front, so background removal and every
+    later step only see the face region. Returns (image, remaining order)."""
+    if 1 not in order:
+        return img, order
+    return detect_and_crop_face(img, box=face_box), [s for s in order if s != 1]
+
+
+def preprocess_array(img, order=None, artifacts=None, bg_remover=None, face_box=None):
+    """Background removal + pipeline + tensor conversion for an RGB array.
+
+    ``bg_remover`` is a backend from model_utils.background (the app passes
+    the one built in create_app); None uses the default u2net remover.
+    With step 1 in ``order`` the face is cropped before background removal,
+    using ``face_box`` (normalized x1, y1, x2, y2) when given instead of
+    running the detector; ``order`` defaults to the serving PREPROCESS_ORDER.
+    Everything stays in memory. If ``artifacts`` is a dict, the background
+    removed and preprocessed intermediates are stored in it under ``_bg_rm``
+    and ``_pre`` so the caller can hand them to a DebugArtifactWriter.
+    Returns a (1, 3, H, W) tensor.
+    """
+    if order is None:
+        from app.config import Config
+        order = Config.PREPROCESS_ORDER
+
+    # ---- Face crop ----
+    with timed("face_crop"):
+        img, order = crop_first(img, order, face_box)
+
+    # ---- Background Removal ----
+    if bg_remover is None:
+        bg_remover = get_default_bg_remover()
+    with timed("bg_removal"):
+        img_no_bg = bg_remover.remove(img)   # RGBA (may have transparency)
+
+    # ---- Preprocessing ----
+    img_proc = preprocess_pipeline(img_no_bg, order=order, augment=False)
+
+    if artifacts is not None:
+        artifacts["_bg_rm"] = img_no_bg
+        artifacts["_pre"] = img_proc
+
+    # ---- Torch Transform ----
+    with timed("to_tensor"):
+        return post_transform(img_proc).unsqueeze(0)  # Add batch dimension
+
+
+def preprocess_image(img_path, order=None, artifacts=None, bg_remover=None, face_box=None):
+    return preprocess_array(load_image(img_path), order=order, artifacts=artifacts,
+                            bg_remover=bg_remover, face_box=face_box)
+
+
+# ------------------- BATCHED PIPELINE -------------------
+IMAGENET_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32).reshape(1, 3, 1, 1)
+IMAGENET_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32).reshape(1, 3, 1, 1)
+
+_local = threading.local()
+
+
+def _clahe():
+    # One CLAHE object per thread instead of one per call (same parameters as apply_CLAHE)
+    if not hasattr(_local, "clahe"):
+        _local.clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+    return _local.clahe
+
+
+def _into(dst, like):
+    """Use ``dst`` as an OpenCV output buffer when the result will fit in it."""
+    return dst if dst.shape == like.shape else None
+
+
+def _yuv_eq_clahe(image, dst):
+    """Steps 4 + 6 back to back, sharing one scratch buffer and writing into ``dst``."""
+    yuv = cv2.cvtColor(image, cv2.COLOR_RGB2YUV)
+    yuv[:, :, 0] = cv2.equalizeHist(yuv[:, :, 0])
+    rgb = cv2.cvtColor(yuv, cv2.COLOR_YUV2RGB, dst=_into(dst, yuv))
+    lab = cv2.cvtColor(rgb, cv2.COLOR_RGB2LAB, dst=yuv)   # reuse the YUV buffer for LAB
+    lab[:, :, 0] = _clahe().apply(lab[:, :, 0])
+    return cv2.cvtColor(lab, cv2.COLOR_LAB2RGB, dst=rgb)
+
+
+class BatchPreprocessor:
+    """preprocess_pipeline + post_transform over a stack of images.
+
+    Produces the (N, 3, H, W) float32 batch the model takes, matching
+    ``post_transform(preprocess_pipeline(img, order))`` per image. uint8 steps
+    write into a preallocated NHWC staging buffer (steps 4 + 6 share one
+    scratch buffer) and the /255 + ImageNet mean/std normalization runs once
+    over the whole batch, in place in a preallocated NCHW output buffer.
+    Buffers grow to the largest batch seen and are reused, so the returned
+    array is only valid until the next call.
+    """
+
+    def __init__(self, order=None, size=(224, 224)):
+        order = [s for s in (DEFAULT_ORDER if order is None else order) if s != 8]
+        if 9 in order and order.index(9) != len(order) - 1:
+            raise ValueError("BatchPreprocessor needs normalize (9) as the last step")
+        self.steps = [s for s in order if s != 9]
+        self.size = size
+        self._stage = None
+        self._out = None
+
+    def _buffers(self, n):
+        w, h = self.size
+        if self._stage is None or self._stage.shape[0] < n:
+            self._stage = np.empty((n, h, w, 3), dtype=np.uint8)
+            self._out = np.empty((n, 3, h, w), dtype=np.float32)
+        return self._stage[:n], self._out[:n]
+
+    def _run_steps(self, image, dst, record=True):
+        # Stage names match preprocess_pipeline's; the fused 4 + 6 pair is one stage.
+        # ``record`` is passed in because pool threads don't see the caller's unrecorded()
+        steps = self.steps
+        i = 0
+        while i < len(steps):
+            step = steps[i]
+            if step == 4 and i + 1 < len(steps) and steps[i + 1] == 6:
+                with timed("step_4_6_yuv_eq_clahe") if record else nullcontext():
+                    image = _yuv_eq_clahe(image, dst)
+                i += 2
+                continue
+            with timed(f"step_{step}_{PIPELINE_FUNCS[step].__name__}") if record else nullcontext():
+                if step == 6:
+                    lab = cv2.cvtColor(image, cv2.COLOR_RGB2LAB)
+                    lab[:, :, 0] = _clahe().apply(lab[:, :, 0])
+                    image = cv2.cvtColor(lab, cv2.COLOR_LAB2RGB, dst=_into(dst, lab))
+                else:
+                    image = PIPELINE_FUNCS[step](image)
+            i += 1
+
+        if image.shape != dst.shape:
+            raise ValueError(f"Pipeline produced {image.shape}, expected {dst.shape}")
+        if image is not dst:
+            np.copyto(dst, image)
+
+    def __call__(self, images, pool=None):
+        stage, out = self._buffers(len(images))
+        record = recording()
+        if pool is None:
+            for i, image in enumerate(images):
+                self._run_steps(image, stage[i], record)
+        else:
+            list(pool.map(lambda i: self._run_steps(images[i], stage[i], record), range(len(images))))
+
+        # Same op order as normalize() + ToTensor + Normalize so results match exactly
+        with timed("step_9_normalize_batch"):
+            np.divide(stage.transpose(0, 3, 1, 2), np.float32(255.0), out=out)
+            np.subtract(out, IMAGENET_MEAN, out=out)
+            np.divide(out, IMAGENET_STD, out=out)
+        return out
+
+
+def preprocess_batch(images, order=None, pool=None):
+    """One-shot helper around BatchPreprocessor; returns a new (N, 3, H, W) array."""
+    return BatchPreprocessor(order)(images, pool=pool).copy()
+
+
 # ------------------- BENCHMARK -------------------
 def benchmark_pipeline(image_dir, num_images=50, augment=False, order=None):
+    """Quick timing of preprocess_pipeline alone; see benchmarks.request_path
+    for the full per-stage request benchmark."""
     image_files = [
         os.path.join(image_dir, f) for f in os.listdir(image_dir)
         if f.lower().endswith(('.png', '.jpg', '.jpeg'))
@@ -157,9 +368,9 @@ def benchmark_pipeline(image_dir, num_images=50, augment=False, order=None):
         # Convert to RGB
         image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
 
-        start = time.time()
+        start = time.perf_counter()
         _ = preprocess_pipeline(image, order, augment)
-        times.append(time.time() - start)
+        times.append(time.perf_counter() - start)
 
     avg_time = np.mean(times)
     total_time = np.sum(times)
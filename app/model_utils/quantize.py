@@ -0,0 +1,179 @@
+import argparse
+import copy
+import io
+import json
+import os
+import statistics
+import sys
+import time
+
+import torch
+import torch.nn as nn
+from torch.ao.quantization import get_default_qconfig_mapping, quantize_dynamic
+from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+from app.model_utils.export import fold_coral_head
+from app.model_utils.model import class_to_age, coral_decode
+
+
+# -------------------------
+# INT8 post-training quantization
+# -------------------------
+def quantize_model(model, calibration_batches, engine="x86"):
+    """Static PTQ of the ResNet50+CBAM backbone, dynamic INT8 for the CORAL head.
+
+    FX graph mode fuses conv-bn-relu in the stem and every bottleneck, and
+    observers are calibrated on ``calibration_batches``. CORALHead is left out
+    of static quantization (its fc1+bn1 are folded first) and its linears get
+    dynamic quantization instead.
+    """
+    torch.backends.quantized.engine = engine
+    model = copy.deepcopy(model).cpu().eval()
+    fold_coral_head(model.coral)
+
+    qconfig_mapping = get_default_qconfig_mapping(engine).set_module_name("coral", None)
+    prepared = prepare_fx(model, qconfig_mapping, example_inputs=(calibration_batches[0],))
+    with torch.no_grad():
+        for batch in calibration_batches:
+            prepared(batch)
+    quantized = convert_fx(prepared)
+    return quantize_dynamic(quantized, {nn.Linear}, dtype=torch.qint8)
+
+
+def save_quantized(model, path, input_size=224):
+    example = torch.randn(1, 3, input_size, input_size)
+    with torch.no_grad():
+        scripted = torch.jit.trace(model, example)
+    torch.jit.save(scripted, path)
+    return path
+
+
+# -------------------------
+# Calibration / evaluation data
+# -------------------------
+def load_face_folder(image_dir, limit=None, bg_remover=None, order=None):
+    """Preprocess images under ``image_dir`` like /predict does (``order``
+    defaults to the serving PREPROCESS_ORDER).
+
+    Returns (tensor, ages) where ages holds the label parsed from each image's
+    parent folder name (e.g. ``23`` or ``below_8``) or None when there isn't one.
+    """
+    from app.bulk import iter_directory
+    from app.model_utils.preprocess import decode_image, preprocess_array
+
+    tensors, ages = [], []
+    for name, data in iter_directory(image_dir):
+        try:
+            tensors.append(preprocess_array(decode_image(data), order=order, bg_remover=bg_remover))
+        except ValueError:
+            continue
+        try:
+            ages.append(class_to_age(os.path.basename(os.path.dirname(name))))
+        except ValueError:
+            ages.append(None)
+        if limit and len(tensors) >= limit:
+            break
+    if not tensors:
+        raise ValueError(f"No usable images in {image_dir}")
+    return torch.cat(tensors), ages
+
+
+# -------------------------
+# fp32 vs int8 report
+# -------------------------
+def _latency_ms(model, inputs, runs=20, warmup=3):
+    times = []
+    with torch.no_grad():
+        for i in range(warmup + runs):
+            start = time.perf_counter()
+            model(inputs)
+            if i >= warmup:
+                times.append((time.perf_counter() - start) * 1000.0)
+    return {"p50": statistics.median(times), "mean": statistics.fmean(times)}
+
+
+def _serialized_mb(model):
+    buf = io.BytesIO()
+    if isinstance(model, torch.jit.ScriptModule):
+        torch.jit.save(model, buf)
+    else:
+        torch.save(model.state_dict(), buf)
+    return buf.tell() / 2**20
+
+
+def _predict(model, inputs, batch_size=16):
+    ages = []
+    with torch.no_grad():
+        for start in range(0, inputs.size(0), batch_size):
+            ages.extend(coral_decode(model(inputs[start:start + batch_size])))
+    return ages
+
+
+def compare_report(fp32, int8, inputs, labels):
+    fp32_ages = _predict(fp32, inputs)
+    int8_ages = _predict(int8, inputs)
+
+    batch8 = inputs[torch.arange(8) % inputs.size(0)]
+    report = {"images": len(fp32_ages)}
+    for name, model in (("fp32", fp32), ("int8", int8)):
+        report[name] = {
+            "latency_bs1_ms": _latency_ms(model, inputs[:1]),
+            "latency_bs8_ms": _latency_ms(model, batch8),
+            "model_size_mb": _serialized_mb(model),
+        }
+    report["int8_vs_fp32_mean_abs_age_diff"] = statistics.fmean(
+        abs(a - b) for a, b in zip(fp32_ages, int8_ages)
+    )
+
+    labelled = [(f, q, y) for f, q, y in zip(fp32_ages, int8_ages, labels) if y is not None]
+    if labelled:
+        report["fp32"]["mae"] = statistics.fmean(abs(f - y) for f, _, y in labelled)
+        report["int8"]["mae"] = statistics.fmean(abs(q - y) for _, q, y in labelled)
+        report["mae_delta"] = report["int8"]["mae"] - report["fp32"]["mae"]
+
+    for key in ("latency_bs1_ms", "latency_bs8_ms"):
+        report[f"{key}_speedup"] = report["fp32"][key]["p50"] / report["int8"][key]["p50"]
+    report["size_ratio"] = report["int8"]["model_size_mb"] / report["fp32"]["model_size_mb"]
+    return report
+
+
+def main(argv=None):
+    from app.config import Config
+    from app.load_model import load_model_pt
+    from app.model_utils.background import create_bg_remover
+
+    parser = argparse.ArgumentParser(description="Calibrate and export an INT8 AgePredictionCORAL.")
+    parser.add_argument("--calib-dir", required=True, help="folder of sample faces for calibration")
+    parser.add_argument("--eval-dir", help="labelled folder for the report (default: --calib-dir)")
+    parser.add_argument("--num-calib", type=int, default=128)
+    parser.add_argument("--num-eval", type=int, default=256)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--checkpoint", default=Config.MODEL_PATH)
+    parser.add_argument("--out", default=Config.MODEL_ARTIFACTS["int8"])
+    parser.add_argument("--report", default="quantization_report.json")
+    parser.add_argument("--engine", default="x86", choices=["x86", "fbgemm", "qnnpack"])
+    args = parser.parse_args(argv)
+
+    bg_remover = create_bg_remover(Config.BG_REMOVAL_BACKEND, max_side=Config.BG_REMOVAL_MAX_SIDE)
+    fp32 = load_model_pt(args.checkpoint, device="cpu", num_classes=Config.NUM_CLASSES)
+
+    calib, _ = load_face_folder(args.calib_dir, limit=args.num_calib, bg_remover=bg_remover,
+                                order=Config.PREPROCESS_ORDER)
+    batches = list(calib.split(args.batch_size))
+    int8 = quantize_model(fp32, batches, engine=args.engine)
+    save_quantized(int8, args.out)
+    print(f"Saved INT8 model to {args.out}")
+
+    served = load_model_pt(args.checkpoint, device="cpu", num_classes=Config.NUM_CLASSES,
+                           backend="int8", artifact_path=args.out)
+    inputs, labels = load_face_folder(args.eval_dir or args.calib_dir, limit=args.num_eval,
+                                      bg_remover=bg_remover, order=Config.PREPROCESS_ORDER)
+    report = compare_report(fp32, served, inputs, labels)
+    with open(args.report, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,313 @@
+"""Preprocessed, memory-mapped training shards.
+
+    python -m app.model_utils.shards --data ./faces/train --out ./shards/train --workers 8
+
+Runs face crop, background removal and the uint8 pipeline steps once per
+image and stores the result as fixed-size (N, 224, 224, 3) uint8 ``.npy``
+shards next to labels, ages and source content hashes:
+
+    out/manifest.json
+    out/shard-00012/{images,labels,ages,hashes}.npy + meta.json
+
+Images are bucketed into shards by content hash, so re-running only
+processes new sources, copies unchanged rows from the existing shard and
+leaves untouched shards alone. Each shard records its pipeline signature;
+after an ``--order`` or background-removal change, shards built with the
+old settings are rebuilt and the rest are kept. ShardDataset reads the
+shards through np.memmap, so training epochs never decode or preprocess.
+"""
+import argparse
+import bisect
+import json
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+import torch
+from torch.utils.data import Dataset
+
+from app.bulk import is_image_name
+from app.model_utils.background import create_bg_remover
+from app.model_utils.model import class_to_age, idx_to_class
+from app.model_utils.preprocess import augment_image, crop_first, decode_image, preprocess_pipeline
+from app.result_cache import content_hash, pipeline_signature
+
+CLASS_TO_IDX = {name: idx for idx, name in idx_to_class.items()}
+MANIFEST = "manifest.json"
+FORMAT_VERSION = 1
+
+
+def list_labelled_images(root):
+    """(path, class index) for every image under ``root/<class name>/``."""
+    samples = []
+    for name in sorted(os.listdir(root)):
+        folder = os.path.join(root, name)
+        if name not in CLASS_TO_IDX or not os.path.isdir(folder):
+            continue
+        for fname in sorted(os.listdir(folder)):
+            if is_image_name(fname):
+                samples.append((os.path.join(folder, fname), CLASS_TO_IDX[name]))
+    return samples
+
+
+def storable_order(order):
+    """Pipeline steps that produce uint8 images; augmentation (8) and
+    normalization (9) run at load time instead."""
+    return [s for s in order if s not in (8, 9)]
+
+
+def prepare_image(img, order, bg_remover, size=224):
+    """RGB image -> (size, size, 3) uint8 training sample.
+
+    The serving steps in the serving order: face crop (step 1) first, then
+    background removal, then the remaining storable steps of ``order``.
+    Shards and FaceFolderDataset both build their samples here.
+    """
+    img, order = crop_first(img, storable_order(order))
+    img = bg_remover.remove(img)
+    img = preprocess_pipeline(img, order=order)[:, :, :3]
+    if img.shape[:2] != (size, size):
+        img = cv2.resize(img, (size, size), interpolation=cv2.INTER_AREA)
+    return np.ascontiguousarray(img, dtype=np.uint8)
+
+
+# ------------------------------
+# Worker side
+# ------------------------------
+_worker = {}
+
+
+def _init_worker(order, bg_backend, bg_max_side, size):
+    cv2.setNumThreads(1)  # the pool is the parallelism
+    _worker.update(order=order, size=size,
+                   bg_remover=create_bg_remover(bg_backend, max_side=bg_max_side))
+
+
+def _process(path):
+    """One source file -> (size, size, 3) uint8 array, or None if unreadable."""
+    try:
+        with open(path, "rb") as f:
+            img = decode_image(f.read())
+        return prepare_image(img, _worker["order"], _worker["bg_remover"], _worker["size"])
+    except (OSError, ValueError, cv2.error) as e:
+        print(f"[WARN] Skipping {path}: {e}")
+        return None
+
+
+# ------------------------------
+# Builder
+# ------------------------------
+def _shard_name(digest, num_shards):
+    return f"shard-{int(digest[:8], 16) % num_shards:05d}"
+
+
+def _source_name(path):
+    return f"{os.path.basename(os.path.dirname(path))}/{os.path.basename(path)}"
+
+
+def _read_meta(shard_dir):
+    try:
+        with open(os.path.join(shard_dir, "meta.json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_shard(shard_dir, entries, signature, size, pool, chunksize):
+    """(Re)write one shard; rows already in it under ``signature`` are copied, not recomputed."""
+    old_meta = _read_meta(shard_dir)
+    reusable, skipped, old_images = {}, set(), None
+    if old_meta and old_meta["signature"] == signature:
+        hashes = np.load(os.path.join(shard_dir, "hashes.npy"))
+        reusable = {h.decode(): i for i, h in enumerate(hashes)}
+        skipped = set(old_meta["failed"])
+        old_images = np.load(os.path.join(shard_dir, "images.npy"), mmap_mode="r")
+
+    todo = [e for e in entries if e[0] not in reusable and e[0] not in skipped]
+    fresh = dict(zip([e[0] for e in todo], pool.map(_process, [e[1] for e in todo], chunksize=chunksize)))
+    kept = [e for e in entries if e[0] in reusable or fresh.get(e[0]) is not None]
+    wanted = {e[0] for e in entries}
+    failed = sorted((skipped & wanted) | {h for h, img in fresh.items() if img is None})
+
+    tmp = shard_dir + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    images = np.lib.format.open_memmap(os.path.join(tmp, "images.npy"), mode="w+",
+                                       dtype=np.uint8, shape=(len(kept), size, size, 3))
+    for row, (digest, _, _) in enumerate(kept):
+        images[row] = fresh[digest] if digest in fresh else old_images[reusable[digest]]
+    images.flush()
+    labels = np.array([e[2] for e in kept], dtype=np.int64)
+    np.save(os.path.join(tmp, "labels.npy"), labels)
+    np.save(os.path.join(tmp, "ages.npy"),
+            np.array([class_to_age(idx_to_class[int(l)]) for l in labels], dtype=np.int16))
+    np.save(os.path.join(tmp, "hashes.npy"), np.array([e[0] for e in kept], dtype="S32"))
+    with open(os.path.join(tmp, "meta.json"), "w") as f:
+        json.dump({"signature": signature, "count": len(kept), "failed": failed,
+                   "sources": [_source_name(e[1]) for e in kept]}, f)
+
+    del images, old_images  # release both memmaps before swapping directories
+    shutil.rmtree(shard_dir, ignore_errors=True)
+    os.replace(tmp, shard_dir)
+    return {"processed": len(todo), "reused": sum(e[0] not in fresh for e in kept),
+            "failed": len(failed), "count": len(kept)}
+
+
+def build_shards(data_dir, out_dir, order, bg_backend="off", bg_max_side=320, size=224,
+                 num_shards=64, workers=None, chunksize=8):
+    """Build or update the shards for ``data_dir`` in ``out_dir``; returns a summary dict."""
+    start = time.perf_counter()
+    order = storable_order(order)
+    signature = f"{pipeline_signature(order, create_bg_remover(bg_backend, max_side=bg_max_side))}@{size}"
+
+    os.makedirs(out_dir, exist_ok=True)
+    manifest_path = os.path.join(out_dir, MANIFEST)
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            previous = json.load(f)
+        if previous.get("num_shards") != num_shards:
+            # Bucketing changed: every source moves, so start over
+            print(f"[WARN] Shard count changed ({previous.get('num_shards')} -> {num_shards}), rebuilding all")
+            for name in os.listdir(out_dir):
+                if name.startswith("shard-"):
+                    shutil.rmtree(os.path.join(out_dir, name))
+
+    # ---- Bucket sources by content hash ----
+    buckets, seen, duplicates = {}, set(), 0
+    for path, label in list_labelled_images(data_dir):
+        with open(path, "rb") as f:
+            digest = content_hash(f.read())
+        if digest in seen:
+            duplicates += 1
+            continue
+        seen.add(digest)
+        buckets.setdefault(_shard_name(digest, num_shards), []).append((digest, path, label))
+
+    for name in os.listdir(out_dir):
+        if name.startswith("shard-") and name not in buckets:
+            shutil.rmtree(os.path.join(out_dir, name))  # every source of this shard is gone
+
+    # ---- Rebuild only the shards whose contents or settings changed ----
+    totals = {"processed": 0, "reused": 0, "failed": 0, "shards_built": 0, "shards_kept": 0}
+    shards = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(order, bg_backend, bg_max_side, size)) as pool:
+        for name in sorted(buckets):
+            entries = buckets[name]
+            shard_dir = os.path.join(out_dir, name)
+            meta = _read_meta(shard_dir)
+            wanted = {e[0] for e in entries}
+            if meta and meta["signature"] == signature:
+                have = {h.decode() for h in np.load(os.path.join(shard_dir, "hashes.npy"))}
+                if have | set(meta["failed"]) == wanted:
+                    totals["shards_kept"] += 1
+                    totals["reused"] += meta["count"]
+                    totals["failed"] += len(meta["failed"])
+                    shards.append({"name": name, "count": meta["count"]})
+                    continue
+
+            result = _write_shard(shard_dir, entries, signature, size, pool, chunksize)
+            totals["shards_built"] += 1
+            for key in ("processed", "reused", "failed"):
+                totals[key] += result[key]
+            shards.append({"name": name, "count": result["count"]})
+            print(f"  {name}: {result['count']} images ({result['processed']} processed)")
+
+    manifest = {"version": FORMAT_VERSION, "order": order, "signature": signature, "image_size": size,
+                "num_shards": num_shards, "count": sum(s["count"] for s in shards), "shards": shards}
+    with open(manifest_path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+    totals.update(count=manifest["count"], duplicates=duplicates,
+                  seconds=round(time.perf_counter() - start, 2))
+    return totals
+
+
+# ------------------------------
+# Dataset
+# ------------------------------
+class ShardDataset(Dataset):
+    """Reads shards written by build_shards; same items as FaceFolderDataset.
+
+    Returns (uint8 HWC tensor, class index). Image rows are views into a
+    copy-on-write memmap, opened lazily in each DataLoader worker so they
+    are never pickled. ``order``, when given, must match the order the
+    shards were built with.
+    """
+
+    def __init__(self, root, order=None, augment=False):
+        with open(os.path.join(root, MANIFEST)) as f:
+            self.manifest = json.load(f)
+        if order is not None and storable_order(order) != self.manifest["order"]:
+            raise ValueError(f"Shards in {root} were built with order {self.manifest['order']}, "
+                             f"not {storable_order(order)}; rebuild them with --order")
+        self.root = root
+        self.augment = augment
+        shards = [s for s in self.manifest["shards"] if s["count"]]
+        self._names = [s["name"] for s in shards]
+        self._offsets = np.cumsum([0] + [s["count"] for s in shards]).tolist()
+        self._labels = np.concatenate([np.load(os.path.join(root, n, "labels.npy")) for n in self._names]
+                                      or [np.zeros(0, np.int64)])
+        self._images = None
+        self._pid = None
+
+    def __len__(self):
+        return self._offsets[-1]
+
+    def labels(self):
+        return self._labels.tolist()
+
+    def ages(self):
+        return np.concatenate([np.load(os.path.join(self.root, n, "ages.npy")) for n in self._names])
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_images"], state["_pid"] = None, None
+        return state
+
+    def _shards(self):
+        if self._images is None or self._pid != os.getpid():
+            self._images = [np.load(os.path.join(self.root, n, "images.npy"), mmap_mode="c")
+                            for n in self._names]
+            self._pid = os.getpid()
+        return self._images
+
+    def __getitem__(self, i):
+        shard = bisect.bisect_right(self._offsets, i) - 1
+        img = self._shards()[shard][i - self._offsets[shard]]
+        if self.augment:
+            img = np.ascontiguousarray(augment_image(img))
+        return torch.from_numpy(img), int(self._labels[i])
+
+
+# ------------------------------
+# CLI
+# ------------------------------
+def main(argv=None):
+    from app.config import Config
+
+    parser = argparse.ArgumentParser(description="Build memory-mapped preprocessed training shards.")
+    parser.add_argument("--data", required=True, help="folder with one subfolder per class")
+    parser.add_argument("--out", required=True, help="shard directory (updated in place)")
+    parser.add_argument("--order", type=lambda v: [int(s) for s in v.split(",") if s.strip()],
+                        default=Config.PREPROCESS_ORDER)
+    parser.add_argument("--bg-backend", default=Config.BG_REMOVAL_BACKEND)
+    parser.add_argument("--bg-max-side", type=int, default=Config.BG_REMOVAL_MAX_SIDE)
+    parser.add_argument("--size", type=int, default=224)
+    parser.add_argument("--num-shards", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args(argv)
+
+    summary = build_shards(args.data, args.out, args.order, bg_backend=args.bg_backend,
+                           bg_max_side=args.bg_max_side, size=args.size,
+                           num_shards=args.num_shards, workers=args.workers)
+    print(json.dumps(summary, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
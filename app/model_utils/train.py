@@ -0,0 +1,327 @@
+"""Fine-tune AgePredictionCORAL on a folder-per-class face dataset.
+
+    python -m app.model_utils.train --data ./faces/train --val-data ./faces/val \\
+        --epochs 10 --batch-size 64 --workers 8 --accum-steps 2 --out ./runs/exp1
+
+Class folders are named like idx_to_class ("008" ... "50", "above_50",
+"below_8"). With ``--shards``, --data/--val-data are shard directories
+written by ``python -m app.model_utils.shards`` instead. Checkpoints hold ``model_state_dict`` and load directly with
+``load_model_pt``; ``--resume`` continues from the last one.
+"""
+import argparse
+import functools
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+import torch
+from torch.utils.data import DataLoader, Dataset, random_split
+
+from app.model_utils.background import create_bg_remover
+from app.model_utils.hardware import resolve_bf16
+from app.model_utils.model import (
+    AgePredictionCORAL, class_to_age, coral_decode, coral_loss, idx_to_class, mixup_coral_loss, mixup_data,
+)
+from app.model_utils.preprocess import DEFAULT_ORDER, IMAGENET_MEAN, IMAGENET_STD, augment_image
+from app.model_utils.shards import ShardDataset, list_labelled_images, prepare_image, storable_order
+
+IDX_TO_AGE = torch.tensor([class_to_age(idx_to_class[i]) for i in range(len(idx_to_class))])
+
+
+# ------------------------------
+# Data
+# ------------------------------
+class FaceFolderDataset(Dataset):
+    """Images under ``root/<class name>/``, prepared like the shards.
+
+    Each image goes through shards.prepare_image (face crop, background
+    removal, uint8 pipeline steps), so training from folders or from shards
+    sees the same inputs as serving. Returns (uint8 HWC tensor, class
+    index). The normalize step (9) is left out: batches travel from the
+    workers as uint8 (4x less than float32) and are normalized once per
+    batch by ``to_model_input``. The background remover is created lazily
+    in each DataLoader worker.
+    """
+
+    def __init__(self, root, order=None, augment=False, bg_backend="off", bg_max_side=320, size=224):
+        self.order = storable_order(DEFAULT_ORDER if order is None else order)
+        self.augment = augment
+        self.bg_backend = bg_backend
+        self.bg_max_side = bg_max_side
+        self.size = size
+        self.samples = list_labelled_images(root)
+        if not self.samples:
+            raise ValueError(f"No labelled images under {root}")
+        self._bg_remover = None
+        self._pid = None
+
+    def __len__(self):
+        return len(self.samples)
+
+    def labels(self):
+        return [label for _, label in self.samples]
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_bg_remover"], state["_pid"] = None, None
+        return state
+
+    def _remover(self):
+        if self._bg_remover is None or self._pid != os.getpid():
+            self._bg_remover = create_bg_remover(self.bg_backend, max_side=self.bg_max_side)
+            self._pid = os.getpid()
+        return self._bg_remover
+
+    def __getitem__(self, i):
+        path, label = self.samples[i]
+        img = cv2.imread(path)
+        if img is None:
+            raise ValueError(f"Could not read image: {path}")
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        img = prepare_image(img, self.order, self._remover(), self.size)
+        if self.augment:
+            img = np.ascontiguousarray(augment_image(img))
+        return torch.from_numpy(img), label
+
+
+def _worker_init(worker_id):
+    # One OpenCV thread per worker (the workers are the parallelism) and a
+    # distinct numpy seed per worker for the albumentations draws
+    cv2.setNumThreads(1)
+    np.random.seed(torch.initial_seed() % 2**32)
+
+
+def make_loader(dataset, batch_size, workers, shuffle, pin_memory=False):
+    return DataLoader(
+        dataset,
+        batch_size=batch_size,
+        shuffle=shuffle,
+        num_workers=workers,
+        pin_memory=pin_memory,
+        drop_last=shuffle,
+        persistent_workers=workers > 0,
+        prefetch_factor=4 if workers > 0 else None,
+        worker_init_fn=_worker_init,
+    )
+
+
+_MEAN = torch.from_numpy(IMAGENET_MEAN)
+_STD = torch.from_numpy(IMAGENET_STD)
+
+
+def to_model_input(images, device):
+    """uint8 (N, H, W, 3) batch -> normalized float (N, 3, H, W), channels_last.
+
+    The NHWC buffer permuted to NCHW already is channels_last memory, so
+    no copy is needed for the layout; scaling happens in place.
+    """
+    x = images.to(device, non_blocking=True).permute(0, 3, 1, 2).float()
+    x.div_(255.0).sub_(_MEAN.to(device)).div_(_STD.to(device))
+    return x.contiguous(memory_format=torch.channels_last)
+
+
+# ------------------------------
+# Train / evaluate
+# ------------------------------
+def train_one_epoch(model, loader, optimizer, device, num_classes, accum_steps=1, bf16=False,
+                    mixup_alpha=0.0, pos_weights=None, log_every=50):
+    """One pass over ``loader``; returns loss and throughput for the epoch."""
+    model.train()
+    device_type = "cuda" if str(device).startswith("cuda") else "cpu"
+    optimizer.zero_grad(set_to_none=True)
+    total_loss, samples, steps = 0.0, 0, len(loader)
+    start = time.perf_counter()
+
+    for step, (images, labels) in enumerate(loader, 1):
+        x = to_model_input(images, device)
+        y = labels.to(device, non_blocking=True)
+
+        with torch.autocast(device_type, dtype=torch.bfloat16, enabled=bf16):
+            if mixup_alpha > 0:
+                x, y_a, y_b, lam = mixup_data(x, y, alpha=mixup_alpha)
+                logits = model(x)
+            else:
+                logits = model(x)
+        # Loss in fp32: the sigmoid/BCE over 44 thresholds is cheap and bf16 would cost accuracy
+        logits = logits.float()
+        if mixup_alpha > 0:
+            loss = mixup_coral_loss(logits, y_a, y_b, lam, num_classes, device, pos_weights=pos_weights)
+        else:
+            loss = coral_loss(logits, y, num_classes, device, pos_weights=pos_weights)
+
+        (loss / accum_steps).backward()
+        if step % accum_steps == 0 or step == steps:
+            optimizer.step()
+            optimizer.zero_grad(set_to_none=True)
+
+        total_loss += loss.item() * len(y)
+        samples += len(y)
+        if log_every and step % log_every == 0:
+            rate = samples / (time.perf_counter() - start)
+            print(f"  step {step}/{steps} loss={total_loss / samples:.4f} {rate:.1f} samples/s")
+
+    seconds = time.perf_counter() - start
+    return {"loss": total_loss / max(1, samples), "samples": samples, "seconds": seconds,
+            "samples_per_sec": samples / seconds if seconds else 0.0}
+
+
+@torch.no_grad()
+def evaluate(model, loader, device, bf16=False):
+    """Mean absolute error in years on ``loader``."""
+    model.eval()
+    device_type = "cuda" if str(device).startswith("cuda") else "cpu"
+    abs_err, samples = 0.0, 0
+    for images, labels in loader:
+        with torch.autocast(device_type, dtype=torch.bfloat16, enabled=bf16):
+            logits = model(to_model_input(images, device))
+        pred = coral_decode(logits.float().cpu(), idx_to_class=None)
+        abs_err += (IDX_TO_AGE[pred] - IDX_TO_AGE[labels]).abs().sum().item()
+        samples += len(labels)
+    return abs_err / max(1, samples)
+
+
+# ------------------------------
+# Checkpoints
+# ------------------------------
+def save_checkpoint(path, model, optimizer, scheduler, epoch, best_mae, history, args):
+    tmp = path + ".tmp"
+    torch.save({
+        "model_state_dict": model.state_dict(),
+        "optimizer_state_dict": optimizer.state_dict(),
+        "scheduler_state_dict": scheduler.state_dict(),
+        "epoch": epoch,
+        "best_mae": best_mae,
+        "history": history,
+        "args": vars(args),
+    }, tmp)
+    os.replace(tmp, path)  # never leave a half-written checkpoint behind
+
+
+def load_weights(model, path):
+    checkpoint = torch.load(path, map_location="cpu", weights_only=True)
+    model.load_state_dict(checkpoint.get("model_state_dict", checkpoint))
+
+
+def class_pos_weights(labels, num_classes, max_weight=10.0):
+    """Per-threshold pos_weight = negatives / positives over the training labels."""
+    targets = (torch.arange(num_classes - 1) < torch.as_tensor(labels)[:, None]).float()
+    pos = targets.sum(0)
+    return ((len(labels) - pos) / pos.clamp(min=1)).clamp(max=max_weight)
+
+
+# ------------------------------
+# CLI
+# ------------------------------
+def _int_list(value):
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def main(argv=None):
+    from app.config import Config
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--data", required=True, help="training folder (one subfolder per class)")
+    parser.add_argument("--val-data", help="validation folder (default: --val-split of --data)")
+    parser.add_argument("--val-split", type=float, default=0.1)
+    parser.add_argument("--shards", action="store_true", help="--data/--val-data are preprocessed shard dirs")
+    parser.add_argument("--out", default="runs/train", help="checkpoint / history directory")
+    parser.add_argument("--init", default=Config.MODEL_PATH,
+                        help="weights to fine-tune from (ImageNet backbone if missing)")
+    parser.add_argument("--resume", action="store_true", help="continue from OUT/checkpoint_last.pth")
+    parser.add_argument("--epochs", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--accum-steps", type=int, default=1, help="gradient accumulation steps")
+    parser.add_argument("--lr", type=float, default=1e-4)
+    parser.add_argument("--weight-decay", type=float, default=1e-4)
+    parser.add_argument("--mixup-alpha", type=float, default=0.0)
+    parser.add_argument("--pos-weights", action="store_true", help="balance thresholds by label frequency")
+    parser.add_argument("--order", type=_int_list,
+                        help="pipeline steps (default: the shard manifest's with --shards, "
+                             "else PREPROCESS_ORDER)")
+    parser.add_argument("--bg-backend", default=Config.BG_REMOVAL_BACKEND,
+                        help="background removal for folder datasets (shards carry their own)")
+    parser.add_argument("--bg-max-side", type=int, default=Config.BG_REMOVAL_MAX_SIDE)
+    parser.add_argument("--workers", type=int, default=min(8, os.cpu_count() or 1))
+    parser.add_argument("--device", default=Config.DEVICE)
+    parser.add_argument("--bf16", default="auto", choices=["auto", "on", "off"])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    torch.manual_seed(args.seed)
+    os.makedirs(args.out, exist_ok=True)
+    device = args.device
+    bf16 = resolve_bf16(args.bf16, device)
+    num_classes = Config.NUM_CLASSES
+
+    if args.shards:
+        dataset_cls = functools.partial(ShardDataset, order=args.order)
+    else:
+        dataset_cls = functools.partial(FaceFolderDataset, order=args.order or Config.PREPROCESS_ORDER,
+                                        bg_backend=args.bg_backend, bg_max_side=args.bg_max_side)
+    train_set = dataset_cls(args.data, augment=True)
+    train_labels = train_set.labels()
+    if args.val_data:
+        val_set = dataset_cls(args.val_data)
+    else:
+        full_eval = dataset_cls(args.data)
+        n_val = max(1, int(len(train_set) * args.val_split))
+        split = torch.Generator().manual_seed(args.seed)
+        train_idx, val_idx = random_split(range(len(train_set)), [len(train_set) - n_val, n_val], generator=split)
+        train_labels = [train_labels[i] for i in train_idx.indices]
+        train_set = torch.utils.data.Subset(train_set, train_idx.indices)
+        val_set = torch.utils.data.Subset(full_eval, val_idx.indices)
+
+    pin = str(device).startswith("cuda")
+    train_loader = make_loader(train_set, args.batch_size, args.workers, shuffle=True, pin_memory=pin)
+    val_loader = make_loader(val_set, args.batch_size, args.workers, shuffle=False, pin_memory=pin)
+
+    model = AgePredictionCORAL(num_classes=num_classes, pretrained=not os.path.exists(args.init))
+    if os.path.exists(args.init):
+        load_weights(model, args.init)
+    model = model.to(device).to(memory_format=torch.channels_last)
+
+    optimizer = torch.optim.AdamW(model.parameters(), lr=args.lr, weight_decay=args.weight_decay)
+    scheduler = torch.optim.lr_scheduler.CosineAnnealingLR(optimizer, T_max=args.epochs)
+    pos_weights = class_pos_weights(train_labels, num_classes).to(device) if args.pos_weights else None
+
+    last_path = os.path.join(args.out, "checkpoint_last.pth")
+    best_path = os.path.join(args.out, "checkpoint_best.pth")
+    start_epoch, best_mae, history = 0, float("inf"), []
+    if args.resume and os.path.exists(last_path):
+        state = torch.load(last_path, map_location=device, weights_only=True)
+        model.load_state_dict(state["model_state_dict"])
+        optimizer.load_state_dict(state["optimizer_state_dict"])
+        scheduler.load_state_dict(state["scheduler_state_dict"])
+        start_epoch, best_mae, history = state["epoch"] + 1, state["best_mae"], state["history"]
+        print(f"Resumed from {last_path} at epoch {start_epoch}")
+
+    print(f"Training on {len(train_set)} images, validating on {len(val_set)} "
+          f"(device={device}, bf16={bf16}, workers={args.workers}, "
+          f"batch={args.batch_size}x{args.accum_steps})")
+
+    for epoch in range(start_epoch, args.epochs):
+        stats = train_one_epoch(model, train_loader, optimizer, device, num_classes,
+                                accum_steps=args.accum_steps, bf16=bf16,
+                                mixup_alpha=args.mixup_alpha, pos_weights=pos_weights)
+        scheduler.step()
+        stats.update(epoch=epoch, val_mae=evaluate(model, val_loader, device, bf16=bf16),
+                     lr=optimizer.param_groups[0]["lr"])
+        history.append(stats)
+        print(f"Epoch {epoch}: loss={stats['loss']:.4f} val_mae={stats['val_mae']:.2f} "
+              f"{stats['samples_per_sec']:.1f} samples/s ({stats['seconds']:.0f}s)")
+
+        if stats["val_mae"] < best_mae:
+            best_mae = stats["val_mae"]
+            save_checkpoint(best_path, model, optimizer, scheduler, epoch, best_mae, history, args)
+        save_checkpoint(last_path, model, optimizer, scheduler, epoch, best_mae, history, args)
+        with open(os.path.join(args.out, "history.json"), "w") as f:
+            json.dump(history, f, indent=2)
+
+    print(f"Best val MAE {best_mae:.2f} -> {best_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,271 @@
+import random
+import time
+from operator import attrgetter
+
+import numpy as np
+
+
+# ------------------------------
+# Landmark geometry
+# ------------------------------
+LEFT_EYE = [33, 160, 158, 133, 153, 144]
+RIGHT_EYE = [362, 385, 387, 263, 373, 380]
+NOSE_TIP = 1
+
+# EAR distance pairs per eye, [left, right] x [|p2-p6|, |p3-p5|, |p1-p4|]
+EYE_PAIR_A = np.array([[eye[1], eye[2], eye[0]] for eye in (LEFT_EYE, RIGHT_EYE)], dtype=np.intp)
+EYE_PAIR_B = np.array([[eye[5], eye[4], eye[3]] for eye in (LEFT_EYE, RIGHT_EYE)], dtype=np.intp)
+
+# The only points the per-frame samples read (both eyes + nose tip), and the
+# EAR pairs / nose row re-indexed into that compact (13, 2) array
+SAMPLE_POINTS = LEFT_EYE + RIGHT_EYE + [NOSE_TIP]
+_SAMPLE_ROW = {idx: row for row, idx in enumerate(SAMPLE_POINTS)}
+SAMPLE_PAIR_A = np.array([[_SAMPLE_ROW[i] for i in row] for row in EYE_PAIR_A.tolist()], dtype=np.intp)
+SAMPLE_PAIR_B = np.array([[_SAMPLE_ROW[i] for i in row] for row in EYE_PAIR_B.tolist()], dtype=np.intp)
+SAMPLE_NOSE = _SAMPLE_ROW[NOSE_TIP]
+
+_GET_X, _GET_Y = attrgetter("x"), attrgetter("y")
+
+def landmarks_to_array(landmarks):
+    """FaceMesh landmarks as one contiguous float32 (N, 2) array of x, y.
+
+    Only needed for whole-face geometry (alignment, face box); per-frame
+    samples read just SAMPLE_POINTS. Arrays pass through unchanged. The
+    array is column-major, so the bbox reductions run over contiguous memory.
+    """
+    if isinstance(landmarks, np.ndarray):
+        return landmarks
+    n = len(landmarks)
+    points = np.empty((n, 2), dtype=np.float32, order="F")
+    points[:, 0] = np.fromiter(map(_GET_X, landmarks), dtype=np.float32, count=n)
+    points[:, 1] = np.fromiter(map(_GET_Y, landmarks), dtype=np.float32, count=n)
+    return points
+
+def face_box(points):
+    """Normalized [x1, y1, x2, y2] bounding box of the landmarks."""
+    xy = landmarks_to_array(points)[:, :2]
+    return xy.min(axis=0).tolist() + xy.max(axis=0).tolist()
+
+def np_point(landmarks, idx):
+    """x, y of the landmark(s) at ``idx`` (an index or a list of them).
+
+    Arrays are indexed directly; a FaceMesh landmark list only has the
+    requested points read, so single-point lookups never convert all ~478.
+    """
+    if isinstance(landmarks, np.ndarray):
+        return landmarks[idx, :2]
+    if isinstance(idx, (int, np.integer)):
+        return np.array([landmarks[idx].x, landmarks[idx].y], dtype=np.float32)
+    return np.array([(landmarks[i].x, landmarks[i].y) for i in idx], dtype=np.float32)
+
+def eye_aspect_ratios(points, pair_a=EYE_PAIR_A, pair_b=EYE_PAIR_B):
+    """EAR of both eyes at once: (2,) array, [left, right].
+
+    ``points`` is the full landmark array, or the compact SAMPLE_POINTS
+    array with ``SAMPLE_PAIR_A``/``SAMPLE_PAIR_B``.
+    """
+    diff = points[pair_a, :2] - points[pair_b, :2]       # (2, 3, 2)
+    dist = np.sqrt(np.einsum("ijk,ijk->ij", diff, diff))
+    return (dist[:, 0] + dist[:, 1]) / (2.0 * dist[:, 2] + 1e-6)
+
+def eye_aspect_ratio(landmarks, eye_idx):
+    p1, p2, p3, p4, p5, p6 = np_point(landmarks, eye_idx)
+    return (np.linalg.norm(p2-p6) + np.linalg.norm(p3-p5)) / (2.0 * np.linalg.norm(p1-p4) + 1e-6)
+
+def head_turn_direction(landmarks, left_thresh=0.35, right_thresh=0.65):
+    nose_x = float(np_point(landmarks, NOSE_TIP)[0])
+    if nose_x < left_thresh:
+        return "right"
+    elif nose_x > right_thresh:
+        return "left"
+    return "center"
+
+# ------------------------------
+# Alignment check
+# ------------------------------
+def check_alignment(landmarks, frame_shape):
+    h, w, _ = frame_shape
+    xy = landmarks_to_array(landmarks)[:, :2]
+    (x1, y1), (x2, y2) = xy.min(axis=0).tolist(), xy.max(axis=0).tolist()
+    x1, x2, y1, y2 = x1 * w, x2 * w, y1 * h, y2 * h
+    face_w, face_h = x2 - x1, y2 - y1
+
+    if face_w < 0.2 * w or face_h < 0.2 * h:
+        return False, "Face too far/small"
+
+    cx, cy = (x1 + x2) / 2, (y1 + y2) / 2
+    if cx < 0.3 * w or cx > 0.7 * w or cy < 0.3 * h or cy > 0.7 * h:
+        return False, "Face not centered"
+
+    return True, "Face aligned"
+
+# ------------------------------
+# Challenge system with timeout
+# ------------------------------
+ALL_CHALLENGES = ["alignment", "blink", "turn_left", "turn_right"]
+TEMPORAL_CHALLENGES = ("blink", "turn_left", "turn_right")  # judged over the session's history
+CHALLENGE_TIMEOUT = 10  # seconds
+
+CHALLENGE_INSTRUCTIONS = {
+    "alignment": "Please center your face in the camera",
+    "blink": "Blink your eyes",
+    "turn_left": "Turn your face to the left",
+    "turn_right": "Turn your face to the right",
+}
+
+# Per-session rolling window of EAR / nose-x samples (JSON lists in the
+# session state, so it works with every session store)
+HISTORY_SIZE = 16
+BLINK_CLOSED_EAR = 0.2    # both eyes below: closed
+BLINK_OPEN_EAR = 0.25     # above: open (gap between the two = hysteresis)
+BLINK_MAX_CLOSED_S = 1.0  # longer closures are not blinks
+TURN_MIN_FRAMES = 2       # consecutive frames facing the same way
+
+DONE = {"challenge": "done", "message": "✅ All challenges passed!", "passed": True}
+TIMEOUT = {"challenge": "failed", "message": "❌ Spoof Detected (timeout)", "passed": False}
+
+
+def new_session_state(now=None):
+    """Fresh randomized challenge sequence (JSON-serializable)."""
+    return {
+        "challenges": random.sample(ALL_CHALLENGES, len(ALL_CHALLENGES)),
+        "index": 0,
+        "start_time": time.time() if now is None else now,
+        "history": new_history(),
+    }
+
+
+def new_history():
+    return {"t": [], "ear": [], "nose_x": []}
+
+
+def record_sample(history, now, landmarks):
+    """Append one frame's EAR (the more open eye) and nose x, keeping HISTORY_SIZE samples.
+
+    Reads only the SAMPLE_POINTS of ``landmarks`` (a FaceMesh list or an array).
+    """
+    points = np_point(landmarks, SAMPLE_POINTS)
+    history["t"].append(now)
+    history["ear"].append(float(eye_aspect_ratios(points, SAMPLE_PAIR_A, SAMPLE_PAIR_B).max()))
+    history["nose_x"].append(float(points[SAMPLE_NOSE, 0]))
+    for key in ("t", "ear", "nose_x"):
+        del history[key][:-HISTORY_SIZE]
+
+
+def detect_blink(history):
+    """True once the window holds an open -> closed -> open transition.
+
+    The closed phase must last at most BLINK_MAX_CLOSED_S; a face that
+    stays still with closed eyes (a photo) never produces the event.
+    """
+    phase, closed_at = "start", None
+    for t, ear in zip(history["t"], history["ear"]):
+        if phase == "start" and ear >= BLINK_OPEN_EAR:
+            phase = "open"
+        elif phase == "open" and ear < BLINK_CLOSED_EAR:
+            phase, closed_at = "closed", t
+        elif phase == "closed" and ear >= BLINK_OPEN_EAR:
+            if t - closed_at <= BLINK_MAX_CLOSED_S:
+                return True
+            phase = "open"
+    return False
+
+
+def detect_turn(history, direction, left_thresh=0.35, right_thresh=0.65):
+    """True when the last TURN_MIN_FRAMES samples all face ``direction``."""
+    recent = history["nose_x"][-TURN_MIN_FRAMES:]
+    if len(recent) < TURN_MIN_FRAMES:
+        return False
+    if direction == "left":
+        return all(x > right_thresh for x in recent)
+    return all(x < left_thresh for x in recent)
+
+
+def session_done(state):
+    return state["index"] >= len(state["challenges"])
+
+
+def current_challenge(state):
+    return None if session_done(state) else state["challenges"][state["index"]]
+
+
+def session_timed_out(state, now=None):
+    now = time.time() if now is None else now
+    return not session_done(state) and now - state["start_time"] > CHALLENGE_TIMEOUT
+
+
+def evaluate_challenge(challenge, landmarks, frame_shape, history=None):
+    """Return (passed, message) for one frame's landmarks.
+
+    Blinks and turns are judged on ``history`` (the session's rolling
+    window, already holding this frame); without one, only this frame is used.
+    """
+    if history is None:
+        history = new_history()
+        record_sample(history, 0.0, landmarks)
+
+    if challenge == "alignment":
+        ok, msg = check_alignment(landmarks, frame_shape)
+        return ok, msg if not ok else "✅ Face centered"
+
+    if challenge == "blink":
+        if detect_blink(history):
+            return True, "✅ Blink detected"
+        return False, CHALLENGE_INSTRUCTIONS["blink"]
+
+    if challenge == "turn_left":
+        if detect_turn(history, "left"):
+            return True, "✅ Face turned left"
+        return False, "Please turn your face left"
+
+    if challenge == "turn_right":
+        if detect_turn(history, "right"):
+            return True, "✅ Face turned right"
+        return False, "Please turn your face right"
+
+    return False, CHALLENGE_INSTRUCTIONS.get(challenge, "Follow the challenge")
+
+
+def step_session(state, landmarks, frame_shape, now=None):
+    """Advance ``state`` in place with one frame's landmarks (None = no face).
+
+    Returns the status dict sent back to the client.
+    """
+    now = time.time() if now is None else now
+    if session_done(state):
+        return dict(DONE)
+    if session_timed_out(state, now):
+        return dict(TIMEOUT)
+
+    current_challenge = state["challenges"][state["index"]]
+
+    # Use friendly instructions by default
+    status = {
+        "challenge": current_challenge,
+        "passed": False,
+        "message": CHALLENGE_INSTRUCTIONS.get(current_challenge, "Follow the challenge")
+    }
+
+    history = state.setdefault("history", new_history())
+    if landmarks is None:
+        # A lost face breaks any blink/turn in progress
+        history.update(new_history())
+        status["message"] = "No face detected"
+        return status
+
+    # Only alignment and the final face box need every point; the samples read 13
+    record_sample(history, now, landmarks)
+    passed, status["message"] = evaluate_challenge(current_challenge, landmarks, frame_shape, history)
+    if passed:
+        status["passed"] = True
+        state["index"] += 1
+        state["start_time"] = now
+        history.update(new_history())  # the next challenge starts from fresh samples
+        if session_done(state):
+            # Where the verified face was, for the age check that follows
+            h, w = frame_shape[:2]
+            state["face"] = {"box": face_box(landmarks), "aspect": w / h, "time": now}
+            return dict(DONE)
+        status["next_challenge"] = CHALLENGE_INSTRUCTIONS[state["challenges"][state["index"]]]
+
+    return status
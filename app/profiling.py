@@ -0,0 +1,131 @@
+import cProfile
+import io
+import os
+import pstats
+import threading
+import time
+
+PROFILE_MODES = ("cprofile", "torch")
+
+
+# ------------------------------
+# On-demand request profiling
+# ------------------------------
+class RequestProfiler:
+    """Profiles the next N requests once armed via /admin/profile.
+
+    "cprofile" merges the Python profiles of the captured requests into one
+    ``.prof`` file (plus a ``.txt`` top-30 by cumulative time); "torch"
+    writes one Chrome trace per request from torch.profiler, which also sees
+    the forward pass on the batching engine's thread. Only one request is
+    profiled at a time (both profilers are process-global), so concurrent
+    requests simply pass through unprofiled until the capture is done.
+    """
+
+    def __init__(self, out_dir, max_requests=50):
+        self.out_dir = out_dir
+        self.max_requests = max_requests
+        self._lock = threading.Lock()
+        self._remaining = 0
+        self._taken = 0
+        self._mode = None
+        self._active = False
+        self._capture = None
+        self._stats = None
+        self._files = []
+
+    def arm(self, requests, mode="cprofile"):
+        """Start a capture of the next ``requests`` requests; returns status()."""
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode {mode!r}, expected one of {PROFILE_MODES}")
+        requests = int(requests)
+        if not 1 <= requests <= self.max_requests:
+            raise ValueError(f"requests must be between 1 and {self.max_requests}")
+        with self._lock:
+            if self._remaining or self._active:
+                raise RuntimeError("A profile capture is already running")
+            self._remaining, self._taken, self._mode = requests, 0, mode
+            self._capture = time.strftime("%Y%m%d-%H%M%S")
+            self._stats, self._files = None, []
+        return self.status()
+
+    def status(self):
+        with self._lock:
+            return {"remaining": self._remaining, "mode": self._mode, "active": self._active,
+                    "files": list(self._files)}
+
+    def start(self):
+        """Begin profiling the current request if a capture wants it; returns a handle or None."""
+        if not self._remaining:  # unlocked fast path for the common case
+            return None
+        with self._lock:
+            if not self._remaining or self._active:
+                return None
+            self._remaining -= 1
+            self._taken += 1
+            self._active = True
+            mode, index = self._mode, self._taken
+
+        if mode == "torch":
+            from torch.profiler import ProfilerActivity, profile
+            prof = profile(activities=[ProfilerActivity.CPU], record_shapes=True)
+            prof.start()
+        else:
+            prof = cProfile.Profile()
+            prof.enable()
+        return mode, index, prof
+
+    def stop(self, handle, endpoint):
+        mode, index, prof = handle
+        try:
+            os.makedirs(self.out_dir, exist_ok=True)
+            if mode == "torch":
+                prof.stop()
+                path = os.path.join(self.out_dir, f"torch-{self._capture}-{index:03d}-{endpoint}.json")
+                prof.export_chrome_trace(path)
+                with self._lock:
+                    self._files.append(path)
+            else:
+                prof.disable()
+                with self._lock:
+                    if self._stats is None:
+                        self._stats = pstats.Stats(prof)
+                    else:
+                        self._stats.add(prof)
+                    if not self._remaining:
+                        self._write_cprofile()
+        finally:
+            with self._lock:
+                self._active = False
+
+    def _write_cprofile(self):
+        """Dump the merged profile (called with the lock held)."""
+        base = os.path.join(self.out_dir, f"cprofile-{self._capture}")
+        self._stats.dump_stats(base + ".prof")
+        text = io.StringIO()
+        pstats.Stats(base + ".prof", stream=text).sort_stats("cumulative").print_stats(30)
+        with open(base + ".txt", "w") as f:
+            f.write(text.getvalue())
+        self._files.extend([base + ".prof", base + ".txt"])
+        self._stats = None
+
+
+def init_profiler(app):
+    """Attach a RequestProfiler to ``app`` and hook it around every request
+    except the admin/metrics endpoints themselves."""
+    from flask import g, request
+
+    app.profiler = RequestProfiler(app.config["PROFILE_DIR"], max_requests=app.config["PROFILE_MAX_REQUESTS"])
+
+    @app.before_request
+    def _start_profile():
+        if not (request.endpoint or "").startswith("ops."):
+            g.profile = app.profiler.start()
+
+    @app.teardown_request
+    def _stop_profile(exc=None):
+        handle = g.pop("profile", None)
+        if handle is not None:
+            app.profiler.stop(handle, request.endpoint or "unmatched")
+
+    return app.profiler
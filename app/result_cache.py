@@ -0,0 +1,137 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+def content_hash(data):
+    """Fast 128-bit digest of an upload's raw bytes."""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def model_identity(*paths, backend="eager"):
+    """Changes whenever the served weights change: file name, size and mtime
+    of each existing path, plus the serving backend."""
+    parts = [backend]
+    for path in paths:
+        if path and os.path.exists(path):
+            st = os.stat(path)
+            parts.append(f"{os.path.basename(path)}:{st.st_size}:{st.st_mtime_ns}")
+    return hashlib.blake2b("|".join(parts).encode(), digest_size=8).hexdigest()
+
+
+def pipeline_signature(order, bg_remover=None):
+    """Preprocessing settings that change the model input."""
+    bg = "off" if bg_remover is None else f"{bg_remover.name}@{getattr(bg_remover, 'max_side', 0)}"
+    return f"{'-'.join(str(s) for s in order)}:{bg}"
+
+
+# ------------------------------
+# Bounded LRU with TTL
+# ------------------------------
+class LRUCache:
+    """Thread-safe LRU holding at most ``max_entries`` values, each for ``ttl``
+    seconds (None = no expiry). ``max_entries=0`` disables the cache."""
+
+    def __init__(self, max_entries=1024, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        if not self.max_entries:
+            return None
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] is not None and entry[0] < time.monotonic():
+                del self._data[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        if not self.max_entries:
+            return
+        expires = None if self.ttl is None else time.monotonic() + self.ttl
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+# ------------------------------
+# Two-tier prediction cache
+# ------------------------------
+class ResultCache:
+    """Content-addressed cache in front of preprocessing and the model.
+
+    Results (predicted ages) are keyed by image digest + model identity +
+    pipeline signature; the optional tensor tier is keyed without the model
+    identity, so swapping checkpoints still skips background removal and the
+    preprocessing pipeline for images seen before.
+    """
+
+    def __init__(self, model_id, max_entries=1024, ttl=3600, tensor_entries=0):
+        self.model_id = model_id
+        self.results = LRUCache(max_entries, ttl)
+        self.tensors = LRUCache(tensor_entries, ttl)
+
+    @property
+    def enabled(self):
+        return bool(self.results.max_entries or self.tensors.max_entries)
+
+    def get_age(self, digest, signature):
+        return self.results.get(f"{digest}:{signature}:{self.model_id}")
+
+    def put_age(self, digest, signature, age):
+        self.results.put(f"{digest}:{signature}:{self.model_id}", age)
+
+    def get_tensor(self, digest, signature):
+        return self.tensors.get(f"{digest}:{signature}")
+
+    def put_tensor(self, digest, signature, tensor):
+        self.tensors.put(f"{digest}:{signature}", tensor)
+
+    def cached_prepare(self, digest, signature, prepare):
+        """Wrap ``prepare`` (-> input tensor) with the tensor tier."""
+        if not self.tensors.max_entries:
+            return prepare
+
+        def run():
+            tensor = self.get_tensor(digest, signature)
+            if tensor is None:
+                tensor = prepare()
+                self.put_tensor(digest, signature, tensor)
+            return tensor
+        return run
+
+    def stats(self):
+        return {"model_id": self.model_id, "results": self.results.stats(),
+                "tensors": self.tensors.stats()}
@@ -6,4 +6,27 @@ main_bp = Blueprint("main", __name__)
 @main_bp.route('/')
 def main():
     pad_mode = 2   # or 2, based on your requirement / config
-    return render_template("index.html", pad_mode=pad_mode)
\ No newline at end of file
+    config = current_app.config
+    return render_template(
+        "index.html",
+        pad_mode=pad_mode,
+        pad_frame_width=config["PAD_FRAME_WIDTH"],
+        pad_frame_interval_ms=config["PAD_FRAME_INTERVAL_MS"],
+        pad_frame_quality=config["PAD_FRAME_QUALITY"],
+        pad_websocket=config["PAD_WEBSOCKET_ENABLED"],
+    )
+
+
+@main_bp.route("/healthz")
+def healthz():
+    """Liveness: the process is up and serving requests."""
+    return jsonify({"status": "ok"})
+
+
+@main_bp.route("/readyz")
+def readyz():
+    """Readiness: 503 until warmup has run every stage at least once."""
+    warmup = current_app.warmup.status()
+    if current_app.warmup.ready:
+        return jsonify({"status": "ready", "warmup": warmup})
+    return jsonify({"status": "warming_up", "warmup": warmup}), 503
\ No newline at end of file
@@ -1,17 +1,20 @@
-from app.model_utils.preprocess import preprocess_pipeline
-from app.model_utils.model import coral_decode
+from app.model_utils.preprocess import preprocess_image, preprocess_array, decode_image, load_image
+from app.bulk import iter_directory, iter_zip, predict_stream
+from app.inference import QueueFullError
+from app.result_cache import content_hash, pipeline_signature
+from app.metrics import record_error, timed
+from app.routes.pad_routes import completed_face, get_session_id
 
 # from tensorflow.keras.preprocessing.image import load_img, img_to_array
-from flask import Blueprint, render_template, current_app, request, jsonify
+from flask import Blueprint, render_template, current_app, request, jsonify, Response, stream_with_context, url_for
 import torch
-from torchvision import transforms
 import cv2
 import os
 from werkzeug.utils import secure_filename
 import numpy as np
-from PIL import Image
-from rembg import remove
 import io
+import json
+import uuid
 # from mtcnn import MTCNN
 
 
@@ -31,53 +34,6 @@ import io
 
 #     return img
 
-def preprocess_image(img_path, order=[3,4,6,9]):
-    # Load image
-    img = cv2.imread(img_path)
-    img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-
-    # ---- Background Removal ----
-    pil_img = Image.fromarray(img)
-    bg_removed = remove(pil_img)   # RGBA (may have transparency)
-
-    # Fill transparent background with white
-    # if bg_removed.mode == "RGBA":
-    #     white_bg = Image.new("RGB", bg_removed.size, (255, 255, 255))  # white background
-    #     white_bg.paste(bg_removed, mask=bg_removed.split()[3])  # use alpha channel as mask
-    #     bg_removed = white_bg  # now RGB, no alpha
-
-    # Convert back to numpy (RGB only)
-    img_no_bg = np.array(bg_removed)
-
-    # Save background removed image (force PNG if RGBA)
-    base, ext = os.path.splitext(img_path)
-    bg_rm_path = f"{base}_bg_rm.png" if bg_removed.mode == "RGBA" else f"{base}_bg_rm{ext}"
-    bg_removed.save(bg_rm_path)
-
-    # ---- Preprocessing ----
-    
-    img_proc = preprocess_pipeline(img_no_bg, order=order, augment=False)
-    # Convert to PIL for saving (cast to uint8 if float32)
-    if img_proc.dtype != np.uint8:
-        img_proc_to_save = (img_proc * 255).clip(0, 255).astype(np.uint8)
-    else:
-        img_proc_to_save = img_proc
-
-    img_proc_pil = Image.fromarray(img_proc_to_save)
-    pre_path = f"{base}_pre.png"   # save as PNG
-    img_proc_pil.save(pre_path)
-    # ---- Torch Transform ----
-    post_transform = transforms.Compose([
-        transforms.ToTensor(),
-        transforms.Normalize(mean=[0.485, 0.456, 0.406],
-                             std=[0.229, 0.224, 0.225]),
-    ])
-    img_tensor = post_transform(img_proc)
-    img_tensor = img_tensor.unsqueeze(0)  # Add batch dimension
-
-    return img_tensor
-
-
 # DETECTOR = MTCNN()
 
 # def preprocess_and_predict_h5(save_path, model, app_root):
@@ -137,37 +93,247 @@ def preprocess_image(img_path, order=[3,4,6,9]):
 
 model_bp = Blueprint("model", __name__)
 
-@model_bp.route("/predict", methods=["POST"])
-def predict():
+
+def predict_age(prepare, inline=False):
+    """Run ``prepare()`` (-> image tensor) and the model, honouring the app's
+    pipeline/batching settings. Raises QueueFullError when saturated.
+
+    ``inline`` runs ``prepare`` in the calling thread instead of the
+    preprocessing pool (job workers are already off the request path)."""
+    cfg = current_app.config
+    if cfg["PIPELINE_ENABLED"] and not inline:
+        return current_app.pipeline.submit(prepare).result(timeout=cfg["REQUEST_TIMEOUT_S"])
+
+    img_tensor = prepare()
+    if cfg["BATCHING_ENABLED"]:
+        return current_app.engine.predict(img_tensor, timeout=cfg["REQUEST_TIMEOUT_S"])
+    return current_app.engine.run_batch(img_tensor)[0]
+
+
+def busy_response(message):
+    response = jsonify({"error": message})
+    response.headers["Retry-After"] = "1"
+    return response, 503
+
+
+def matching_face_box(img, face):
+    """The PAD session's face box, if ``img`` has the same aspect as its frames."""
+    if face is None:
+        return None
+    h, w = img.shape[:2]
+    return face["box"] if abs(w / h - face["aspect"]) <= 0.02 * face["aspect"] else None
+
+
+def predict_upload(data, filename, inline=False, face=None):
+    """Cached preprocess + inference for one uploaded image.
+
+    ``face`` is a just-passed PAD session's face (see completed_face); its
+    box replaces face detection when the upload matches the PAD frames.
+    Returns the response dict; raises QueueFullError / TimeoutError when the
+    pipeline is saturated. Needs an app context.
+    """
+    cfg = current_app.config
+    writer = current_app.debug_writer
+    bg_remover = current_app.bg_remover
+    order = cfg["PREPROCESS_ORDER"]
+    artifacts = {} if writer.should_capture() else None
+    save_path = None
+
+    cache = current_app.result_cache
+    signature = pipeline_signature(order, bg_remover)
+    if face is not None:
+        signature += ":face=" + ",".join(f"{v:.3f}" for v in face["box"])
+    digest = content_hash(data) if cache.enabled else None
+    cached_age = cache.get_age(digest, signature) if digest else None
+    if cached_age is not None:
+        return {"predicted_age": cached_age, "cached": True}
+
+    try:
+        # Preprocess + inference
+        if cfg["IN_MEMORY_PIPELINE"]:
+            load = lambda: decode_image(data)
+        else:
+            # Save temporarily in uploads/
+            save_path = os.path.join(cfg["UPLOAD_FOLDER"], f"{uuid.uuid4().hex}_{filename}")
+            with open(save_path, "wb") as f:
+                f.write(data)
+            load = lambda: load_image(save_path)
+
+        def prepare():
+            with timed("decode"):
+                img = load()
+            return preprocess_array(img, order=order, artifacts=artifacts, bg_remover=bg_remover,
+                                    face_box=matching_face_box(img, face))
+
+        if digest:
+            prepare = cache.cached_prepare(digest, signature, prepare)
+
+        pred_age = int(predict_age(prepare, inline=inline))
+        if digest:
+            cache.put_age(digest, signature, pred_age)
+
+        if artifacts:
+            writer.submit(filename, artifacts)
+
+        # pred_age = preprocess_and_predict_h5(save_path, current_app.model, current_app.root_path)
+        return {"predicted_age": pred_age}
+
+    finally:
+        # Clean up temp file
+        if save_path and os.path.exists(save_path):
+            os.remove(save_path)
+
+
+def pad_face():
+    """Face from the caller's just-passed PAD session (form field, header or cookie)."""
+    return completed_face(get_session_id(request.form), current_app.config["PAD_FACE_BOX_MAX_AGE"])
+
+
+def read_upload():
+    """(filename, bytes) of the ``image`` upload, or (None, error response)."""
     if "image" not in request.files:
-        return jsonify({"error": "No image uploaded"}), 400
+        return None, (jsonify({"error": "No image uploaded"}), 400)
 
     file = request.files["image"]
     if file.filename == "":
-        return jsonify({"error": "Empty filename"}), 400
+        return None, (jsonify({"error": "Empty filename"}), 400)
+
+    return secure_filename(file.filename) or "upload", file.read()
 
-    # Save temporarily in uploads/
-    filename = secure_filename(file.filename)
-    save_path = os.path.join(current_app.config["UPLOAD_FOLDER"], filename)
-    file.save(save_path)
+
+@model_bp.route("/predict", methods=["POST"])
+def predict():
+    filename, data = read_upload()
+    if filename is None:
+        return data
 
     try:
-        # Preprocess + inference
-        img_tensor = preprocess_image(save_path).to(current_app.device)
+        return jsonify(predict_upload(data, filename, face=pad_face()))
 
-        with torch.no_grad():
-            logits = current_app.model(img_tensor)
-            pred_age = coral_decode(logits)
-        
-        
-        # pred_age = preprocess_and_predict_h5(save_path, current_app.model, current_app.root_path)
-        return jsonify({"predicted_age": int(pred_age)})
+    except QueueFullError as e:
+        record_error("predict", e)
+        return busy_response(str(e))
+
+    except TimeoutError as e:
+        record_error("predict", e)
+        return busy_response("Timed out waiting for inference")
     
     except Exception as e:
+        record_error("predict", e)
         return jsonify({"error": str(e)}), 500
 
-    finally:
-        # Clean up temp file
-        # if os.path.exists(save_path):
-        #     os.remove(save_path)
-        pass
\ No newline at end of file
+
+# ------------------------------
+# Async jobs
+# ------------------------------
+def jobs_disabled():
+    return jsonify({"error": "Async jobs need a shared job store (AEGIS_JOB_STORE_BACKEND=redis) "
+                             "when more than one worker serves requests"}), 503
+
+
+@model_bp.route("/jobs/predict", methods=["POST"])
+def submit_predict_job():
+    """Queue a prediction and return its job id at once (202).
+
+    Form fields: ``lane`` ("interactive" or "bulk") and, when job callbacks
+    are enabled, ``callback_url`` (host must be in JOB_CALLBACK_ALLOWLIST)
+    to receive the finished job as a JSON POST.
+    """
+    if not current_app.jobs.enabled:
+        return jobs_disabled()
+
+    filename, data = read_upload()
+    if filename is None:
+        return data
+
+    lane = request.form.get("lane", "interactive")
+    callback_url = request.form.get("callback_url") or None
+    if callback_url and not current_app.config["JOB_CALLBACKS_ENABLED"]:
+        return jsonify({"error": "Job callbacks are disabled"}), 403
+
+    app = current_app._get_current_object()
+    face = pad_face()
+
+    def run():
+        with app.app_context():
+            return predict_upload(data, filename, inline=True, face=face)
+
+    try:
+        job_id = current_app.jobs.submit(run, lane=lane, callback_url=callback_url)
+    except QueueFullError as e:
+        return busy_response(str(e))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    response = jsonify({"job_id": job_id, "status": "queued", "lane": lane})
+    response.headers["Location"] = url_for("model.get_job", job_id=job_id)
+    return response, 202
+
+
+@model_bp.route("/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    if not current_app.jobs.enabled:
+        return jobs_disabled()
+    job = current_app.jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown or expired job"}), 404
+    return jsonify(job)
+
+
+@model_bp.route("/predict_batch", methods=["POST"])
+def predict_batch():
+    """Bulk age estimation, streamed back as NDJSON (one line per image).
+
+    Accepts a multipart list under ``images``, a zip archive under ``archive``,
+    or (when BULK_ALLOW_LOCAL_PATHS is set) a JSON body ``{"path": <dir>}``.
+    """
+    cfg = current_app.config
+    try:
+        batch_size = int(request.values.get("batch_size", cfg["BULK_BATCH_SIZE"]))
+    except ValueError:
+        return jsonify({"error": "batch_size must be an integer"}), 400
+    batch_size = max(1, min(batch_size, cfg["BULK_MAX_BATCH_SIZE"]))
+
+    # Uploads are read here: the streamed body runs after the view returns,
+    # when the request's files may already be closed
+    data = request.get_json(silent=True)
+    if request.files.getlist("images"):
+        files = [f for f in request.files.getlist("images") if f.filename]
+        items = [(secure_filename(f.filename), f.read()) for f in files]
+    elif "archive" in request.files:
+        items = iter_zip(io.BytesIO(request.files["archive"].read()))
+    elif isinstance(data, dict) and data.get("path"):
+        if not cfg["BULK_ALLOW_LOCAL_PATHS"]:
+            return jsonify({"error": "Local paths are disabled"}), 403
+        path = data["path"]
+        if not isinstance(path, str) or not os.path.isdir(path):
+            return jsonify({"error": f"Not a directory: {path}"}), 400
+        items = iter_directory(path)
+    else:
+        return jsonify({"error": "No images uploaded"}), 400
+
+    # Bulk work yields to in-flight PAD frames, like async jobs
+    results = predict_stream(
+        items,
+        current_app.priority_gate.deferring(current_app.engine.run_batch),
+        batch_size=batch_size,
+        workers=cfg["BULK_PREPROCESS_WORKERS"],
+        order=cfg["PREPROCESS_ORDER"],
+        bg_remover=current_app.bg_remover,
+        cache=current_app.result_cache,
+    )
+    body = (json.dumps(r) + "\n" for r in results)
+    return Response(stream_with_context(body), mimetype="application/x-ndjson")
+
+
+@model_bp.route("/engine_stats", methods=["GET"])
+def engine_stats():
+    stats = current_app.engine.stats()
+    stats["preprocess"] = current_app.pipeline.stats()
+    stats["jobs"] = current_app.jobs.stats()
+    return jsonify(stats)
+
+
+@model_bp.route("/cache_stats", methods=["GET"])
+def cache_stats():
+    return jsonify(current_app.result_cache.stats())
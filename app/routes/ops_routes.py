@@ -0,0 +1,47 @@
+import hmac
+
+from flask import Blueprint, Response, current_app, jsonify, request
+
+from app.metrics import REGISTRY
+
+ops_bp = Blueprint("ops", __name__)
+
+ADMIN_TOKEN_HEADER = "X-Admin-Token"
+
+
+@ops_bp.route("/metrics", methods=["GET"])
+def metrics():
+    if not current_app.config["METRICS_ENABLED"]:
+        return jsonify({"error": "Not found"}), 404
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+
+def admin_denied():
+    """Error response unless the request carries ADMIN_TOKEN (admin routes are off without one)."""
+    token = current_app.config["ADMIN_TOKEN"]
+    if not token:
+        return jsonify({"error": "Not found"}), 404
+    if not hmac.compare_digest(request.headers.get(ADMIN_TOKEN_HEADER, ""), token):
+        return jsonify({"error": "Forbidden"}), 403
+    return None
+
+
+@ops_bp.route("/admin/profile", methods=["GET", "POST"])
+def profile():
+    """POST {"requests": N, "mode": "cprofile" | "torch"} profiles the next N
+    requests into PROFILE_DIR; GET reports progress and the files written."""
+    denied = admin_denied()
+    if denied:
+        return denied
+
+    if request.method == "GET":
+        return jsonify(current_app.profiler.status())
+
+    data = request.get_json(silent=True) or {}
+    try:
+        status = current_app.profiler.arm(data.get("requests", 10), mode=data.get("mode", "cprofile"))
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 409
+    return jsonify(status), 202
@@ -1,183 +1,194 @@
-from flask import Blueprint, request, jsonify, render_template
-import cv2, base64, time, random
+from flask import Blueprint, request, jsonify, render_template, current_app
+import cv2, base64, json, time, uuid
 import numpy as np
-import mediapipe as mp
+
+from app.frame_gate import downscale
+from app.metrics import PAD_FRAMES, PAD_SESSIONS, record_error, timed
+from app.pad_challenges import (
+    new_session_state, current_challenge, session_done, session_timed_out, step_session,
+    DONE, TEMPORAL_CHALLENGES, TIMEOUT,
+)
 
 pad_bp = Blueprint("pad", __name__)
 
+SESSION_COOKIE = "pad_session"
+SESSION_HEADER = "X-PAD-Session"
+
 # ------------------------------
-# MediaPipe setup
+# Per-session challenge state
 # ------------------------------
-mp_face_mesh = mp.solutions.face_mesh
-face_mesh = mp_face_mesh.FaceMesh(
-    static_image_mode=False,
-    refine_landmarks=True,
-    max_num_faces=1
-)
+def get_session_id(data=None):
+    """Session id from the JSON body, the X-PAD-Session header or the cookie."""
+    if data and data.get("session_id"):
+        return data["session_id"]
+    return request.headers.get(SESSION_HEADER) or request.cookies.get(SESSION_COOKIE)
 
 
-LEFT_EYE = [33, 160, 158, 133, 153, 144]
-RIGHT_EYE = [362, 385, 387, 263, 373, 380]
-NOSE_TIP = 1
+def completed_face(session_id, max_age):
+    """Face box of a PAD session that passed within ``max_age`` seconds, or None."""
+    state = current_app.pad_sessions.get(session_id) if session_id else None
+    if state is None or not session_done(state) or "face" not in state:
+        return None
+    face = state["face"]
+    return face if time.time() - face["time"] <= max_age else None
 
-def np_point(landmarks, idx):
-    return np.array([landmarks[idx].x, landmarks[idx].y], dtype=np.float32)
 
-def eye_aspect_ratio(landmarks, eye_idx):
-    p1, p2, p3, p4, p5, p6 = [np_point(landmarks, i) for i in eye_idx]
-    return (np.linalg.norm(p2-p6) + np.linalg.norm(p3-p5)) / (2.0 * np.linalg.norm(p1-p4) + 1e-6)
+@pad_bp.route("/start_session", methods=["POST"])
+def start_session():
+    session_id = uuid.uuid4().hex
+    current_app.pad_sessions.set(session_id, new_session_state())
 
-def head_turn_direction(landmarks, left_thresh=0.35, right_thresh=0.65):
-    nose_x = float(landmarks[NOSE_TIP].x)
-    if nose_x < left_thresh:
-        return "right"
-    elif nose_x > right_thresh:
-        return "left"
-    return "center"
+    response = jsonify({"status": "ok", "message": "New challenge session started",
+                        "session_id": session_id})
+    response.set_cookie(SESSION_COOKIE, session_id, httponly=True, samesite="Lax",
+                        max_age=current_app.config["PAD_SESSION_TTL"])
+    return response
 
-# ------------------------------
-# Alignment check
-# ------------------------------
-def check_alignment(landmarks, frame_shape):
-    h, w, _ = frame_shape
-    xs = [lm.x for lm in landmarks]
-    ys = [lm.y for lm in landmarks]
 
-    x1, x2 = min(xs) * w, max(xs) * w
-    y1, y2 = min(ys) * h, max(ys) * h
-    face_w, face_h = x2 - x1, y2 - y1
+def failed(message):
+    return {"challenge": "failed", "message": message, "passed": False}
 
-    if face_w < 0.2 * w or face_h < 0.2 * h:
-        return False, "Face too far/small"
 
-    cx, cy = (x1 + x2) / 2, (y1 + y2) / 2
-    if cx < 0.3 * w or cx > 0.7 * w or cy < 0.3 * h or cy > 0.7 * h:
-        return False, "Face not centered"
+def read_frame():
+    """(session_id, jpeg bytes) from a raw image/* body or the legacy JSON body.
 
-    return True, "Face aligned"
+    Raw bodies carry the session in the X-PAD-Session header, a ``session_id``
+    query argument or the cookie; JSON bodies carry a base64 data URL.
+    """
+    if request.mimetype.startswith("image/"):
+        session_id = request.args.get("session_id") or get_session_id()
+        return session_id, request.get_data(cache=False)
 
-# ------------------------------
-# Challenge system with timeout
-# ------------------------------
-ALL_CHALLENGES = ["alignment", "blink", "turn_left", "turn_right"]
-challenge_list = []
-challenge_index = 0
-challenge_start_time = None
-CHALLENGE_TIMEOUT = 10  # seconds
-
-def reset_challenges():
-    global challenge_list, challenge_index, challenge_start_time
-    challenge_list = random.sample(ALL_CHALLENGES, len(ALL_CHALLENGES))
-    challenge_index = 0
-    challenge_start_time = time.time()
+    data = request.get_json(silent=True)
+    if not data or "frame" not in data:
+        return get_session_id(data), None
+    img_data = data["frame"].split(",")[1]
+    return get_session_id(data), base64.b64decode(img_data)
+
+
+def handle_frame(session_id, frame_bytes):
+    """Run one encoded frame through the session's challenge; returns the status dict."""
+    store = current_app.pad_sessions
+    pool = current_app.face_mesh_pool
+    gate = current_app.pad_frame_gate
+    state = store.get(session_id) if session_id else None
+    if state is None:
+        return failed("⚠️ No active session, please start again")
+
+    # Finished sessions never need the frame decoded
+    if session_done(state):
+        gate.early_exit()
+        return dict(DONE)
+    if session_timed_out(state):
+        gate.early_exit()
+        PAD_SESSIONS.inc(outcome="timeout")
+        store.delete(session_id)
+        pool.release(session_id)
+        gate.forget(session_id)
+        return dict(TIMEOUT)
+
+    with timed("pad_decode"):
+        np_img = np.frombuffer(frame_bytes, np.uint8)
+        frame = cv2.imdecode(np_img, cv2.IMREAD_COLOR)
+        if frame is None:
+            record_error("process_frame", "InvalidFrame")
+            return failed("⚠️ Invalid frame")
+        frame = downscale(frame, current_app.config["PAD_MAX_FRAME_SIDE"])
 
-@pad_bp.route("/start_session", methods=["POST"])
-def start_session():
-    reset_challenges()
-    return jsonify({"status": "ok", "message": "New challenge session started"})
+    # Blinks and turns need every frame as a sample, even near-identical ones
+    replay = current_challenge(state) not in TEMPORAL_CHALLENGES
+    thumb, cached = gate.check(session_id, frame, replay=replay)
+    if cached is not None:
+        return cached
+
+    rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    try:
+        # Job workers hold off while liveness frames are in flight
+        with current_app.priority_gate.frame(), pool.session(session_id) as face_mesh:
+            with timed("face_mesh"):
+                res = face_mesh.process(rgb)
+
+            # The session's FaceMesh is held until the state is written back,
+            # so concurrent frames of one session (retries, a second tab) are
+            # serialized and can't drop each other's updates: re-read here
+            state = store.get(session_id)
+            if state is None:
+                return failed("⚠️ No active session, please start again")
+            landmarks = res.multi_face_landmarks[0].landmark if res.multi_face_landmarks else None
+            with timed("pad_challenge"):
+                status = step_session(state, landmarks, frame.shape)
+            store.set(session_id, state)
+    except TimeoutError as e:
+        record_error("face_mesh", e)
+        return {"challenge": "busy", "message": "⚠️ Server busy, retrying", "passed": False}
+
+    PAD_FRAMES.inc(challenge=status["challenge"], passed=bool(status.get("passed")))
+    gate.remember(session_id, thumb, status)
+    if status["challenge"] in ("done", "failed"):
+        PAD_SESSIONS.inc(outcome=status["challenge"])
+        pool.release(session_id)
+        gate.forget(session_id)
+    return status
 
-# ------------------------------
-# Challenge instructions
-# ------------------------------
-CHALLENGE_INSTRUCTIONS = {
-    "alignment": "Please center your face in the camera",
-    "blink": "Blink your eyes",
-    "turn_left": "Turn your face to the left",
-    "turn_right": "Turn your face to the right",
-}
 
 @pad_bp.route("/process_frame", methods=["POST"])
 def process_frame():
-    global challenge_index, challenge_start_time
-
-    data = request.json
-    if not data or "frame" not in data:
-        return jsonify({"challenge": "failed", "message": "⚠️ No frame received", "passed": False})
-
+    if (request.content_length or 0) > current_app.config["PAD_MAX_FRAME_BYTES"]:
+        return jsonify(failed("⚠️ Frame too large")), 413
     try:
-        img_data = data["frame"].split(",")[1]
-        img = base64.b64decode(img_data)
-        np_img = np.frombuffer(img, np.uint8)
-        frame = cv2.imdecode(np_img, cv2.IMREAD_COLOR)
-        if frame is None:
-            return jsonify({"challenge": "failed", "message": "⚠️ Invalid frame", "passed": False})
+        session_id, frame_bytes = read_frame()
     except Exception as e:
-        return jsonify({"challenge": "failed", "message": f"⚠️ Frame decode error: {str(e)}", "passed": False})
+        record_error("process_frame", e)
+        return jsonify(failed(f"⚠️ Frame decode error: {str(e)}"))
+    if not frame_bytes:
+        return jsonify(failed("⚠️ No frame received"))
+    return jsonify(handle_frame(session_id, frame_bytes))
 
-    rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-    res = face_mesh.process(rgb)
-
-    if challenge_index >= len(challenge_list):
-        return jsonify({"challenge": "done", "message": "✅ All challenges passed!", "passed": True})
-
-    current_challenge = challenge_list[challenge_index]
-    elapsed = time.time() - challenge_start_time
-
-    # Use friendly instructions by default
-    status = {
-        "challenge": current_challenge,
-        "passed": False,
-        "message": CHALLENGE_INSTRUCTIONS.get(current_challenge, "Follow the challenge")
-    }
-
-    if elapsed > CHALLENGE_TIMEOUT:
-        reset_challenges()
-        return jsonify({"challenge": "failed", "message": "❌ Spoof Detected (timeout)", "passed": False})
-
-    if not res.multi_face_landmarks:
-        status["message"] = "No face detected"
-        return jsonify(status)
-
-    landmarks = res.multi_face_landmarks[0].landmark
-
-    if current_challenge == "alignment":
-        ok, msg = check_alignment(landmarks, frame.shape)
-        status["message"] = msg if not ok else "✅ Face centered"
-        if ok:
-            status["passed"] = True
-            challenge_index += 1
-            challenge_start_time = time.time()
-            if challenge_index < len(challenge_list):
-                status["next_challenge"] = CHALLENGE_INSTRUCTIONS[challenge_list[challenge_index]]
-
-    elif current_challenge == "blink":
-        ear_l = eye_aspect_ratio(landmarks, LEFT_EYE)
-        ear_r = eye_aspect_ratio(landmarks, RIGHT_EYE)
-        if ear_l < 0.2 and ear_r < 0.2:
-            status["message"] = "✅ Blink detected"
-            status["passed"] = True
-            challenge_index += 1
-            challenge_start_time = time.time()
-            if challenge_index < len(challenge_list):
-                status["next_challenge"] = CHALLENGE_INSTRUCTIONS[challenge_list[challenge_index]]
-
-    elif current_challenge == "turn_left":
-        direction = head_turn_direction(landmarks)
-        status["message"] = "Please turn your face left"
-        if direction == "left":
-            status["message"] = "✅ Face turned left"
-            status["passed"] = True
-            challenge_index += 1
-            challenge_start_time = time.time()
-            if challenge_index < len(challenge_list):
-                status["next_challenge"] = CHALLENGE_INSTRUCTIONS[challenge_list[challenge_index]]
-
-    elif current_challenge == "turn_right":
-        direction = head_turn_direction(landmarks)
-        status["message"] = "Please turn your face right"
-        if direction == "right":
-            status["message"] = "✅ Face turned right"
-            status["passed"] = True
-            challenge_index += 1
-            challenge_start_time = time.time()
-            if challenge_index < len(challenge_list):
-                status["next_challenge"] = CHALLENGE_INSTRUCTIONS[challenge_list[challenge_index]]
-
-    if challenge_index >= len(challenge_list):
-        reset_challenges()
-        return jsonify({"challenge": "done", "message": "✅ All challenges passed!", "passed": True})
-
-    return jsonify(status)
+
+@pad_bp.route("/pad_stats", methods=["GET"])
+def pad_stats():
+    return jsonify({
+        "frames": current_app.pad_frame_gate.stats(),
+        "face_mesh_pool": current_app.face_mesh_pool.stats(),
+    })
+
+
+# ------------------------------
+# WebSocket transport (optional)
+# ------------------------------
+def pad_socket(ws):
+    """One connection per PAD session: binary JPEG frames in, JSON statuses out.
+
+    The session comes from ``?session_id=`` or the cookie set by /start_session.
+    The socket is closed once the session is done or failed.
+    """
+    session_id = request.args.get("session_id") or request.cookies.get(SESSION_COOKIE)
+    max_bytes = current_app.config["PAD_MAX_FRAME_BYTES"]
+    while True:
+        frame_bytes = ws.receive()
+        if frame_bytes is None:
+            break
+        if isinstance(frame_bytes, str) or len(frame_bytes) > max_bytes:
+            status = failed("⚠️ Expected a binary JPEG frame")
+        else:
+            status = handle_frame(session_id, frame_bytes)
+        ws.send(json.dumps(status))
+        if status["challenge"] in ("done", "failed"):
+            break
+
+
+def register_pad_websocket(app):
+    """Mount /ws/pad on ``app`` (requires flask-sock)."""
+    try:
+        from flask_sock import Sock
+    except ImportError:
+        app.logger.warning("PAD_WEBSOCKET_ENABLED is set but flask-sock is not installed; "
+                           "falling back to HTTP frames")
+        app.config["PAD_WEBSOCKET_ENABLED"] = False
+        return None
+    sock = Sock(app)
+    sock.route("/ws/pad")(pad_socket)
+    return sock
 
 # @pad_bp.route("/")
 # def index():
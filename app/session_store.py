@@ -0,0 +1,129 @@
+import copy
+import json
+import math
+import threading
+import time
+from collections import OrderedDict
+
+
+# ------------------------------
+# Session-keyed state stores
+# ------------------------------
+class SessionStore:
+    """get/set/delete of JSON-serializable session state with a TTL."""
+
+    def get(self, session_id):
+        raise NotImplementedError
+
+    def set(self, session_id, state):
+        raise NotImplementedError
+
+    def delete(self, session_id):
+        raise NotImplementedError
+
+
+class InMemorySessionStore(SessionStore):
+    """Per-process LRU: at most ``max_sessions`` entries, each expiring ``ttl``
+    seconds after its last write. States are copied in and out, so callers
+    never mutate the stored state outside the lock (as with Redis)."""
+
+    def __init__(self, ttl=120, max_sessions=10000):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        with self._lock:
+            entry = self._data.get(session_id)
+            if entry is None:
+                return None
+            expires, state = entry
+            if expires < time.monotonic():
+                del self._data[session_id]
+                return None
+            self._data.move_to_end(session_id)
+            return copy.deepcopy(state)
+
+    def set(self, session_id, state):
+        with self._lock:
+            self._data[session_id] = (time.monotonic() + self.ttl, copy.deepcopy(state))
+            self._data.move_to_end(session_id)
+            while len(self._data) > self.max_sessions:
+                self._data.popitem(last=False)
+
+    def delete(self, session_id):
+        with self._lock:
+            self._data.pop(session_id, None)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class RedisSessionStore(SessionStore):
+    """Shared store for multi-worker / multi-node deployments.
+
+    ``client`` only needs redis-py's ``get``, ``set(name, value, ex=...)`` and
+    ``delete``; LocalKV provides the same interface in-process. ``ttl`` is
+    rounded up to whole seconds, since redis-py rejects a float ``ex``.
+    """
+
+    def __init__(self, client, ttl=120, prefix="aegis:pad:"):
+        self.client = client
+        self.ttl = math.ceil(ttl)
+        self.prefix = prefix
+
+    def get(self, session_id):
+        raw = self.client.get(self.prefix + session_id)
+        return None if raw is None else json.loads(raw)
+
+    def set(self, session_id, state):
+        self.client.set(self.prefix + session_id, json.dumps(state), ex=self.ttl)
+
+    def delete(self, session_id):
+        self.client.delete(self.prefix + session_id)
+
+
+class LocalKV:
+    """In-process stand-in for a Redis client (get/set with ex/delete).
+
+    Values are stored serialized, like in Redis, so code behind
+    RedisSessionStore sees the same copy semantics as in production.
+    """
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        with self._lock:
+            entry = self._data.get(name)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires is not None and expires < time.monotonic():
+                del self._data[name]
+                return None
+            return value
+
+    def set(self, name, value, ex=None):
+        with self._lock:
+            self._data[name] = (None if ex is None else time.monotonic() + ex, value)
+
+    def delete(self, name):
+        with self._lock:
+            self._data.pop(name, None)
+
+
+def create_session_store(backend="memory", ttl=120, max_sessions=10000, redis_url=None, prefix="aegis:pad:"):
+    """"memory" (per-process LRU), "redis" (shared, needs redis-py) or "local" (LocalKV).
+
+    ``prefix`` namespaces the keys of the key-value backends."""
+    if backend == "memory":
+        return InMemorySessionStore(ttl=ttl, max_sessions=max_sessions)
+    if backend == "local":
+        return RedisSessionStore(LocalKV(), ttl=ttl, prefix=prefix)
+    if backend == "redis":
+        import redis
+        return RedisSessionStore(redis.Redis.from_url(redis_url), ttl=ttl, prefix=prefix)
+    raise ValueError(f"Unknown session store backend: {backend!r}")
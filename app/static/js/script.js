@@ -205,6 +205,9 @@ document.addEventListener('DOMContentLoaded', () => {
   let timeLeft = 10;
   let isPaused = false;
   let sessionActive = false;
+  let sessionId = null;
+  let padSocket = null;
+  let inFlight = false;   // one frame at a time; slow responses drop frames instead of queueing
 
   if (video) {
     navigator.mediaDevices.getUserMedia({ video: true })
@@ -229,12 +232,16 @@ document.addEventListener('DOMContentLoaded', () => {
       console.warn("⚠️ PAD video not ready yet");
       return null;
     }
+    // Downscale before encoding: FaceMesh only needs a small frame
+    const scale = Math.min(1, (window.PAD_FRAME_WIDTH || video.videoWidth) / video.videoWidth);
     const canvas = document.createElement("canvas");
-    canvas.width = video.videoWidth;
-    canvas.height = video.videoHeight;
+    canvas.width = Math.round(video.videoWidth * scale);
+    canvas.height = Math.round(video.videoHeight * scale);
     const ctx = canvas.getContext("2d");
-    ctx.drawImage(video, 0, 0);
-    return canvas.toDataURL("image/jpeg");
+    ctx.drawImage(video, 0, 0, canvas.width, canvas.height);
+    return new Promise((resolve) =>
+      canvas.toBlob(resolve, "image/jpeg", window.PAD_FRAME_QUALITY || 0.7)
+    );
   }
 
   function startCountdown() {
@@ -250,88 +257,116 @@ document.addEventListener('DOMContentLoaded', () => {
     }, 1000);
   }
 
+  function openSocket() {
+    const scheme = location.protocol === "https:" ? "wss" : "ws";
+    const socket = new WebSocket(`${scheme}://${location.host}/ws/pad?session_id=${sessionId}`);
+    socket.binaryType = "arraybuffer";
+    socket.onmessage = (event) => {
+      inFlight = false;
+      handleResult(JSON.parse(event.data));
+    };
+    socket.onclose = () => {
+      inFlight = false;
+      if (padSocket === socket) padSocket = null;   // fall back to HTTP frames
+    };
+    return socket;
+  }
+
   async function sendFrame() {
-    if (isPaused || !sessionActive) return;
+    if (isPaused || !sessionActive || inFlight) return;
 
-    const frame = captureFrame();
+    const frame = await captureFrame();
     if (!frame) return;
 
+    if (padSocket && padSocket.readyState === WebSocket.OPEN) {
+      inFlight = true;
+      padSocket.send(frame);
+      return;
+    }
+
+    inFlight = true;
     try {
-      let res = await fetch("/process_frame", {
+      const res = await fetch("/process_frame", {
         method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ frame: frame }),
+        headers: { "Content-Type": "image/jpeg", "X-PAD-Session": sessionId },
+        body: frame,
       });
+      handleResult(await res.json());
+    } catch (err) {
+      console.error("❌ Error sending PAD frame:", err);
+      statusText.innerText = "⚠️ Connection error";
+    } finally {
+      inFlight = false;
+    }
+  }
 
-      let data = await res.json();
-      console.log("PAD Response:", data);
-
-      
+  function handleResult(data) {
+    console.log("PAD Response:", data);
+    if (!sessionActive) return;
 
-      if (data.challenge === "done") {
-        window.securityPassed = true;
-        const beep = document.getElementById("success-sound");
+    if (data.challenge === "done") {
+      window.securityPassed = true;
+      const beep = document.getElementById("success-sound");
+      if (beep) {
+          beep.currentTime = 0; // rewind in case it's still playing
+          beep.play().catch(err => console.warn("Audio play blocked:", err));
+        }
+      challengeText.innerText = "✅ All challenges passed!";
+      statusText.innerText = data.message;
+      timerText.innerText = "⏳ Finished!";
+      clearInterval(loop);
+      clearInterval(countdownLoop);
+      sessionActive = false;
+    } else if (data.challenge === "failed") {
+      const beep = document.getElementById("fail-sound");
         if (beep) {
-            beep.currentTime = 0; // rewind in case it's still playing
-            beep.play().catch(err => console.warn("Audio play blocked:", err));
-          }
-        challengeText.innerText = "✅ All challenges passed!";
-        statusText.innerText = data.message;
-        timerText.innerText = "⏳ Finished!";
-        clearInterval(loop);
-        clearInterval(countdownLoop);
-        sessionActive = false;
-      } else if (data.challenge === "failed") {
-        const beep = document.getElementById("fail-sound");
-          if (beep) {
-            beep.currentTime = 0; // rewind in case it's still playing
-            beep.play().catch(err => console.warn("Audio play blocked:", err));
-          }
+          beep.currentTime = 0; // rewind in case it's still playing
+          beep.play().catch(err => console.warn("Audio play blocked:", err));
+        }
 
-        challengeText.innerText = "❌ Spoof Detected";
-        statusText.innerText = data.message;
-        timerText.innerText = "⏳ Challenge failed";
-        clearInterval(loop);
+      challengeText.innerText = "❌ Spoof Detected";
+      statusText.innerText = data.message;
+      timerText.innerText = "⏳ Challenge failed";
+      clearInterval(loop);
+      clearInterval(countdownLoop);
+      sessionActive = false;
+    } else if (data.challenge === "busy") {
+      statusText.innerText = data.message;   // server saturated, next frame retries
+    } else {
+      challengeText.innerText = "Challenge: " + data.challenge;
+      statusText.innerText = "Status: " + data.message;
+
+      if (data.passed) {
         clearInterval(countdownLoop);
-        sessionActive = false;
-      } else {
-        challengeText.innerText = "Challenge: " + data.challenge;
-        statusText.innerText = "Status: " + data.message;
-
-        if (data.passed) {
-          clearInterval(countdownLoop);
-          isPaused = true;
-
-          // 🔊 Play success sound
-          const beep = document.getElementById("success-sound");
-          if (beep) {
-            beep.currentTime = 0; // rewind in case it's still playing
-            beep.play().catch(err => console.warn("Audio play blocked:", err));
-          }
+        isPaused = true;
 
-          if (data.next_challenge) {
-            challengeText.innerText = `✅ Passed! Next: ${data.next_challenge} (2s...)`;
-          } else {
-            challengeText.innerText = `✅ Passed!`;
-          }
-          timerText.innerText = "⏳ Preparing next challenge...";
+        // 🔊 Play success sound
+        const beep = document.getElementById("success-sound");
+        if (beep) {
+          beep.currentTime = 0; // rewind in case it's still playing
+          beep.play().catch(err => console.warn("Audio play blocked:", err));
+        }
 
-          setTimeout(() => {
-            isPaused = false;
-            startCountdown();
-          }, 2000);
+        if (data.next_challenge) {
+          challengeText.innerText = `✅ Passed! Next: ${data.next_challenge} (2s...)`;
+        } else {
+          challengeText.innerText = `✅ Passed!`;
         }
+        timerText.innerText = "⏳ Preparing next challenge...";
 
+        setTimeout(() => {
+          isPaused = false;
+          startCountdown();
+        }, 2000);
       }
-    } catch (err) {
-      console.error("❌ Error sending PAD frame:", err);
-      statusText.innerText = "⚠️ Connection error";
+
     }
   }
 
   startBtn?.addEventListener("click", async () => {
     try {
-      await fetch("/start_session", { method: "POST" });
+      const res = await fetch("/start_session", { method: "POST" });
+      sessionId = (await res.json()).session_id;
       sessionActive = true;
 
       challengeText.innerText = "Challenge: Waiting...";
@@ -342,7 +377,11 @@ document.addEventListener('DOMContentLoaded', () => {
       clearInterval(countdownLoop);
       isPaused = false;
 
-      loop = setInterval(sendFrame, 1500);
+      if (padSocket) padSocket.close();
+      padSocket = window.PAD_WEBSOCKET ? openSocket() : null;
+      inFlight = false;
+
+      loop = setInterval(sendFrame, window.PAD_FRAME_INTERVAL_MS || 1500);
       startCountdown();
     } catch (err) {
       console.error("❌ Failed to start session:", err);
@@ -0,0 +1,24 @@
+import time
+from contextlib import contextmanager
+
+
+class StageTimer:
+    """Collects named wall-clock durations, e.g. for the startup breakdown."""
+
+    def __init__(self):
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+    def total(self):
+        return sum(self.stages.values())
+
+    def summary(self):
+        parts = [f"{name}={seconds * 1000:.0f}ms" for name, seconds in self.stages.items()]
+        return ", ".join(parts + [f"total={self.total() * 1000:.0f}ms"])
@@ -0,0 +1,131 @@
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from app.metrics import event_log, record_error, unrecorded
+
+
+def synthetic_capture(height=480, width=640):
+    """Smooth face-sized test image (RGB uint8): exercises every stage
+    without shipping a sample photo."""
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    img = np.stack([x / width * 255, y / height * 255, (x + y) / (width + height) * 255], axis=-1)
+    cv2.ellipse(img, (width // 2, height // 2), (width // 6, height // 4), 0, 0, 360, (200, 160, 140), -1)
+    return img.astype(np.uint8)
+
+
+# ------------------------------
+# Startup warmup / readiness
+# ------------------------------
+class Warmup:
+    """Runs dummy work through every request-path stage in a background thread.
+
+    The first request otherwise pays for oneDNN primitive creation (per batch
+    shape), the rembg/MediaPipe sessions and the face detector. Each stage
+    runs ``iterations`` times; /readyz reports 503 until all of them are done.
+    Optional stages whose dependency is missing are recorded as skipped; a
+    failed model forward keeps the app unready. The synthetic captures stay
+    out of the stage histograms and the event log. start() is per process,
+    so under gunicorn preload it is called from post_fork, not in the master.
+    """
+
+    def __init__(self, app, iterations=3):
+        self.app = app
+        self.iterations = max(1, int(iterations))
+        self._lock = threading.Lock()
+        self._pid = None
+        self._state = "pending"
+        self._stages = {}
+        self._error = None
+        self._seconds = None
+
+    def start(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._state, self._stages, self._error = "running", {}, None
+        threading.Thread(target=self._run, name="warmup", daemon=True).start()
+
+    def mark_ready(self):
+        """Skip warmup (WARMUP_ENABLED off)."""
+        with self._lock:
+            self._state = "ready"
+
+    @property
+    def ready(self):
+        return self._state == "ready"
+
+    def status(self):
+        with self._lock:
+            return {"state": self._state, "stages": dict(self._stages),
+                    "seconds": self._seconds, "error": self._error}
+
+    # ---- stages ----
+    def _run(self):
+        start = time.perf_counter()
+        try:
+            with unrecorded():
+                for name, fn, required in self._plan():
+                    self._stage(name, fn, required)
+            state, error = "ready", None
+        except Exception as e:
+            record_error("warmup", e)
+            state, error = "failed", f"{type(e).__name__}: {e}"
+        with self._lock:
+            self._state, self._error = state, error
+            self._seconds = round(time.perf_counter() - start, 3)
+        event_log.log("warmup", state=state, seconds=self._seconds, stages=self._stages, error=error)
+
+    def _stage(self, name, fn, required):
+        times = []
+        for _ in range(self.iterations):
+            t = time.perf_counter()
+            try:
+                fn()
+            except ImportError as e:
+                if required:
+                    raise
+                with self._lock:
+                    self._stages[name] = f"skipped: {e}"
+                return
+            times.append((time.perf_counter() - t) * 1000.0)
+        with self._lock:
+            # first vs last pass: the gap is what a cold request would have paid
+            self._stages[name] = {"first_ms": round(times[0], 2), "last_ms": round(times[-1], 2)}
+
+    def _plan(self):
+        """(name, fn, required) for each stage, in request order."""
+        from app.model_utils.face import get_face_detector
+        from app.model_utils.preprocess import decode_image, post_transform, preprocess_pipeline
+
+        app, cfg = self.app, self.app.config
+        capture = synthetic_capture()
+        jpeg = cv2.imencode(".jpg", cv2.cvtColor(capture, cv2.COLOR_RGB2BGR))[1].tobytes()
+        order = [s for s in cfg["PREPROCESS_ORDER"] if s != 1]
+        tensor = post_transform(preprocess_pipeline(capture, order=order)).unsqueeze(0)
+
+        def face_mesh():
+            try:
+                with app.face_mesh_pool.session("__warmup__") as mesh:
+                    mesh.process(capture)
+            finally:
+                app.face_mesh_pool.release("__warmup__")
+
+        stages = [
+            ("decode", lambda: decode_image(jpeg), True),
+            ("preprocess", lambda: post_transform(preprocess_pipeline(capture, order=order)), True),
+            ("model_batch_1", lambda: app.engine.run_batch(tensor), True),
+        ]
+        batch_size = cfg["BATCH_MAX_SIZE"] if cfg["BATCHING_ENABLED"] else 1
+        if batch_size > 1:
+            batch = tensor.expand(batch_size, -1, -1, -1).contiguous()
+            stages.append((f"model_batch_{batch_size}", lambda: app.engine.run_batch(batch), True))
+        if 1 in cfg["PREPROCESS_ORDER"]:
+            stages.append(("face_detector", lambda: get_face_detector().detect(capture), False))
+        stages.append(("bg_removal", lambda: app.bg_remover.remove(capture), False))
+        stages.append(("face_mesh", face_mesh, False))
+        return stages
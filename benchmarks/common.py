@@ -0,0 +1,29 @@
+import json
+import sys
+
+import numpy as np
+
+
+def percentiles(values_ms):
+    """Summary of a list of millisecond timings."""
+    arr = np.asarray(values_ms, dtype=np.float64)
+    if arr.size == 0:
+        return {"count": 0}
+    return {
+        "count": int(arr.size),
+        "mean": float(arr.mean()),
+        "p50": float(np.percentile(arr, 50)),
+        "p95": float(np.percentile(arr, 95)),
+        "p99": float(np.percentile(arr, 99)),
+        "max": float(arr.max()),
+    }
+
+
+def write_report(report, path=None):
+    """Write a JSON report to ``path`` (or stdout)."""
+    text = json.dumps(report, indent=2)
+    if path:
+        with open(path, "w") as f:
+            f.write(text + "\n")
+    else:
+        sys.stdout.write(text + "\n")
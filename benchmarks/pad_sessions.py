@@ -0,0 +1,169 @@
+"""Load test: many concurrent PAD sessions progressing independently.
+
+Drives the /process_frame challenge logic (step_session) through a session
+store from a thread pool, one frame per active session per round, using
+synthetic FaceMesh landmarks in place of camera frames. Every simulated user
+performs whatever challenge its own session asks for, so a session only
+completes if its state was never mixed up with another one's.
+
+Sessions run on a simulated clock advancing --frame-interval-ms per frame,
+so time-to-verify reflects the client frame rate rather than this machine.
+
+    python -m benchmarks.pad_sessions --sessions 1000 --threads 32 --backend local
+"""
+import argparse
+import random
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+from app.pad_challenges import LEFT_EYE, NOSE_TIP, RIGHT_EYE, new_session_state, step_session
+from app.session_store import create_session_store
+from benchmarks.common import percentiles, write_report
+
+NUM_LANDMARKS = 478
+FRAME_SHAPE = (480, 640, 3)
+
+
+def synthetic_landmarks(centered=True, eyes_closed=False, nose_x=0.5):
+    """478 points spread over a face box, with controllable eyes and nose."""
+    rng = random.Random(0)
+    x0, y0 = (0.35, 0.35) if centered else (0.05, 0.05)
+    pts = [SimpleNamespace(x=x0 + 0.3 * rng.random(), y=y0 + 0.3 * rng.random(), z=0.0)
+           for _ in range(NUM_LANDMARKS)]
+
+    gap = 0.005 if eyes_closed else 0.03
+    for eye, cx in ((LEFT_EYE, 0.42), (RIGHT_EYE, 0.58)):
+        p1, p2, p3, p4, p5, p6 = eye
+        cy = 0.45
+        pts[p1].x, pts[p1].y = cx - 0.025, cy
+        pts[p4].x, pts[p4].y = cx + 0.025, cy
+        for top, bottom, dx in ((p2, p6, -0.01), (p3, p5, 0.01)):
+            pts[top].x = pts[bottom].x = cx + dx
+            pts[top].y, pts[bottom].y = cy - gap / 2, cy + gap / 2
+    pts[NOSE_TIP].x = nose_x
+    return pts
+
+
+POSES = {
+    "alignment": synthetic_landmarks(),
+    "blink": synthetic_landmarks(eyes_closed=True),
+    "turn_left": synthetic_landmarks(nose_x=0.7),
+    "turn_right": synthetic_landmarks(nose_x=0.3),
+    "idle": synthetic_landmarks(centered=False),
+}
+
+# A blink is open -> closed -> open; users asked to blink cycle through this
+BLINK_CYCLE = ["alignment", "blink", "alignment"]
+
+
+class SimulatedUser:
+    def __init__(self, store, compliance, rng, frame_interval):
+        self.store = store
+        self.frame_interval = frame_interval
+        self.compliance = compliance
+        self.rng = rng
+        self.session_id = uuid.uuid4().hex
+        self.expected = None
+        self.passed = []
+        self.asked = None
+        self.done = False
+        self.failed = None
+        self.frames = 0
+        self.blink_step = 0
+        self.latencies_ms = []
+
+    def start(self):
+        state = new_session_state(now=0.0)
+        self.expected = list(state["challenges"])
+        self.asked = self.expected[0]
+        self.store.set(self.session_id, state)
+
+    def send_frame(self):
+        # A cooperative user acts on the last instruction they were shown
+        pose = self.asked if self.rng.random() < self.compliance else "idle"
+        if pose == "blink":
+            pose = BLINK_CYCLE[self.blink_step % len(BLINK_CYCLE)]
+            self.blink_step += 1
+
+        start = time.perf_counter()
+        state = self.store.get(self.session_id)
+        if state is None:
+            self.failed = "session lost"
+            return
+        now = (self.frames + 1) * self.frame_interval
+        status = step_session(state, POSES[pose], FRAME_SHAPE, now=now)
+        self.store.set(self.session_id, state)
+        self.latencies_ms.append((time.perf_counter() - start) * 1000.0)
+        self.frames += 1
+
+        if status["challenge"] == "failed":
+            self.failed = status["message"]
+        elif status["challenge"] == "done":
+            self.passed.append(self.asked)
+            self.done = True
+        elif status["passed"]:
+            self.passed.append(status["challenge"])
+            self.asked = self.expected[len(self.passed)]
+
+
+def run(num_sessions, threads, backend, compliance, seed, frame_interval_ms=250):
+    store = create_session_store(backend, ttl=300, max_sessions=num_sessions * 2)
+    rng = random.Random(seed)
+    interval = frame_interval_ms / 1000.0
+    users = [SimulatedUser(store, compliance, random.Random(rng.random()), interval)
+             for _ in range(num_sessions)]
+    for user in users:
+        user.start()
+
+    rounds = 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        active = users
+        while active:
+            list(pool.map(lambda u: u.send_frame(), active))
+            active = [u for u in active if not u.done and u.failed is None]
+            rounds += 1
+    elapsed = time.perf_counter() - start
+
+    frames = sum(u.frames for u in users)
+    mixed_up = [u.session_id for u in users if u.done and u.passed != u.expected]
+    return {
+        "backend": backend,
+        "sessions": num_sessions,
+        "threads": threads,
+        "frame_interval_ms": frame_interval_ms,
+        "rounds": rounds,
+        "frames": frames,
+        "completed": sum(u.done for u in users),
+        "failed": sum(u.failed is not None for u in users),
+        "sequence_mismatches": len(mixed_up),
+        "frames_per_sec": frames / elapsed if elapsed else 0.0,
+        "frame_latency_ms": percentiles([t for u in users for t in u.latencies_ms]),
+        "frames_per_session": percentiles([u.frames for u in users]),
+        "time_to_verify_s": percentiles([u.frames * interval for u in users if u.done]),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=500)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--backend", default="memory", choices=["memory", "local"])
+    parser.add_argument("--compliance", type=float, default=0.5,
+                        help="probability a user performs the requested action on a frame")
+    parser.add_argument("--frame-interval-ms", type=float, default=250.0,
+                        help="simulated client frame interval")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="JSON report path (default: stdout)")
+    args = parser.parse_args(argv)
+
+    report = run(args.sessions, args.threads, args.backend, args.compliance, args.seed,
+                 args.frame_interval_ms)
+    write_report(report, args.output)
+    return 0 if report["completed"] == args.sessions and not report["sequence_mismatches"] else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,331 @@
+"""Benchmark: per-stage latency and throughput of the /predict and /process_frame paths.
+
+Times every stage of both request paths separately with perf_counter
+(after warmup), then measures forward throughput per batch size and
+end-to-end throughput (preprocess threads feeding the micro-batching
+engine) per thread count. Reports p50/p95/p99, peak RSS and the run's
+environment as JSON, so results from different commits can be compared
+with --compare.
+
+    python -m benchmarks.request_path --synthetic 32 --bg-backend off -o before.json
+    python -m benchmarks.request_path --images ./faces --compare before.json
+
+Without a checkpoint on disk the model runs with random weights, which
+times the same computation.
+"""
+import argparse
+import contextlib
+import itertools
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+import torch
+
+from app.bulk import iter_paths
+from app.config import Config
+from app.frame_gate import downscale, thumbnail
+from app.inference import BatchInferenceEngine
+from app.load_model import load_model_pt
+from app.model_utils.background import create_bg_remover
+from app.model_utils.export import OptimizedAgeModel
+from app.model_utils.hardware import resolve_bf16
+from app.model_utils.model import AgePredictionCORAL, coral_decode
+from app.model_utils.preprocess import (
+    crop_first, decode_image, post_transform, preprocess_array, preprocess_pipeline,
+)
+from app.pad_challenges import new_session_state, step_session
+from app.timing import StageTimer
+from benchmarks.common import percentiles, write_report
+from benchmarks.pad_sessions import POSES
+
+
+# ------------------------------
+# Inputs
+# ------------------------------
+def synthetic_image(seed, size=(640, 480)):
+    """A JPEG-encoded face-like capture: skin ellipse, eyes and mouth on a
+    noisy gradient background."""
+    rng = np.random.default_rng(seed)
+    w, h = size
+    img = np.linspace(rng.integers(40, 120), rng.integers(130, 220), w, dtype=np.float32)
+    img = np.repeat(np.tile(img, (h, 1))[:, :, None], 3, axis=2)
+    img += rng.normal(0, 8, img.shape)
+    img = np.clip(img, 0, 255).astype(np.uint8)
+
+    cx, cy = w // 2 + int(rng.integers(-40, 40)), h // 2 + int(rng.integers(-30, 30))
+    skin = tuple(int(c) for c in rng.integers((150, 110, 90), (230, 190, 170)))
+    cv2.ellipse(img, (cx, cy), (w // 7, h // 4), 0, 0, 360, skin, -1)
+    for dx in (-w // 18, w // 18):
+        cv2.circle(img, (cx + dx, cy - h // 16), max(3, w // 80), (40, 30, 30), -1)
+    cv2.ellipse(img, (cx, cy + h // 10), (w // 25, h // 60), 0, 0, 360, (90, 40, 50), -1)
+    return cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes()
+
+
+def load_inputs(images, synthetic, limit):
+    if images:
+        items = [data for _, data in iter_paths(images)]
+        return items[:limit] if limit else items
+    return [synthetic_image(i) for i in range(synthetic)]
+
+
+def build_model(args):
+    bf16 = args.optimize and resolve_bf16(args.bf16, args.device)
+    if os.path.exists(args.checkpoint) or args.backend != "eager":
+        model = load_model_pt(args.checkpoint, device=args.device, num_classes=Config.NUM_CLASSES,
+                              backend=args.backend,
+                              artifact_path=Config.MODEL_ARTIFACTS.get(args.backend),
+                              optimize=args.optimize, bf16=bf16)
+        return model, "checkpoint"
+    model = AgePredictionCORAL(num_classes=Config.NUM_CLASSES, pretrained=False).to(args.device).eval()
+    if args.optimize:
+        model = OptimizedAgeModel(model, bf16=bf16).eval()
+    return model, "random"
+
+
+# ------------------------------
+# Per-stage timings
+# ------------------------------
+def time_stages(run, inputs, iterations, warmup):
+    """Call ``run(input, timer)`` repeatedly; return {stage: percentiles(ms)}."""
+    for i in range(warmup):
+        run(inputs[i % len(inputs)], StageTimer())
+
+    samples = {}
+    for i in range(iterations):
+        timer = StageTimer()
+        run(inputs[i % len(inputs)], timer)
+        for name, seconds in timer.stages.items():
+            samples.setdefault(name, []).append(seconds * 1000.0)
+        samples.setdefault("total", []).append(timer.total() * 1000.0)
+    return {name: percentiles(values) for name, values in samples.items()}
+
+
+def predict_stages(model, device, bg_remover, order):
+    def run(data, timer):
+        with timer.stage("decode"):
+            img = decode_image(data)
+        with timer.stage("face_crop"):
+            img, rest = crop_first(img, order)
+        with timer.stage("bg_removal"):
+            img = bg_remover.remove(img)
+        with timer.stage("pipeline"):
+            img = preprocess_pipeline(img, order=rest, augment=False)
+        with timer.stage("to_tensor"):
+            x = post_transform(img).unsqueeze(0)
+        with timer.stage("forward"), torch.no_grad():
+            logits = model(x.to(device))
+        with timer.stage("coral_decode"):
+            coral_decode(logits)
+    return run
+
+
+def face_mesh_or_none():
+    try:
+        from app.face_mesh_pool import default_face_mesh_factory
+        return default_face_mesh_factory()
+    except ImportError:
+        return None
+
+
+def frame_stages(face_mesh, max_side):
+    poses = itertools.cycle(POSES.values())
+
+    def run(data, timer):
+        with timer.stage("decode"):
+            frame = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        with timer.stage("downscale"):
+            frame = downscale(frame, max_side)
+        with timer.stage("motion_gate"):
+            thumbnail(frame)
+        with timer.stage("to_rgb"):
+            rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        if face_mesh is not None:
+            with timer.stage("face_mesh"):
+                face_mesh.process(rgb)
+        with timer.stage("challenge"):
+            step_session(new_session_state(), next(poses), frame.shape)
+    return run
+
+
+# ------------------------------
+# Throughput
+# ------------------------------
+def forward_throughput(model, device, batch_sizes, repeats):
+    results = {}
+    for bs in batch_sizes:
+        x = torch.randn(bs, 3, 224, 224, device=device)
+        with torch.no_grad():
+            for _ in range(2):
+                model(x)
+            timings = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                coral_decode(model(x))
+                timings.append((time.perf_counter() - start) * 1000.0)
+        results[str(bs)] = dict(batch_ms=percentiles(timings),
+                                images_per_sec=bs * 1000.0 / float(np.median(timings)))
+    return results
+
+
+def end_to_end_throughput(model, device, bg_remover, order, inputs, thread_counts, requests,
+                          max_batch_size):
+    results = {}
+    for threads in thread_counts:
+        engine = BatchInferenceEngine(model, device=device, max_batch_size=max_batch_size)
+
+        def one(data):
+            start = time.perf_counter()
+            x = preprocess_array(decode_image(data), order=order, bg_remover=bg_remover)
+            engine.predict(x)
+            return (time.perf_counter() - start) * 1000.0
+
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(one, inputs[:threads]))  # warmup
+            start = time.perf_counter()
+            latencies = list(pool.map(one, (inputs[i % len(inputs)] for i in range(requests))))
+            elapsed = time.perf_counter() - start
+        stats = engine.stats()
+        results[str(threads)] = {
+            "requests_per_sec": requests / elapsed,
+            "latency_ms": percentiles(latencies),
+            "avg_batch_size": stats["avg_batch_size"],
+        }
+    return results
+
+
+# ------------------------------
+# Report
+# ------------------------------
+def peak_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024.0 * 1024.0) if sys.platform == "darwin" else rss / 1024.0
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, baseline, tolerance, min_delta_ms=0.1):
+    """Print p50 changes per stage against ``baseline``; return the regressions
+    (slower by more than ``tolerance`` and by at least ``min_delta_ms``)."""
+    regressions = []
+    for path in ("predict", "process_frame"):
+        for stage, now in report[path].items():
+            before = baseline.get(path, {}).get(stage)
+            if not before or not before.get("p50") or "p50" not in now:
+                continue
+            change = now["p50"] / before["p50"] - 1.0
+            slower = change > tolerance and now["p50"] - before["p50"] >= min_delta_ms
+            flag = "REGRESSION" if slower else ""
+            print(f"{path:>13}.{stage:<13} p50 {before['p50']:9.3f} -> {now['p50']:9.3f} ms "
+                  f"({change:+.1%}) {flag}", file=sys.stderr)
+            if flag:
+                regressions.append(f"{path}.{stage}")
+    return regressions
+
+
+def run(args):
+    torch.manual_seed(0)
+    inputs = load_inputs(args.images, args.synthetic, args.limit)
+    if not inputs:
+        raise SystemExit("No input images")
+
+    model, weights = build_model(args)
+    bg_remover = create_bg_remover(args.bg_backend, max_side=Config.BG_REMOVAL_MAX_SIDE,
+                                   intra_op_threads=Config.BG_REMOVAL_INTRA_OP_THREADS,
+                                   inter_op_threads=Config.BG_REMOVAL_INTER_OP_THREADS)
+    face_mesh = face_mesh_or_none()
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "torch_threads": torch.get_num_threads(),
+            "cpu_count": os.cpu_count(),
+            "device": args.device,
+            "backend": args.backend,
+            "optimize": args.optimize,
+            "bf16": args.bf16,
+            "weights": weights,
+            "bg_backend": args.bg_backend,
+            "order": args.order,
+            "inputs": "synthetic" if not args.images else "images",
+            "num_inputs": len(inputs),
+            "iterations": args.iterations,
+            "warmup": args.warmup,
+            "face_mesh": face_mesh is not None,
+        },
+        "predict": time_stages(predict_stages(model, args.device, bg_remover, args.order),
+                               inputs, args.iterations, args.warmup),
+        "process_frame": time_stages(frame_stages(face_mesh, Config.PAD_MAX_FRAME_SIDE),
+                                     inputs, args.iterations, args.warmup),
+        "forward_throughput": forward_throughput(model, args.device, args.batch_sizes, args.repeats),
+        "end_to_end_throughput": end_to_end_throughput(
+            model, args.device, bg_remover, args.order, inputs, args.threads, args.requests,
+            max(args.batch_sizes)),
+    }
+    report["peak_rss_mb"] = peak_rss_mb()
+    return report
+
+
+def _int_list(value):
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--images", nargs="+", help="image files, directories or .zip archives")
+    source.add_argument("--synthetic", type=int, default=16, help="number of synthetic captures")
+    parser.add_argument("--limit", type=int, default=64, help="max images to load (0 = all)")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--batch-sizes", type=_int_list, default=[1, 2, 4, 8, 16])
+    parser.add_argument("--repeats", type=int, default=10, help="forward passes per batch size")
+    parser.add_argument("--threads", type=_int_list, default=[1, 2, 4])
+    parser.add_argument("--requests", type=int, default=64, help="end-to-end requests per thread count")
+    parser.add_argument("--order", type=_int_list, default=Config.PREPROCESS_ORDER)
+    parser.add_argument("--checkpoint", default=Config.MODEL_PATH)
+    parser.add_argument("--backend", default=Config.MODEL_BACKEND)
+    parser.add_argument("--device", default=Config.DEVICE)
+    parser.add_argument("--optimize", action="store_true", default=Config.MODEL_OPTIMIZE,
+                        help="serve the fused-CBAM channels_last graph (MODEL_OPTIMIZE)")
+    parser.add_argument("--bf16", default=Config.MODEL_BF16, choices=["auto", "on", "off"])
+    parser.add_argument("--bg-backend", default=Config.BG_REMOVAL_BACKEND,
+                        help='rembg model name, "mediapipe" or "off"')
+    parser.add_argument("--output", "-o", help="JSON report path (default: stdout)")
+    parser.add_argument("--compare", help="baseline JSON report to compare p50s against")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="relative p50 increase counted as a regression")
+    parser.add_argument("--min-delta-ms", type=float, default=0.1,
+                        help="ignore p50 increases smaller than this")
+    args = parser.parse_args(argv)
+
+    # Keep library output (warnings, prints) off stdout so the report stays valid JSON
+    with contextlib.redirect_stdout(sys.stderr):
+        report = run(args)
+    write_report(report, args.output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.tolerance, args.min_delta_ms)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
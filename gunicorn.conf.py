@@ -0,0 +1,66 @@
+# Gunicorn settings for serving Aegis: `gunicorn -c gunicorn.conf.py run:app`
+#
+# With preload_app the model is loaded once in the master; forked workers share
+# its weight pages copy-on-write (inference never writes them, and gc.freeze
+# below keeps the GC off the objects), so there is one copy without /dev/shm.
+# Each worker then pins torch/OpenCV to its slice of the cores so N workers
+# don't oversubscribe the machine.
+import gc
+import os
+
+
+def _cpu_count():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+CPUS = _cpu_count()
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8080')}"
+workers = int(os.environ.get("GUNICORN_WORKERS", max(1, CPUS // 2)))
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", 4))   # lets /predict requests micro-batch
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 120))
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1") == "1"
+
+# create_app reads this to load in "master" mode (single-threaded torch, shared weights)
+os.environ["AEGIS_PRELOAD"] = "1" if preload_app else "0"
+# ... and this to refuse async jobs whose polls could land on another worker
+os.environ["AEGIS_WORKERS"] = str(workers)
+
+TORCH_THREADS_PER_WORKER = int(os.environ.get("AEGIS_TORCH_THREADS", max(1, CPUS // workers)))
+# The onnxruntime background-removal session (built lazily in each worker)
+# gets the same slice; its default of 0 would mean every core per worker.
+# Set here, before the app (and Config) is imported; an explicit value wins.
+os.environ.setdefault("AEGIS_BG_REMOVAL_INTRA_OP_THREADS", str(TORCH_THREADS_PER_WORKER))
+
+
+def when_ready(server):
+    # Move everything allocated while loading out of the GC's reach so that
+    # collections in the workers don't touch (and copy) those pages.
+    gc.collect()
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    import cv2
+    import torch
+
+    torch.set_num_threads(TORCH_THREADS_PER_WORKER)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass  # already set in this process
+    cv2.setNumThreads(TORCH_THREADS_PER_WORKER)
+
+    if preload_app:
+        # The master never warms up (no threads before fork); each worker
+        # warms its own oneDNN primitives and sessions, gated by /readyz
+        server.app.wsgi().warmup.start()
+
+    server.log.info(
+        "Worker %s: %d torch threads, %s bg-removal threads (%d cpus / %d workers)",
+        worker.pid, TORCH_THREADS_PER_WORKER, os.environ["AEGIS_BG_REMOVAL_INTRA_OP_THREADS"], CPUS, workers,
+    )
@@ -0,0 +1,70 @@
+import argparse
+import json
+import sys
+import time
+import warnings
+
+# Ignore all warnings
+warnings.filterwarnings("ignore")
+
+from app.config import Config
+from app.load_model import load_model_pt
+from app.inference import BatchInferenceEngine
+from app.bulk import iter_paths, predict_stream
+from app.model_utils.background import create_bg_remover
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Bulk age estimation over image files, directories or zip archives."
+    )
+    parser.add_argument("inputs", nargs="+", help="image files, directories or .zip archives")
+    parser.add_argument("--batch-size", type=int, default=Config.BULK_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=Config.BULK_PREPROCESS_WORKERS,
+                        help="preprocessing threads")
+    parser.add_argument("--output", "-o", help="NDJSON output file (default: stdout)")
+    parser.add_argument("--checkpoint", default=Config.MODEL_PATH)
+    parser.add_argument("--device", default=Config.DEVICE)
+    parser.add_argument("--bg-backend", default=Config.BG_REMOVAL_BACKEND,
+                        help='rembg model name, "mediapipe" or "off"')
+    args = parser.parse_args(argv)
+
+    model = load_model_pt(args.checkpoint, device=args.device, num_classes=Config.NUM_CLASSES)
+    engine = BatchInferenceEngine(model, device=args.device)
+    bg_remover = create_bg_remover(
+        args.bg_backend,
+        max_side=Config.BG_REMOVAL_MAX_SIDE,
+        intra_op_threads=Config.BG_REMOVAL_INTRA_OP_THREADS,
+        inter_op_threads=Config.BG_REMOVAL_INTER_OP_THREADS,
+    )
+
+    out = open(args.output, "w") if args.output else sys.stdout
+    count = errors = 0
+    start = time.perf_counter()
+    try:
+        for result in predict_stream(
+            iter_paths(args.inputs),
+            engine.run_batch,
+            batch_size=max(1, args.batch_size),
+            workers=args.workers,
+            order=Config.PREPROCESS_ORDER,
+            bg_remover=bg_remover,
+        ):
+            out.write(json.dumps(result) + "\n")
+            count += 1
+            errors += "error" in result
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    elapsed = time.perf_counter() - start
+    print(
+        f"Processed {count} images ({errors} errors) in {elapsed:.2f}s "
+        f"-> {count / elapsed if elapsed else 0.0:.2f} images/sec",
+        file=sys.stderr,
+    )
+    return 0 if errors == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,38 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from app.model_utils.preprocess import BatchPreprocessor, post_transform, preprocess_batch, preprocess_pipeline
+
+# [3, 4, 6, 9] takes the fused 4 + 6 path; the others run the steps one by one
+ORDERS = [[3, 4, 6, 9], [3, 6, 9], [3, 4, 9], [3, 5, 7, 9]]
+
+
+def random_images(channels, seed=0):
+    """Mixed-size uint8 images, as decoded (RGB) or after background removal (RGBA)."""
+    rng = np.random.default_rng(seed)
+    return [rng.integers(0, 256, (h, w, channels), dtype=np.uint8) for h, w in ((300, 260), (224, 224), (180, 400))]
+
+
+def reference(images, order):
+    return np.stack([post_transform(preprocess_pipeline(img, order=order)).numpy() for img in images])
+
+
+@pytest.mark.parametrize("channels", [3, 4], ids=["rgb", "rgba"])
+@pytest.mark.parametrize("order", ORDERS, ids=lambda order: "-".join(map(str, order)))
+def test_batch_matches_single_image_pipeline(order, channels):
+    images = random_images(channels)
+    out = BatchPreprocessor(order)(images)
+    assert out.shape == (len(images), 3, 224, 224) and out.dtype == np.float32
+    np.testing.assert_array_equal(out, reference(images, order))
+
+
+def test_batch_on_pool_and_reused_buffers_match():
+    images = random_images(4, seed=1)
+    batch = BatchPreprocessor([3, 4, 6, 9])
+    with ThreadPoolExecutor(2) as pool:
+        np.testing.assert_array_equal(batch(images, pool=pool), reference(images, [3, 4, 6, 9]))
+    # A smaller batch reuses the larger buffers
+    np.testing.assert_array_equal(batch(images[1:2]), reference(images[1:2], [3, 4, 6, 9]))
+    np.testing.assert_array_equal(preprocess_batch(images[:2], [3, 4, 6, 9]), reference(images[:2], [3, 4, 6, 9]))
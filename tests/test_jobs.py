@@ -0,0 +1,52 @@
+import threading
+import time
+
+import pytest
+
+from app.inference import QueueFullError
+from app.jobs import JobManager
+from app.session_store import LocalKV, RedisSessionStore
+
+
+class StrictRedis(LocalKV):
+    """LocalKV that, like redis-py, only accepts an int (or timedelta) ``ex``."""
+
+    def set(self, name, value, ex=None):
+        if ex is not None and not isinstance(ex, int):
+            raise TypeError("ex must be datetime.timedelta or int")
+        super().set(name, value, ex=ex)
+
+
+def wait_for(jobs, job_id, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = jobs.get(job_id)
+        if job["status"] in ("done", "failed"):
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} did not finish: {jobs.get(job_id)}")
+
+
+def test_jobs_on_redis_store_with_float_ttl():
+    store = RedisSessionStore(StrictRedis(), ttl=600.0, prefix="aegis:job:")
+    jobs = JobManager(workers=1, store=store)
+
+    job_id = jobs.submit(lambda: {"predicted_age": 31})
+    job = wait_for(jobs, job_id)
+    assert job["status"] == "done"
+    assert job["result"] == {"predicted_age": 31}
+
+
+def test_submit_rejects_beyond_max_queued():
+    release = threading.Event()
+    jobs = JobManager(workers=1, max_queued=2)
+    first = jobs.submit(release.wait)
+    while jobs.get(first)["status"] != "running":
+        time.sleep(0.01)
+    queued = [jobs.submit(lambda: None) for _ in range(2)]
+    with pytest.raises(QueueFullError):
+        jobs.submit(lambda: None)
+    assert jobs.stats()["rejected"] == 1
+    release.set()
+    for job_id in [first] + queued:
+        assert wait_for(jobs, job_id)["status"] == "done"
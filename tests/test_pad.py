@@ -0,0 +1,71 @@
+import types
+
+import cv2
+import pytest
+from flask import Flask
+
+from app.face_mesh_pool import FaceMeshPool
+from app.frame_gate import MotionGate
+from app.jobs import PriorityGate
+from app.pad_challenges import LEFT_EYE, RIGHT_EYE, new_session_state
+from app.routes.pad_routes import handle_frame
+from app.session_store import InMemorySessionStore
+from app.warmup import synthetic_capture
+
+OPEN_EYE, CLOSED_EYE = 0.04, 0.005  # lid gap for an eye 0.1 wide: EAR 0.4 vs 0.05
+
+
+def face_landmarks(lid_gap):
+    """478 centred FaceMesh-like points with both eyes opened by ``lid_gap``."""
+    points = [types.SimpleNamespace(x=0.5, y=0.5, z=0.0) for _ in range(478)]
+    points[0].x, points[0].y, points[-1].x, points[-1].y = 0.3, 0.3, 0.7, 0.7
+    for eye, cx in ((LEFT_EYE, 0.4), (RIGHT_EYE, 0.6)):
+        p1, p2, p3, p4, p5, p6 = eye
+        points[p1] = types.SimpleNamespace(x=cx - 0.05, y=0.45, z=0.0)
+        points[p4] = types.SimpleNamespace(x=cx + 0.05, y=0.45, z=0.0)
+        for top, bottom, x in ((p2, p6, cx - 0.02), (p3, p5, cx + 0.02)):
+            points[top] = types.SimpleNamespace(x=x, y=0.45 - lid_gap / 2, z=0.0)
+            points[bottom] = types.SimpleNamespace(x=x, y=0.45 + lid_gap / 2, z=0.0)
+    return points
+
+
+class ScriptedFaceMesh:
+    """Returns the next scripted landmark list for every processed frame."""
+
+    def __init__(self, script):
+        self.script = iter(script)
+
+    def process(self, rgb):
+        face = types.SimpleNamespace(landmark=next(self.script))
+        return types.SimpleNamespace(multi_face_landmarks=[face])
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def pad_app():
+    app = Flask(__name__)
+    app.config["PAD_MAX_FRAME_SIDE"] = 480
+    app.pad_sessions = InMemorySessionStore()
+    app.pad_frame_gate = MotionGate(threshold=1.0)
+    app.priority_gate = PriorityGate()
+    return app
+
+
+def test_blink_passes_through_motion_gate(pad_app):
+    # A still user blinking: every frame has the same pixels, only the landmarks move
+    script = [face_landmarks(gap) for gap in (OPEN_EYE, OPEN_EYE, CLOSED_EYE, OPEN_EYE)]
+    pad_app.face_mesh_pool = FaceMeshPool(factory=lambda: ScriptedFaceMesh(script))
+    frame = cv2.imencode(".jpg", synthetic_capture())[1].tobytes()
+
+    state = new_session_state()
+    state["challenges"] = ["blink", "alignment", "turn_left", "turn_right"]
+    pad_app.pad_sessions.set("s1", state)
+
+    with pad_app.app_context():
+        statuses = [handle_frame("s1", frame) for _ in script]
+
+    assert not any(s.get("skipped") for s in statuses)
+    assert statuses[-1]["passed"], statuses
+    assert pad_app.pad_sessions.get("s1")["index"] == 1
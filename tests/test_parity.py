@@ -0,0 +1,86 @@
+import pytest
+import torch
+
+from app.model_utils.export import OptimizedAgeModel, export_onnx, export_torchscript, fold_for_inference
+from app.model_utils.model import CBAM, AgePredictionCORAL
+from app.model_utils.parity import compare_models, random_inputs
+
+# Random weights, so no checkpoint is needed; 128 px keeps a ResNet-50 pass cheap.
+# Random-weight logits can be tiny, so tolerances are relative to their scale.
+INPUT_SIZE = 128
+FP32_RTOL = 1e-4
+BF16_RTOL = 5e-2  # bf16 keeps ~3 significant digits through ~50 layers
+
+
+@pytest.fixture(scope="module")
+def model():
+    torch.manual_seed(0)
+    model = AgePredictionCORAL(num_classes=45, pretrained=False)
+    # Non-trivial running stats, or folding BN would be a no-op
+    for module in model.modules():
+        if isinstance(module, (torch.nn.BatchNorm1d, torch.nn.BatchNorm2d)):
+            module.running_mean.uniform_(-0.1, 0.1)
+            module.running_var.uniform_(0.5, 1.5)
+            module.weight.data.uniform_(0.5, 1.5)
+            module.bias.data.uniform_(-0.1, 0.1)
+    return model.eval()
+
+
+@pytest.fixture(scope="module")
+def inputs():
+    return random_inputs(4, size=INPUT_SIZE)
+
+
+@pytest.fixture(scope="module")
+def logit_scale(model, inputs):
+    with torch.no_grad():
+        return model(inputs).abs().max().item()
+
+
+def test_fold_for_inference_matches_eager(model, inputs, logit_scale):
+    report = compare_models(model, fold_for_inference(model), inputs, atol=FP32_RTOL * logit_scale)
+    assert report["passed"], report
+    assert report["age_agreement"] == 1.0
+
+
+def test_torchscript_export_matches_eager(model, inputs, logit_scale, tmp_path):
+    path = export_torchscript(fold_for_inference(model), str(tmp_path / "model.ts.pt"), input_size=INPUT_SIZE)
+    report = compare_models(model, torch.jit.load(path), inputs, atol=FP32_RTOL * logit_scale)
+    assert report["passed"], report
+
+
+def test_onnx_export_matches_eager(model, inputs, logit_scale, tmp_path):
+    pytest.importorskip("onnx")
+    pytest.importorskip("onnxruntime")
+    from app.load_model import OnnxAgeModel
+
+    path = export_onnx(fold_for_inference(model), str(tmp_path / "model.onnx"), input_size=INPUT_SIZE)
+    report = compare_models(model, OnnxAgeModel(path), inputs, atol=FP32_RTOL * logit_scale)
+    assert report["passed"], report
+
+
+@pytest.mark.parametrize("channels_last", [False, True])
+def test_fused_cbam_matches_reference(channels_last):
+    torch.manual_seed(0)
+    reference = CBAM(64).eval()
+    fused = CBAM(64, fused=True).eval()
+    fused.load_state_dict(reference.state_dict())
+    x = torch.randn(2, 64, 28, 28)
+    if channels_last:
+        x = x.contiguous(memory_format=torch.channels_last)
+    with torch.no_grad():
+        torch.testing.assert_close(fused(x), reference(x), rtol=1e-5, atol=1e-6)
+
+
+def test_optimized_model_matches_eager(model, inputs, logit_scale):
+    report = compare_models(model, OptimizedAgeModel(model).eval(), inputs, atol=FP32_RTOL * logit_scale)
+    assert report["passed"], report
+    assert report["age_agreement"] == 1.0
+
+
+def test_optimized_bf16_model_within_tolerance(model, inputs, logit_scale):
+    optimized = OptimizedAgeModel(model, bf16=True).eval()
+    with torch.no_grad():
+        assert optimized(inputs).dtype == torch.float32
+    report = compare_models(model, optimized, inputs, atol=BF16_RTOL * logit_scale)
+    assert report["passed"], report